@@ -6,5 +6,7 @@ WORKING_DIR=$(pwd)
 
 HT_FILE_PATH=$WORKING_DIR'/parsing/HT_Parser.py'
 CSV_DIR=$WORKING_DIR'/csv_files/british_csv.csv'
+PATH_LIST=$WORKING_DIR'/ht_path_lists/british_paths.txt'
 
-python3 $HT_FILE_PATH -csv $CSV_DIR -o $OUTPUT_DIR -x $INPUT_DIR  -lang 'english'
\ No newline at end of file
+# any further arguments (e.g. -incremental) are passed on to the parser
+python3 $HT_FILE_PATH -csv $CSV_DIR -o $OUTPUT_DIR -x $INPUT_DIR  -lang 'english' -paths $PATH_LIST "${@:3}"
\ No newline at end of file
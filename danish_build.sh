@@ -9,8 +9,23 @@ HT_FILE_PATH=$WORKING_DIR'/parsing/HT_Parser.py'
 XML_PARSER_PATH=$WORKING_DIR'/parsing/Danish_XML_Parser.py'
 
 HT_CSV_PATH=$WORKING_DIR'/csv_files/danish_csv.csv'
+HT_PATH_LIST=$WORKING_DIR'/ht_path_lists/danish_paths.txt'
 XML_CSV_PATH=$WORKING_DIR'/csv_files/danish_publication_dates.csv'
 
-python3 $HT_FILE_PATH -csv $HT_CSV_PATH -o $OUTPUT_DIR -x $HT_INPUT_DIR  -lang 'danish'
+# any further arguments (e.g. -incremental) are passed on to the HathiTrust parser, and the ones
+# the TEI parser also takes (-incremental, -binary, -workers, -stem_cache) to it as well
+EXTRA_ARGS=("${@:4}")
+XML_ARGS=()
+for ((i = 0; i < ${#EXTRA_ARGS[@]}; i++)); do
+    case ${EXTRA_ARGS[$i]} in
+        -incremental|-binary)
+            XML_ARGS+=("${EXTRA_ARGS[$i]}") ;;
+        -workers|-stem_cache)
+            XML_ARGS+=("${EXTRA_ARGS[$i]}" "${EXTRA_ARGS[$((i + 1))]}")
+            i=$((i + 1)) ;;
+    esac
+done
 
-python3 $XML_PARSER_PATH -i $XML_INPUT_DIR -o $OUTPUT_DIR -csv $XML_CSV_PATH
\ No newline at end of file
+python3 $HT_FILE_PATH -csv $HT_CSV_PATH -o $OUTPUT_DIR -x $HT_INPUT_DIR  -lang 'danish' -paths $HT_PATH_LIST "${EXTRA_ARGS[@]}"
+
+python3 $XML_PARSER_PATH -i $XML_INPUT_DIR -o $OUTPUT_DIR -csv $XML_CSV_PATH "${XML_ARGS[@]}"
\ No newline at end of file
@@ -1,6 +1,6 @@
-import os, argparse, json, csv, tqdm
+import os, argparse, csv, tqdm
 from afinn import Afinn
-import common
+import common, corpus_index, doc_reader
 
 
 #                                       *** SentAnalysis.py ***
@@ -34,28 +34,30 @@ def sort_sent_dict(year_list, key_list, sent_results):
 # build dict needed to calculate average sentiment across corpus, per N words
 def populate_overall_sentiment(directory, overall_list, year_list, afinn):
     overall_sent = common.build_dict_of_lists(year_list, overall_list)
-    for subdir, dirs, files in os.walk(directory):
+    for subdir, dirs, files in corpus_index.walk(directory, yrange_min, yrange_max):
         print("Calculating sentiment across entire corpus.")
         for jsondoc in tqdm.tqdm(files):
             if jsondoc[0] != ".":
-                with open(directory + "/" + jsondoc, 'r', encoding='utf8') as inpt:
-                    sentiment = 0
-                    jsondata = json.load(inpt)
-                    text = jsondata["Filtered Text"]
-                    year = int(jsondata["Year Published"])
-                    # check to make sure it's within range specified by user
-                    if yrange_min <= year < yrange_max:
-                        # determine which period it falls within
-                        target = common.determine_year(year, year_list)
-                        for i in range(len(text)):
-                            sentiment += afinn.score(text[i])
-                            # even though overall_list only has one keyword, this looks
-                            # better than just hard-coding "all" within the method
-                        truncated_sentiment = float(sentiment/len(text))
-                        for keyword in overall_list:
-                            # append entry as tuple rather than just sentiment score
-                            # so I can use sent_calcs to get average
-                            overall_sent[target][keyword].append((jsondoc, truncated_sentiment))
+                sentiment = 0
+                jsondata = doc_reader.read_document(directory + "/" + jsondoc, ["Filtered Text"], yrange_min, yrange_max)
+                if jsondata is None:
+                    # outside the year range, its text was never decoded
+                    continue
+                text = jsondata["Filtered Text"]
+                year = int(jsondata["Year Published"])
+                # check to make sure it's within range specified by user
+                if yrange_min <= year < yrange_max:
+                    # determine which period it falls within
+                    target = common.determine_year(year, year_list)
+                    for i in range(len(text)):
+                        sentiment += afinn.score(text[i])
+                        # even though overall_list only has one keyword, this looks
+                        # better than just hard-coding "all" within the method
+                    truncated_sentiment = float(sentiment/len(text))
+                    for keyword in overall_list:
+                        # append entry as tuple rather than just sentiment score
+                        # so I can use sent_calcs to get average
+                        overall_sent[target][keyword].append((jsondoc, truncated_sentiment))
     return overall_sent
 
 
@@ -68,11 +70,10 @@ def determine_text_length(directory):
             for folders, subfolders, files in os.walk(dirs + "/" + subdir):
                 for jsondoc in files:
                     if jsondoc[0] != ".":
-                        with open(dirs + "/" + subdir + "/" + jsondoc, 'r', encoding='utf8') as inpt:
-                            jsondata = json.load(inpt)
-                            text = jsondata["Words"]
-                            length = len(text)
-                            return length
+                        jsondata = doc_reader.read_document(dirs + "/" + subdir + "/" + jsondoc, ["Words"])
+                        text = jsondata["Words"]
+                        length = len(text)
+                        return length
 
 
 # fill sent dict with sent results for each json doc w/r/t AFINN dict
@@ -81,83 +82,44 @@ def populate_sent_dict(directory, key_list, year_list, afinn):
     for dirs, subdirs, files in os.walk(directory):
         # 'subdir' corresponds to a keyword
         for subdir in subdirs:
-            for folders, subfolders, file in os.walk(dirs + "/" + subdir):
+            for folders, subfolders, file in corpus_index.walk(dirs + "/" + subdir, yrange_min, yrange_max):
                 for jsondoc in file:
                     if jsondoc[0] != ".":
-                        with open(dirs + "/" + subdir + "/" + jsondoc, 'r', encoding='utf8') as inpt:
-                            sentiment = 0
-                            jsondata = json.load(inpt)
-                            text = jsondata["Text"]
-                            year = int(jsondata["Year Published"])
-                            # check to make sure it's within range specified by user
-                            if yrange_min <= year < yrange_max:
-                                target = common.determine_year(year, year_list)
-                                sentiment += afinn.score(text)
-                                sent_dict[target][subdir].append((jsondoc, sentiment))
+                        sentiment = 0
+                        jsondata = doc_reader.read_document(dirs + "/" + subdir + "/" + jsondoc, ["Text"],
+                                                            yrange_min, yrange_max)
+                        if jsondata is None:
+                            # outside the year range, its text was never decoded
+                            continue
+                        text = jsondata["Text"]
+                        year = int(jsondata["Year Published"])
+                        # check to make sure it's within range specified by user
+                        if yrange_min <= year < yrange_max:
+                            target = common.determine_year(year, year_list)
+                            sentiment += afinn.score(text)
+                            sent_dict[target][subdir].append((jsondoc, sentiment))
     sent_dict_sorted = sort_sent_dict(year_list, key_list, sent_dict)
     return sent_dict_sorted
 
 
-# sometimes a period has no json documents associated with it. it makes the graph look
-# bad and throws a ValueError, so this method makes that period's score equal to the
-# period directly before it.
-def handle_empty_entry(year_list, i, keyword, sent_result):
-    # no files for this period
-    prev_year = year_list[i - 1]
-    try:
-        previous = sent_result[prev_year][keyword]
-    except KeyError:
-        # case when the first period in the list of dates
-        # has no files associated with it.
-        previous = 0
-    return previous
-
-
-# builds dicts for avg, max, and min sentiment scores. type of
-# score that gets calculated is inputted as the 'type' argument.
+# builds tables of avg, max, min or total sentiment scores. type of score that gets
+# calculated is inputted as the 'type' argument. sometimes a period has no json documents
+# associated with it. it makes the graph look bad and throws a ValueError, so avg, max and
+# min scores for that period are set equal to the period directly before it.
 def sent_calcs(year_list, key_list, sent_results, calc_type):
-    sent_result = common.build_dict_of_nums(year_list, key_list)
     print("Calculating average, max, and min sentiment scores.")
-    for i in tqdm.tqdm(range(len(year_list))):
-        for keyword in key_list:
-            length = len(sent_results[year_list[i]][keyword])
-            if calc_type == "max":
-                try:
-                    maximum = sent_results[year_list[i]][keyword][length - 1][1]
-                    sent_result[year_list[i]][keyword] = maximum
-                except (ValueError, IndexError) as e:
-                    # no files for this period
-                    sent_result[year_list[i]][keyword] = handle_empty_entry(year_list, i, keyword, sent_result)
-            if calc_type == "min":
-                try:
-                    minimum = sent_results[year_list[i]][keyword][0][1]
-                    sent_result[year_list[i]][keyword] = minimum
-                except (ValueError, IndexError) as e:
-                    # no files for this period
-                    sent_result[year_list[i]][keyword] = handle_empty_entry(year_list, i, keyword, sent_result)
-            if calc_type == "avg":
-                totals = []
-                for j in range(length):
-                    totals.append(sent_results[year_list[i]][keyword][j][1])
-                total = sum(totals)
-                # make sure there are files associated with this period
-                if length > 0 or total > 0:
-                    try:
-                        average = round((total / length), 4)
-                        sent_result[year_list[i]][keyword] = average
-                    except ZeroDivisionError:
-                        sent_result[year_list[i]][keyword] = 0
-                else:
-                    # no files for this period / keyword pair, use previous period's score
-                    sent_result[year_list[i]][keyword] = handle_empty_entry(year_list, i, keyword, sent_result)
-            # kept total in here just in case we figure out some way of normalizing the results
-            if calc_type == "total":
-                totals = []
-                for j in range(length):
-                    totals.append(sent_results[year_list[i]][keyword][j][1])
-                total = sum(totals)
-                sent_result[year_list[i]][keyword] = total
-    return sent_result
+    scores = common.list_scores(year_list, key_list, sent_results)
+    if calc_type == "avg":
+        avg_var = common.average_and_variance(year_list, key_list, scores)
+        sent_result, counts = avg_var[0].round(4), avg_var[2]
+    elif calc_type == "min" or calc_type == "max":
+        min_and_max = common.minimum_and_maximum(year_list, key_list, scores)
+        sent_result = min_and_max[0] if calc_type == "min" else min_and_max[1]
+        counts = min_and_max[2]
+    else:
+        # kept total in here just in case we figure out some way of normalizing the results
+        return common.sample_totals(year_list, key_list, scores)[1]
+    return sent_result.fill_forward(counts.values == 0)
 
 
 def main():
@@ -218,17 +180,17 @@ def main():
             txt_out.write("Period: {0} - {1}".format(str(year_list[i]), str(year_list[i+1])) + "\n")
             for keyword in overall_list:
                 txt_out.write("Average sentiment score across the corpus for this period: {0}"
-                              .format(str(overall_avg[year_list[i]][keyword])) + "\n")
+                              .format(str(overall_avg.get(year_list[i], keyword))) + "\n")
             for keyword in key_list:
                 txt_out.write("{0}:".format(str(keyword)) + "\n")
                 txt_out.write("Number of documents for this period/keyword pair: {0}"
                               .format(str(len(sent_results[year_list[i]][keyword]))) + "\n")
                 txt_out.write("Avg Sentiment score for {0} in this period: {1}"
-                              .format(keyword, str(sent_avg[year_list[i]][keyword]) + "\n"))
+                              .format(keyword, str(sent_avg.get(year_list[i], keyword)) + "\n"))
                 txt_out.write("Max Sentiment score for {0} in this period: {1}"
-                              .format(keyword, str(sent_max[year_list[i]][keyword]) + "\n"))
+                              .format(keyword, str(sent_max.get(year_list[i], keyword)) + "\n"))
                 txt_out.write("Min Sentiment score for {0} in this period: {1}"
-                              .format(keyword, str(sent_min[year_list[i]][keyword]) + "\n"))
+                              .format(keyword, str(sent_min.get(year_list[i], keyword)) + "\n"))
                 try:
                     common.list_max_docs(txt_out, year_list[i], keyword, sent_results, args.num, "sentiment")
                     common.list_min_docs(txt_out, year_list[i], keyword, sent_results, args.num, "sentiment")
@@ -252,14 +214,14 @@ def main():
         csvwriter.writerow(['word', 'sent avg', 'sent max', 'sent min', 'sent total', year_string, num_docs_string])
         for keyword in key_list:
             # populate each line with each sentiment calculation
-            csvwriter.writerow([keyword, common.list_to_string(common.build_graph_list(keyword, year_list, sent_avg)),
-                                common.list_to_string(common.build_graph_list(keyword, year_list, sent_max)),
-                                common.list_to_string(common.build_graph_list(keyword, year_list, sent_min)),
-                                common.list_to_string(common.build_graph_list(keyword, year_list, sent_total))])
+            csvwriter.writerow([keyword, common.list_to_string(sent_avg.graph_list(keyword)),
+                                common.list_to_string(sent_max.graph_list(keyword)),
+                                common.list_to_string(sent_min.graph_list(keyword)),
+                                common.list_to_string(sent_total.graph_list(keyword))])
         # write average sentiment across corpus in last line of csv file
         for keyword in overall_list:
             csvwriter.writerow([keyword, common.list_to_string(
-                common.build_graph_list(keyword, year_list, overall_avg))])
+                overall_avg.graph_list(keyword))])
 
 
 if __name__ == '__main__':
@@ -1,5 +1,9 @@
 import json, os, shutil, argparse, tqdm
-import common
+import common, corpus_index, doc_reader, inverted_index
+
+
+# keyword directory -> index rows for the snippets written to it
+snippet_rows = {}
 
 
 # iterate through corpus, extract text surrounding occurrences of each
@@ -8,84 +12,131 @@ def parse_json(in_dir, out_dir, keywords, by_sentences):
     # index and sub index for file naming
     index = 0
     sub_index = 0
-    for subdir, dirs, files in os.walk(in_dir):
+    # text_type holds either one field name or a field name and its fallback
+    fields = text_type if isinstance(text_type, list) else [text_type]
+    keyword_positions = index_keyword_positions(in_dir, keywords, by_sentences)
+    for subdir, dirs, files in corpus_index.walk(in_dir, y_min, y_max + 1):
         print("Extracting snippets of text.")
         for jsondoc in tqdm.tqdm(files):
             if jsondoc[0] != ".":
-                with open(in_dir + "/" + jsondoc, 'r', encoding='utf8') as in_file:
-                    index += 1
-                    jsondata = json.load(in_file)
+                index += 1
+                if keyword_positions is not None and \
+                        not any(jsondoc in keyword_positions[keyword] for keyword in keywords):
+                    # the index says no keyword occurs in this document, don't bother reading it
+                    continue
+                jsondata = doc_reader.read_document(in_dir + "/" + jsondoc, fields, y_min, y_max + 1)
+                if jsondata is None:
+                    # outside the year range, its text was never decoded
+                    continue
+                try:
+                    year = int(jsondata["Year Published"])
+                except KeyError:
+                    year = int(jsondata["Date"])
+                if y_min <= year <= y_max:
                     try:
-                        year = int(jsondata["Year Published"])
+                        title, author, text = jsondata["Title"], jsondata["Author"], jsondata[text_type[0]]
                     except KeyError:
-                        year = int(jsondata["Date"])
-                    if y_min <= year <= y_max:
-                        try:
-                            title, author, text = jsondata["Title"], jsondata["Author"], jsondata[text_type[0]]
-                        except KeyError:
-                            title, author, text = jsondata["Title"], jsondata["Author"], jsondata[text_type[1]]
-                        for keyword in keywords:
-                            if not bigrams:
-                                # keep a set for more efficient word lookup,
-                                # and a list to preserve ordering for file naming
-                                word_set = set(keyword.split("/"))
-                                words = keyword.split("/")
-                                for i in range(len(text)):
+                        title, author, text = jsondata["Title"], jsondata["Author"], jsondata[text_type[1]]
+                    for keyword in keywords:
+                        if not bigrams:
+                            # keep a set for more efficient word lookup,
+                            # and a list to preserve ordering for file naming
+                            word_set = set(keyword.split("/"))
+                            words = keyword.split("/")
+                            if keyword_positions is not None:
+                                # only visit the positions the keyword occurs at
+                                hits = keyword_positions[keyword].get(jsondoc, [])
+                            else:
+                                hits = range(len(text))
+                            for i in hits:
+                                if by_sentences:
+                                    for word in text[i].split():
+                                        if word in word_set:
+                                            words_list = []
+                                            sub_index += 1
+                                            snippet = text[(i - int(length/2)):(i + int(length/2))]
+                                            for sentence in snippet:
+                                                words_list.extend(sentence.split())
+                                            sub_text = " ".join(snippet)
+                                            write_to_file(out_dir, words, year, index, sub_index,
+                                                          title, author, sub_text, words_list)
+                                else:
+                                    if text[i] in word_set:
+                                        sub_index += 1
+                                        sub_words = text[(i - int(length/2)):(i + int(length/2))]
+                                        sub_text = " ".join(sub_words)
+                                        write_to_file(out_dir, words, year, index, sub_index,
+                                                      title, author, sub_text, sub_words)
+                        else:
+                            words = []
+                            # build a list of tuples
+                            for i in range(len(keyword)):
+                                words.append("-".join(wd for wd in keyword[i]))
+                            # for each tuple, search the text for occurrences of it
+                            for i in range(len(keyword)):
+                                for j in range(len(text)):
                                     if by_sentences:
-                                        for word in text[i].split():
-                                            if word in word_set:
-                                                words_list = []
-                                                sub_index += 1
-                                                snippet = text[(i - int(length/2)):(i + int(length/2))]
-                                                for sentence in snippet:
-                                                    words_list.extend(sentence.split())
-                                                sub_text = " ".join(snippet)
-                                                write_to_file(out_dir, words, year, index, sub_index,
-                                                              title, author, sub_text, words_list)
+                                        sentence = text[j].split()
+                                        if len(sentence) > 1:
+                                            for k in range(len(sentence) - 1):
+                                                if sentence[k] == keyword[i][0] and sentence[k+1] == keyword[i][1]:
+                                                    words_list = []
+                                                    sub_index += 1
+                                                    snippet = text[(j - int(length/2)):(j + int(length/2))]
+                                                    for sent in snippet:
+                                                        words_list.extend(sent.split())
+                                                    sub_text = " ".join(snippet)
+                                                    write_to_file(out_dir, words, year, index, sub_index,
+                                                                  title, author, sub_text, words_list)
                                     else:
-                                        if text[i] in word_set:
+                                        if text[j] == keyword[i][0] and text[j+1] == keyword[i][1]:
                                             sub_index += 1
-                                            sub_words = text[(i - int(length/2)):(i + int(length/2))]
+                                            sub_words = text[(j - int(length/2)):(j + int(length/2))]
                                             sub_text = " ".join(sub_words)
                                             write_to_file(out_dir, words, year, index, sub_index,
                                                           title, author, sub_text, sub_words)
-                            else:
-                                words = []
-                                # build a list of tuples
-                                for i in range(len(keyword)):
-                                    words.append("-".join(wd for wd in keyword[i]))
-                                # for each tuple, search the text for occurrences of it
-                                for i in range(len(keyword)):
-                                    for j in range(len(text)):
-                                        if by_sentences:
-                                            sentence = text[j].split()
-                                            if len(sentence) > 1:
-                                                for k in range(len(sentence) - 1):
-                                                    if sentence[k] == keyword[i][0] and sentence[k+1] == keyword[i][1]:
-                                                        words_list = []
-                                                        sub_index += 1
-                                                        snippet = text[(j - int(length/2)):(j + int(length/2))]
-                                                        for sent in snippet:
-                                                            words_list.extend(sent.split())
-                                                        sub_text = " ".join(snippet)
-                                                        write_to_file(out_dir, words, year, index, sub_index,
-                                                                      title, author, sub_text, words_list)
-                                        else:
-                                            if text[j] == keyword[i][0] and text[j+1] == keyword[i][1]:
-                                                sub_index += 1
-                                                sub_words = text[(j - int(length/2)):(j + int(length/2))]
-                                                sub_text = " ".join(sub_words)
-                                                write_to_file(out_dir, words, year, index, sub_index,
-                                                              title, author, sub_text, sub_words)
+    # each keyword directory gets its own index, read by SentAnalysis & TopicModeler
+    for keyword_dir, rows in snippet_rows.items():
+        corpus_index.write_rows(out_dir + "/" + keyword_dir, rows)
+
+
+# returns keyword -> {document: sorted positions of any of its words}, from the corpus' inverted
+# index. returns None when snippets are built from sentences or bigrams, or there's no current
+# index for the text field, in which case every document is scanned.
+def index_keyword_positions(in_dir, keywords, by_sentences):
+    if by_sentences or bigrams:
+        return None
+    index = inverted_index.open_index(in_dir, text_type[0])
+    if index is None:
+        return None
+    keyword_positions = {}
+    for keyword in keywords:
+        merged = {}
+        for w in set(keyword.split("/")):
+            for jsondoc, positions in index.positions(w).items():
+                try:
+                    merged[jsondoc].extend(positions)
+                except KeyError:
+                    merged[jsondoc] = list(positions)
+        for jsondoc in merged:
+            merged[jsondoc].sort()
+        keyword_positions[keyword] = merged
+    index.close()
+    return keyword_positions
 
 
 def write_to_file(out_dir, words, year, index, sub_index, title, author, sub_text, sub_words):
     # write extracted text to file
-    with open(out_dir + "/" + "_".join(words) + "/" + str(year) + "_"
-                      + str(index) + "-" + str(sub_index)
-                      + '.json', 'w', encoding='utf-8') as out:
+    name = str(year) + "_" + str(index) + "-" + str(sub_index) + '.json'
+    with open(out_dir + "/" + "_".join(words) + "/" + name, 'w', encoding='utf-8') as out:
         out.write(build_json(title, author, "_".join(words), year, sub_text,
                              sub_words))
+    row = corpus_index.json_row(name, {'Title': title, 'Author': author, 'Year Published': year,
+                                       'Text': sub_text, 'Words': sub_words})
+    try:
+        snippet_rows["_".join(words)].append(row)
+    except KeyError:
+        snippet_rows["_".join(words)] = [row]
 
 
 # json file to hold extracted text. in addition to extracted text, it also contains publication
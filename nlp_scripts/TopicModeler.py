@@ -1,5 +1,5 @@
 import gensim, os, argparse, json, collections, re, nltk, numpy, tqdm
-import common
+import common, corpus_index, doc_reader
 
 
 # build list of keywords
@@ -20,25 +20,28 @@ def init_sent_doc_dict(input_dir, key_list, year_list, stopwords, yrange_min, yr
         # 'subdir' corresponds to each keyword
         print("Building volumes dictionary.")
         for subdir in tqdm.tqdm(subdirs):
-            for folders, subfolders, file in os.walk(dirs + "/" + subdir):
+            for folders, subfolders, file in corpus_index.walk(dirs + "/" + subdir, yrange_min, yrange_max):
                 for jsondoc in file:
                     if jsondoc[0] != ".":
-                        with open(dirs + "/" + subdir + "/" + jsondoc, 'r', encoding='utf8') as inpt:
-                            jsondata = json.load(inpt)
-                            text = jsondata[text_type]
-                            # remove stopwords
-                            for i in range(len(text) - 1, -1, -1):
-                                # Delete empty strings
-                                if text[i] in stopwords or len(text[i]) < 2:
-                                    del text[i]
-                            year = int(jsondata["Year Published"])
-                            # check to make sure it's within range specified by user
-                            if yrange_min <= year < yrange_max:
-                                target = common.determine_year(year, year_list)
-                                try:
-                                    doc_dict[target][subdir].append(text)
-                                except KeyError:
-                                    pass
+                        jsondata = doc_reader.read_document(dirs + "/" + subdir + "/" + jsondoc, [text_type],
+                                                            yrange_min, yrange_max)
+                        if jsondata is None:
+                            # outside the year range, its text was never decoded
+                            continue
+                        text = jsondata[text_type]
+                        # remove stopwords
+                        for i in range(len(text) - 1, -1, -1):
+                            # Delete empty strings
+                            if text[i] in stopwords or len(text[i]) < 2:
+                                del text[i]
+                        year = int(jsondata["Year Published"])
+                        # check to make sure it's within range specified by user
+                        if yrange_min <= year < yrange_max:
+                            target = common.determine_year(year, year_list)
+                            try:
+                                doc_dict[target][subdir].append(text)
+                            except KeyError:
+                                pass
     return doc_dict
 
 
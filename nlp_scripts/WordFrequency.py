@@ -1,5 +1,6 @@
-import math, os, nltk, argparse, json, tqdm
-import common
+import math, nltk, argparse, json, tqdm
+from multiprocessing import Pool
+import common, corpus_index, doc_reader, inverted_index
 
 
 #                           *** WordFrequency.py ***
@@ -18,150 +19,212 @@ import common
 #
 
 
-# build dict used to keep track of how many books user has
-# inputted for a given decade, used for calculating idf
-def build_years_tally(directory, year_list, yrange_min, yrange_max):
-    years_tally = {}
-    for y in year_list:
-        try:
-            years_tally[y] = 0
-        except KeyError:
-            pass
-    for subdir, dirs, files in os.walk(directory):
-        print("Counting number of volumes per period.")
-        for jsondoc in tqdm.tqdm(files):
-            if jsondoc[0] != ".":
-                with open(directory + "/" + jsondoc, 'r', encoding='utf-8') as in_file:
-                    jsondata = json.load(in_file)
-                    try:
-                        year = int(jsondata["Year Published"])
-                    except KeyError:
-                        year = int(jsondata["Date"])
-                    # check to make sure it's within range specified by user
-                    if yrange_min <= year < yrange_max:
-                        target = common.determine_year(year, year_list)
-                        try:
-                            years_tally[target] += 1
-                        except KeyError:
-                            pass
-    return years_tally
+# per-period accumulators, filled in by a single pass over the corpus (see scan_corpus). every
+# statistic this script reports is derived from these once the pass is done:
+#   tally           - number of volumes per period
+#   doc_freq        - number of volumes per period containing each keyword (for idf)
+#   tf              - (document, tf score) pairs for each period / keyword (for tf-idf)
+#   word_counts     - keyword occurrences per period, in total and for each word of a keyword
+#   frequency_list  - keyword occurrences in each volume (for mean & variance)
+#   word_totals     - total words per period (for keyword percentages)
+#   fdists          - merged frequency distribution per period (for top N words)
+#   text_lengths    - total text length per period (for top N words)
+# the counts are kept in common.PeriodTable arrays, the per-document lists in dicts of lists.
+def init_stats(year_list, keywords):
+    stats = {}
+    stats['tally'] = common.PeriodTable(year_list)
+    stats['doc_freq'] = common.PeriodTable(year_list, keywords)
+    stats['tf'] = common.build_dict_of_lists(year_list, keywords)
+    stats['word_counts'] = common.PeriodTable(year_list, keywords, sub_keys=True)
+    stats['frequency_list'] = common.build_dict_of_lists(year_list, keywords)
+    stats['word_totals'] = common.PeriodTable(year_list)
+    stats['fdists'] = common.build_simple_dict_of_nums(year_list)
+    stats['text_lengths'] = common.PeriodTable(year_list)
+    return stats
+
+
+# adds a single document's statistics to the accumulators. the frequency distribution
+# is built once here and shared by every metric.
+def add_document(stats, jsondoc, target, text, keywords, top_words):
+    if bigrams:
+        text = list(nltk.bigrams(text))
+    num_words = len(text)
+    fdist = nltk.FreqDist(text)
+    # the most frequent word is the same for every keyword, only look it up once
+    try:
+        max_freq = fdist[fdist.max()]
+    except ValueError:
+        # Text empty, maxFreq = 0
+        max_freq = 0
+    add_counts(stats, jsondoc, target, fdist, num_words, max_freq, keywords)
+    if top_words:
+        stats['text_lengths'].add(target, None, num_words)
+        if stats['fdists'][target] == 0:
+            stats['fdists'][target] = fdist
+        else:
+            stats['fdists'][target] |= fdist
+
+
+# adds the keyword statistics of a single document, given its keyword counts (any
+# mapping that returns 0 for missing words), its length and its highest word count.
+def add_counts(stats, jsondoc, target, counts, num_words, max_freq, keywords):
+    stats['tally'].add(target, None, 1)
+    for keyword in keywords:
+        if not bigrams:
+            words = keyword.split("/")
+        else:
+            words = keyword
+        word_count = 0
+        tf = 0
+        for w in words:
+            word_count += counts[w]
+            tf += calculate_tf(counts[w], max_freq)
+            if not bigrams:
+                stats['word_counts'].add(target, keyword, counts[w], w)
+        # check if any of the keyword's words occur in the document
+        for w in words:
+            if counts[w] > 0:
+                stats['doc_freq'].add(target, keyword, 1)
+                break
+        stats['tf'][target][keyword].append((jsondoc, tf))
+        stats['word_counts'].add(target, keyword, word_count, "TOTAL")
+        stats['frequency_list'][target][keyword].append(word_count)
+        # word totals have always been accumulated once per keyword
+        stats['word_totals'].add(target, None, num_words)
+
+
+# builds the keyword statistics from the corpus' inverted index, without reading any
+# documents. the index holds each document's year, length and highest word count.
+def index_documents(index, files, year_list, keywords, yrange_min, yrange_max):
+    stats = init_stats(year_list, keywords)
+    postings = {}
+    for keyword in keywords:
+        for w in keyword.split("/"):
+            postings[w] = index.counts(w)
+    for jsondoc in files:
+        if jsondoc[0] != ".":
+            year, length, max_freq = index.docs[jsondoc]
+            # check to make sure it's within range specified by user
+            if year is not None and yrange_min <= year < yrange_max:
+                target = common.determine_year(year, year_list)
+                counts = {}
+                for w in postings:
+                    counts[w] = postings[w].get(jsondoc, 0)
+                add_counts(stats, jsondoc, target, counts, length, max_freq, keywords)
+    return stats
+
+
+# reads each of the given documents once, adding its statistics to a fresh set of accumulators
+def scan_documents(directory, files, year_list, keywords, yrange_min, yrange_max, top_words):
+    stats = init_stats(year_list, keywords)
+    for jsondoc in files:
+        if jsondoc[0] != ".":
+            jsondata = doc_reader.read_document(directory + "/" + jsondoc, [text_type], yrange_min, yrange_max)
+            if jsondata is None:
+                # outside the year range, its text was never decoded
+                continue
+            try:
+                year = int(jsondata["Year Published"])
+            except KeyError:
+                year = int(jsondata["Date"])
+            # check to make sure it's within range specified by user
+            if yrange_min <= year < yrange_max:
+                target = common.determine_year(year, year_list)
+                add_document(stats, jsondoc, target, jsondata[text_type], keywords, top_words)
+    return stats
+
+
+# folds the accumulators from a later shard of the corpus into stats. shards are merged in
+# corpus order, so document lists (and ties in the top words) come out as in a serial pass.
+def merge_stats(stats, other):
+    for table in ['tally', 'doc_freq', 'word_counts', 'word_totals', 'text_lengths']:
+        stats[table].merge(other[table])
+    for year in stats['fdists']:
+        if other['fdists'][year] != 0:
+            if stats['fdists'][year] == 0:
+                stats['fdists'][year] = other['fdists'][year]
+            else:
+                stats['fdists'][year] |= other['fdists'][year]
+        for keyword in stats['tf'][year]:
+            stats['tf'][year][keyword].extend(other['tf'][year][keyword])
+            stats['frequency_list'][year][keyword].extend(other['frequency_list'][year][keyword])
+    return stats
+
+
+# Pool initializer, hands each worker the settings scan_documents needs
+def init_worker(params, text, bigram):
+    global shard_params, text_type, bigrams
+    shard_params = params
+    text_type = text
+    bigrams = bigram
+
+
+def scan_shard(files):
+    directory, year_list, keywords, yrange_min, yrange_max, top_words = shard_params
+    return scan_documents(directory, files, year_list, keywords, yrange_min, yrange_max, top_words)
+
+
+# reads each document in the corpus once, adding its statistics to the accumulators. with more
+# than one worker, the file list is split into contiguous shards which are scanned in parallel.
+def scan_corpus(directory, year_list, keywords, yrange_min, yrange_max, top_words, workers):
+    files = []
+    for subdir, dirs, f in corpus_index.walk(directory, yrange_min, yrange_max):
+        files.extend(f)
+    # the inverted index covers everything but the top N words, which need every word's counts
+    if not bigrams and not top_words:
+        index = inverted_index.open_index(directory, text_type)
+        if index is not None:
+            print("Calculating word frequencies from the inverted index.")
+            stats = index_documents(index, files, year_list, keywords, yrange_min, yrange_max)
+            index.close()
+            return stats
+    print("Calculating word frequencies.")
+    if workers <= 1:
+        return scan_documents(directory, tqdm.tqdm(files), year_list, keywords, yrange_min, yrange_max, top_words)
+    # several shards per worker so that a few large volumes don't hold up the whole run
+    shard_size = max(1, math.ceil(len(files) / (workers * 4)))
+    shards = [files[i:i + shard_size] for i in range(0, len(files), shard_size)]
+    params = [directory, year_list, keywords, yrange_min, yrange_max, top_words]
+    stats = init_stats(year_list, keywords)
+    pool = Pool(workers, initializer=init_worker, initargs=(params, text_type, bigrams))
+    for shard_stats in tqdm.tqdm(pool.imap(scan_shard, shards), total=len(shards)):
+        merge_stats(stats, shard_stats)
+    pool.close()
+    pool.join()
+    return stats
 
 
 # calculates idf score for each keyword/decade pair
-def calculate_idf_results(keywords, year_list, years_tally, directory, yrange_min, yrange_max):
-    idf_results = common.build_dict_of_nums(year_list, keywords)
-    for subdir, dirs, files in os.walk(directory):
-        print("Calculating IDF scores.")
-        for jsondoc in tqdm.tqdm(files):
-            if jsondoc[0] != ".":
-                with open(directory + "/" + jsondoc, 'r', encoding='utf8') as in_file:
-                    jsondata = json.load(in_file)
-                    text = jsondata[text_type]
-                    if bigrams:
-                        text = nltk.bigrams(text)
-                    try:
-                        year = int(jsondata["Year Published"])
-                    except KeyError:
-                        year = int(jsondata["Date"])
-                    # check to make sure it's within range specified by user
-                    if yrange_min <= year < yrange_max:
-                        target = common.determine_year(year, year_list)
-                        # create word frequency distribution
-                        fdist = nltk.FreqDist(text)
-                        for keyword in keywords:
-                            if not bigrams:
-                                words = keyword.split("/")
-                                for w in words:
-                                    # check if word occurs in document
-                                    if fdist[w] > 0:
-                                        try:
-                                            idf_results[target][keyword] += 1
-                                            break
-                                        except KeyError:
-                                            pass
-                                    else:
-                                        pass
-                            else:
-                                for i in range(len(keyword)):
-                                    if fdist[keyword[i]] > 0:
-                                        try:
-                                            idf_results[target][keyword] += 1
-                                            break
-                                        except KeyError:
-                                            pass
-                                    else:
-                                        pass
+def calculate_idf_results(keywords, year_list, years_tally, doc_freq):
+    idf_results = common.PeriodTable(year_list, keywords)
     for y in year_list:
         for keyword in keywords:
-            try:
-                # Add 1 before logarithm to ensure idf is nonzero, unless the word doesn't
-                # occur at all for the period, in which case it's idf score is 0.
-                if idf_results[y][keyword] > 0:
-                    idf_results[y][keyword] = 1 + round(math.log((years_tally[y]) / idf_results[y][keyword], 10), 4)
-                else:
-                    idf_results[y][keyword] = 0
-            except KeyError:
-                pass
+            # Add 1 before logarithm to ensure idf is nonzero, unless the word doesn't
+            # occur at all for the period, in which case it's idf score is 0.
+            if doc_freq.get(y, keyword) > 0:
+                idf_results.set(y, keyword, 1 + round(math.log(years_tally.get(y) / doc_freq.get(y, keyword), 10), 4))
     return idf_results
 
 
-# calculates term frequency for each keyword/decade pair, then multiplies it with the idf score for that
+# multiplies the term frequency of each keyword/document pair with the idf score for its
 # decade, yielding a tf-idf score for each keyword/document pair. The results are stored in a dict of tuples.
-def calculate_tfidf_results(year_list, keywords, directory, idf_results, yrange_min, yrange_max):
+def calculate_tfidf_results(year_list, keywords, tf_results, idf_results):
     tf_idf_results = common.build_dict_of_lists(year_list, keywords)
-    for subdir, dirs, files in os.walk(directory):
-        print("Calculating TF-IDF scores.")
-        for jsondoc in tqdm.tqdm(files):
-            if jsondoc[0] != ".":
-                with open(directory + "/" + jsondoc, 'r', encoding='utf8') as inpt:
-                    jsondata = json.load(inpt)
-                    text = jsondata[text_type]
-                    if bigrams:
-                        text = nltk.bigrams(text)
-                    try:
-                        year = int(jsondata["Year Published"])
-                    except KeyError:
-                        year = int(jsondata["Date"])
-                    # check to make sure it's within range specified by user
-                    if yrange_min <= year < yrange_max:
-                        target = common.determine_year(year, year_list)
-                        # create word frequency distribution
-                        fdist = nltk.FreqDist(text)
-                        # calculate tf and tf-idf for each keyword
-                        for keyword in keywords:
-                            # if single-word keywords are being searched for, then
-                            # they can be grouped together, separated by a "/" character.
-                            temp = 0
-                            if not bigrams:
-                                words = keyword.split("/")
-                                for w in words:
-                                    temp += calculate_tf(fdist, w)
-                            else:
-                                for i in range(len(keyword)):
-                                    temp += calculate_tf(fdist, keyword[i])
-                            try:
-                                idf = idf_results[target][keyword]
-                                tf_idf = calculate_tfidf(idf, temp)
-                                # append tuple of document/tf-idf score pair
-                                tf_idf_results[target][keyword].append((jsondoc, tf_idf))
-                            except KeyError:
-                                pass
     for year in year_list:
         for keyword in keywords:
+            idf = idf_results.get(year, keyword)
+            for jsondoc, tf in tf_results[year][keyword]:
+                # append tuple of document/tf-idf score pair
+                tf_idf_results[year][keyword].append((jsondoc, calculate_tfidf(idf, tf)))
             tf_idf_results[year][keyword] = sorted(tf_idf_results[year][keyword], key=lambda x: x[1])
     return tf_idf_results
 
 
 # calculate term frequency for tf-idf results
-def calculate_tf(fdist, w):
-    termFreq = fdist[w]
-    try:
-        maxFreq = fdist[fdist.max()]
-        tf = (termFreq / maxFreq)
-    except ValueError:
-        # Text empty, maxFreq = 0
-        tf = 0
-    return tf
+def calculate_tf(term_freq, max_freq):
+    if max_freq == 0:
+        return 0
+    return term_freq / max_freq
 
 
 # take product of tf and idf score
@@ -172,174 +235,42 @@ def calculate_tfidf(idf_score, tf_score):
 
 # returns avg tf-idf score for each decade
 def calculate_tfidf_avg(year_list, keywords, tf_idf_results):
-    tf_idf_avg = common.build_dict_of_nums(year_list, keywords)
-    # take avg of tf-idf results
-    for i in range(len(year_list)):
-        for keyword in keywords:
-            length = len(tf_idf_results[year_list[i]][keyword])
-            totals = []
-            for j in range(length):
-                totals.append(tf_idf_results[year_list[i]][keyword][j][1])
-            total = sum(totals)
-            # check if there exist files for the period
-            if length > 0 or total > 0:
-                try:
-                    avg = round((total / length), 4)
-                    tf_idf_avg[year_list[i]][keyword] = avg
-                except ZeroDivisionError:
-                    tf_idf_avg[year_list[i]][keyword] = 0
-            else:
-                # no files, use previous period's score
-                prev_year = year_list[i - 1]
-                try:
-                    prev_avg = tf_idf_avg[prev_year][keyword]
-                except KeyError:
-                    # case when the first period in the list of
-                    # dates has no files associated with it.
-                    prev_avg = 0
-                tf_idf_avg[year_list[i]][keyword] = prev_avg
-    return tf_idf_avg
+    scores = common.list_scores(year_list, keywords, tf_idf_results)
+    avg_var = common.average_and_variance(year_list, keywords, scores)
+    tf_idf_avg, counts = avg_var[0], avg_var[2]
+    tf_idf_avg.round(4)
+    # periods with no files use the previous period's score
+    return tf_idf_avg.fill_forward(counts.values == 0)
 
 
-# returns minimum tf-idf score for each decade
+# returns minimum & maximum tf-idf score for each decade
 def calculate_tfidf_min_and_max(year_list, keywords, tf_idf_results):
-    tf_idf_min = common.build_dict_of_nums(year_list, keywords)
-    tf_idf_max = common.build_dict_of_nums(year_list, keywords)
     print("Calculating TF-IDF minimums & maximums")
-    for i in tqdm.tqdm(range(len(year_list))):
-        for keyword in keywords:
-            try:
-                length = len(tf_idf_results[year_list[i]][keyword])
-                # the lists in tf_idfResults are sorted by the second
-                # tuple value, so min is second entry in the first tuple
-                minimum = tf_idf_results[year_list[i]][keyword][0][1]
-                # likewise, max is second entry in the last tuple
-                maximum = tf_idf_results[year_list[i]][keyword][length - 1][1]
-                tf_idf_min[year_list[i]][keyword] = minimum
-                tf_idf_max[year_list[i]][keyword] = maximum
-            except (ValueError, IndexError) as e:
-                # no files for this period
-                try:
-                    prev_min = tf_idf_min[year_list[i-1]][keyword]
-                    prev_max = tf_idf_max[year_list[i-1]][keyword]
-                except KeyError:
-                    # case when the first period in the list of dates
-                    # has no files associated with it.
-                    prev_min, prev_max = 0
-                tf_idf_min[year_list[i]][keyword] = prev_min
-                tf_idf_max[year_list[i]][keyword] = prev_max
+    scores = common.list_scores(year_list, keywords, tf_idf_results)
+    tf_idf_min, tf_idf_max, counts = common.minimum_and_maximum(year_list, keywords, scores)
+    # periods with no files use the previous period's scores
+    tf_idf_min.fill_forward(counts.values == 0)
+    tf_idf_max.fill_forward(counts.values == 0)
     return [tf_idf_min, tf_idf_max]
 
 
-# returns total word count for each keyword/year period
-def keyword_and_word_count(year_list, directory, yrange_min, yrange_max, keywords):
-    word_totals = common.build_simple_dict_of_nums(year_list)
-    word_count_dict = common.build_nested_dict_of_nums(year_list, keywords)
-    # keyword_totals = common.build_dict_of_nums(year_list, keywords)
-    frequency_list = common.build_dict_of_lists(year_list, keywords)
-    # word_count = {}
-    for subdir, dirs, files in os.walk(directory):
-        print("Taking word counts")
-        for jsondoc in tqdm.tqdm(files):
-            if jsondoc[0] != ".":
-                with open(directory + "/" + jsondoc, 'r', encoding='utf8') as in_file:
-                    jsondata = json.load(in_file)
-                    text = jsondata[text_type]
-                    if bigrams:
-                        text = nltk.bigrams(text)
-                    num_words = len(list(text))
-                    try:
-                        year = int(jsondata["Year Published"])
-                    except KeyError:
-                        year = int(jsondata["Date"])
-                    # check to make sure it's within range specified by user
-                    if yrange_min <= year < yrange_max:
-                        target = common.determine_year(year, year_list)
-                        fdist = nltk.FreqDist(text)
-                        for keyword in keywords:
-                            # keeping this here for bigrams
-                            word_count = 0
-                            # update keyword count for period/keyword pair
-                            if not bigrams:
-                                keys = keyword.split("/")
-                                for k in keys:
-                                    word_count += fdist[k]
-                                    word_count_dict[target][keyword][k] += fdist[k]
-                            else:
-                                # TODO: implement same functionality above for bigrams
-                                # TODO: pretty much everything for bigrams is not functional
-                                for i in range(len(keyword)):
-                                    word_count += fdist[keyword[i]]
-                            try:
-                                # add word count to frequency totals (for frequency as percentage of total words)
-                                # keyword_totals[target][keyword] += word_count
-                                # append word count to frequency list (for mean & variance of samples)
-                                # frequency_list[target][keyword].append(word_count)
-                                word_totals[target] += num_words
-                                word_count_dict[target][keyword]["TOTAL"] += word_count
-                                frequency_list[target][keyword].append(word_count)
-                            except KeyError:
-                                # decade out of range
-                                pass
-
-    return [word_count_dict, frequency_list, word_totals]
-
-
 # calculates term frequency for each keyword/decade pair as a
 # percentage of the total words in all books for each decade
 def take_keyword_percentage(year_list, keywords, total_words, keyword_totals):
-    keyword_percentages = common.build_nested_dict_of_nums(year_list, keywords)
+    keyword_percentages = common.PeriodTable(year_list, keywords, sub_keys=True)
     print("Calculating keyword frequencies as percentages of total words")
-    for i in tqdm.tqdm(range(len(year_list))):
-        for keyword in keywords:
-            num = keyword_totals[year_list[i]][keyword]["TOTAL"]
-            den = total_words[year_list[i]]
-            if den > 0:
-                percent = round((num / den) * 100, 4)
-                keyword_percentages[year_list[i]][keyword]["TOTAL"] = percent
-            else:
-                # no files for this decade, use previous decade's totals
-                prev_year = year_list[i - 1]
-                try:
-                    percent = keyword_percentages[prev_year][keyword]["TOTAL"]
-                except KeyError:
-                    # case when the first period in the list of dates
-                    # has no files associated with it.
-                    percent = 0
-                keyword_percentages[year_list[i]][keyword]["TOTAL"] = percent
-            for k in keyword.split("/"):
-                num = keyword_totals[year_list[i]][keyword][k]
-                if den > 0:
-                    percent = round((num / den) * 100, 4)
-                    keyword_percentages[year_list[i]][keyword][k] = percent
-                else:
-                    prev_year = year_list[i - 1]
-                    try:
-                        percent = keyword_percentages[prev_year][keyword][k]
-                    except KeyError:
-                        percent = 0
-                    keyword_percentages[year_list[i]][keyword][k] = percent
-    return keyword_percentages
+    den = total_words.values
+    present = den[:, 0] > 0
+    keyword_percentages.values[present] = (keyword_totals.values[present] / den[present]) * 100
+    keyword_percentages.ints[present] = False
+    keyword_percentages.round(4)
+    # no files for this decade, use previous decade's totals
+    return keyword_percentages.fill_forward(~present[:, None])
 
 
 # take average keyword occurrence across all volumes, using dict that stores list of individual frequencies
 def avg_and_var(year_list, keywords, frequency_lists):
-    averages = common.build_dict_of_nums(year_list, keywords)
-    variances = common.build_dict_of_nums(year_list, keywords)
-    for year in year_list:
-        for keyword in keywords:
-            if len(frequency_lists[year][keyword]) > 0:
-                averages[year][keyword] = \
-                    sum(frequency_lists[year][keyword]) / len(frequency_lists[year][keyword])
-                var = []
-                for freq in frequency_lists[year][keyword]:
-                    variance = math.pow((freq - averages[year][keyword]), 2)
-                    var.append(variance)
-                variances[year][keyword] = sum(var) / len(var)
-            else:
-                averages[year][keyword] = 0
-                variances[year][keyword] = 0
-    return [averages, variances]
+    return common.average_and_variance(year_list, keywords, frequency_lists)[:2]
 
 
 # might need a set of word_list (minimizes redundancy / faster lookup)
@@ -360,38 +291,18 @@ def obtain_n_words(fdist, num, total_words):
     return keywords
 
 
-def calculate_n_words(year_list, directory, num, yrange_min, yrange_max):
-    fdist_dict = common.build_simple_dict_of_nums(year_list)
-    text_lengths = common.build_simple_dict_of_nums(year_list)
+# builds the list of top N words for each period from the merged frequency distributions
+def calculate_n_words(year_list, num, fdists, text_lengths):
     n_dict = common.build_simple_dict_of_lists(year_list)
     print("Calculating top {0} words per period".format(str(num)))
-    for subdir, dirs, files in os.walk(directory):
-        for jsondoc in files:
-            if jsondoc[0] != ".":
-                with open(directory + "/" + jsondoc, 'r', encoding='utf8') as in_file:
-                    jsondata = json.load(in_file)
-                    try:
-                        year = int(jsondata["Year Published"])
-                    except KeyError:
-                        year = int(jsondata["Date"])
-                    text = jsondata[text_type]
-                    text_len = len(text)
-                    if bigrams:
-                        text = nltk.bigrams(text)
-                        text_len = len(text)
-                    fdist = nltk.FreqDist(text)
-                    if yrange_min <= year < yrange_max:
-                        target = common.determine_year(year, year_list)
-                        text_lengths[target] += text_len
-                        if fdist_dict[target] == 0:
-                            fdist_dict[target] = fdist
-                        else:
-                            fdist_dict[target] |= fdist
     for year in year_list:
-        if num <= len(fdist_dict[year]):
-            n_dict[year].extend(obtain_n_words(fdist_dict[year], num, text_lengths[year]))
+        if fdists[year] == 0:
+            # no files for this period
+            continue
+        if num <= len(fdists[year]):
+            n_dict[year].extend(obtain_n_words(fdists[year], num, text_lengths.get(year)))
         else:
-            n_dict[year].extend(obtain_n_words(fdist_dict[year], len(fdist_dict[year]), text_lengths[year]))
+            n_dict[year].extend(obtain_n_words(fdists[year], len(fdists[year]), text_lengths.get(year)))
     return n_dict
 
 
@@ -435,6 +346,7 @@ def main():
     parser.add_argument("-type", help="which text field from the json document you intend to analyze",
                         action="store")
     parser.add_argument("-nat", action="store", help="nation associated with this corpus", default=None)
+    parser.add_argument("-workers", action="store", help="number of processes to read the corpus with", default=1)
 
     try:
         args = parser.parse_args()
@@ -468,37 +380,31 @@ def main():
     # initialize list of years and dict to keep track
     # of how many books are within each year range
     year_list = common.build_year_list(increment, range_years, periods, yrange_max, yrange_min)
-    years_tally = build_years_tally(directory, year_list, yrange_min, yrange_max)
+    # a single pass over the corpus gathers everything needed below
+    top_words = args.num is not None
+    stats = scan_corpus(directory, year_list, keywords, yrange_min, yrange_max, top_words, int(args.workers))
+    years_tally = stats['tally']
 
-    num_docs = []
-    for year in year_list:
-        num_docs.append(years_tally[year])
+    num_docs = years_tally.graph_list()
 
     # build/populate dicts
-    idf_results = calculate_idf_results(keywords, year_list, years_tally, directory, yrange_min, yrange_max)
-    tf_idf_results = calculate_tfidf_results(year_list, keywords, directory, idf_results, yrange_min, yrange_max)
+    idf_results = calculate_idf_results(keywords, year_list, years_tally, stats['doc_freq'])
+    tf_idf_results = calculate_tfidf_results(year_list, keywords, stats['tf'], idf_results)
     # take avg/max/min
     tf_idf_avg = calculate_tfidf_avg(year_list, keywords, tf_idf_results)
     min_and_max = calculate_tfidf_min_and_max(year_list, keywords, tf_idf_results)
     tf_idf_min = min_and_max[0]
     tf_idf_max = min_and_max[1]
 
-    # returns word_count_dict and word_totals
-    # counts[0] = keyword_totals
-    # counts[1] = frequency_list
-    # counts[2] = word_totals
-    counts = keyword_and_word_count(year_list, directory, yrange_min, yrange_max, keywords)
-    keyword_percentage = take_keyword_percentage(year_list, keywords, counts[2], counts[0])
+    keyword_percentage = take_keyword_percentage(year_list, keywords, stats['word_totals'], stats['word_counts'])
 
-    avg_var = avg_and_var(year_list, keywords, counts[1])
+    avg_var = avg_and_var(year_list, keywords, stats['frequency_list'])
     keyword_averages = avg_var[0]
     keyword_variances = avg_var[1]
 
     # calculate top N words for each period, check if user set -num first
-    try:
-        n_dict = calculate_n_words(year_list, directory, int(args.num), yrange_min, yrange_max)
-    except TypeError:
-        pass
+    if top_words:
+        n_dict = calculate_n_words(year_list, int(args.num), stats['fdists'], stats['text_lengths'])
 
     # create txt file and write all the collected data to it
     with open(args.txt + '.txt', 'w') as txt_out:
@@ -507,21 +413,21 @@ def main():
         print("Writing results to text file")
         for i in tqdm.tqdm(range(len(year_list) - 1)):
             txt_out.write("Period: {0} - {1}".format(str(year_list[i]), str(year_list[i+1])) + "\n")
-            txt_out.write("Number of volumes for this period: {0}".format(str(years_tally[year_list[i]])) + "\n")
+            txt_out.write("Number of volumes for this period: {0}".format(str(years_tally.get(year_list[i]))) + "\n")
             for keyword in keywords:
                 txt_out.write("{0}:".format(str(keyword)) + "\n")
                 txt_out.write("Average frequency of {0} for this period: {1}"
-                              .format(keyword, str(keyword_averages[year_list[i]][keyword])) + "\n")
+                              .format(keyword, str(keyword_averages.get(year_list[i], keyword))) + "\n")
                 txt_out.write("Variance for {0}: {1}"
-                              .format(keyword, str(keyword_variances[year_list[i]][keyword])) + "\n")
+                              .format(keyword, str(keyword_variances.get(year_list[i], keyword))) + "\n")
                 txt_out.write("Avg TF-IDF score for this period: {0}"
-                              .format(str(tf_idf_avg[year_list[i]][keyword]) + "\n"))
+                              .format(str(tf_idf_avg.get(year_list[i], keyword)) + "\n"))
                 txt_out.write("Max TF-IDF score for this period: {0}"
-                              .format(str(tf_idf_max[year_list[i]][keyword]) + "\n"))
+                              .format(str(tf_idf_max.get(year_list[i], keyword)) + "\n"))
                 txt_out.write("Min TF-IDF score for this period: {0}"
-                              .format(str(tf_idf_min[year_list[i]][keyword]) + "\n"))
+                              .format(str(tf_idf_min.get(year_list[i], keyword)) + "\n"))
                 txt_out.write("Word frequency for \"{0}\" (as percentage of total words) for this period: {1}"
-                              .format(keyword, str(keyword_percentage[year_list[i]][keyword]["TOTAL"]) + "\n"))
+                              .format(keyword, str(keyword_percentage.get(year_list[i], keyword, "TOTAL")) + "\n"))
                 try:
                     common.list_max_docs(txt_out, year_list[i], keyword, tf_idf_results, args.num, "TF-IDF")
                     common.list_min_docs(txt_out, year_list[i], keyword, tf_idf_results, args.num, "TF-IDF")
@@ -543,15 +449,14 @@ def main():
     jf['breakdown'] = {}
     for keyword in keywords:
         jf[keyword] = {}
-        jf[keyword]['tf-idf avg'] = common.build_graph_list(keyword, year_list, tf_idf_avg)
-        jf[keyword]['tf-idf max'] = common.build_graph_list(keyword, year_list, tf_idf_max)
-        jf[keyword]['tf-idf min'] = common.build_graph_list(keyword, year_list, tf_idf_min)
-        jf[keyword]['word frequency'] = common.build_graph_list_from_nested(
-            keyword, year_list, keyword_percentage, 'TOTAL')
-        jf[keyword]['average frequency'] = common.build_graph_list(keyword, year_list, keyword_averages)
-        jf[keyword]['variance'] = common.build_graph_list(keyword, year_list, keyword_variances)
+        jf[keyword]['tf-idf avg'] = tf_idf_avg.graph_list(keyword)
+        jf[keyword]['tf-idf max'] = tf_idf_max.graph_list(keyword)
+        jf[keyword]['tf-idf min'] = tf_idf_min.graph_list(keyword)
+        jf[keyword]['word frequency'] = keyword_percentage.graph_list(keyword, 'TOTAL')
+        jf[keyword]['average frequency'] = keyword_averages.graph_list(keyword)
+        jf[keyword]['variance'] = keyword_variances.graph_list(keyword)
         for k in keyword.split('/'):
-            jf['breakdown'][k] = common.build_graph_list_from_nested(keyword, year_list, keyword_percentage, k)
+            jf['breakdown'][k] = keyword_percentage.graph_list(keyword, k)
 
     with open(args.json + '.json', 'w', encoding='utf-8') as jfile:
         jfile.write(build_json(jf))
@@ -0,0 +1,172 @@
+import hashlib, json, os, tempfile
+try:
+    import corpus_index
+except ImportError:
+    from nlp_scripts import corpus_index
+
+
+#                           *** build_manifest.py ***
+#
+# Record of the documents the parsers have written to an output directory. Each document is
+# written once, through a temp file that is renamed into place, and only then gets a line in
+# the directory's manifest (.manifest.jsonl, skipped by the scripts like any other dotfile):
+# the parser that wrote it, its input path, a hash of its input files & metadata, the parser
+# version and the output filename. Several parsers can share an output directory (e.g. the
+# HathiTrust & TEI halves of the Danish corpus), each only looks at its own entries.
+#
+# A build that stops part way through can be started again with -resume, which skips every
+# document in the manifest. With -incremental the parsers only parse documents that are new
+# or whose hash / parser version changed, and delete the output of documents whose input is
+# gone.
+#
+
+
+manifest_file = ".manifest.jsonl"
+temp_suffix = ".tmp"
+
+
+def manifest_path(directory):
+    return os.path.join(directory, manifest_file)
+
+
+# permissions for files written by write_atomic, the same as open() would give them
+# (mkstemp makes its files readable by their owner only)
+umask = os.umask(0)
+os.umask(umask)
+file_mode = 0o666 & ~umask
+
+
+# writes text (or bytes) to path via a temp file in the same directory, so that path only ever
+# holds a complete file. the temp file is a dotfile, so nothing reads it by mistake, and its name
+# is unique so that two processes writing the same path can't trip over each other's temp file.
+def write_atomic(path, text):
+    directory, name = os.path.split(path)
+    fd, temp = tempfile.mkstemp(suffix=temp_suffix, prefix="." + name + ".", dir=directory or ".")
+    try:
+        if isinstance(text, bytes):
+            with os.fdopen(fd, 'wb') as out:
+                out.write(text)
+        else:
+            with os.fdopen(fd, 'w', encoding='utf-8') as out:
+                out.write(text)
+        os.chmod(temp, file_mode)
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+# removes temp files left behind by a build that was stopped mid-write
+def remove_partial(directory):
+    for f in os.listdir(directory):
+        if f[0] == "." and f.endswith(temp_suffix):
+            os.remove(os.path.join(directory, f))
+
+
+# the names a json output can have on disk, as written or converted to binary (corpus_format)
+def output_names(output):
+    if output.endswith(".json"):
+        return [output, output[:-5] + ".bin"]
+    return [output]
+
+
+def output_exists(directory, output):
+    for name in output_names(output):
+        if os.path.exists(os.path.join(directory, name)):
+            return True
+    return False
+
+
+# deletes the given names of a document's output along with their corpus index rows
+def remove_output(directory, names):
+    for name in names:
+        if os.path.exists(os.path.join(directory, name)):
+            os.remove(os.path.join(directory, name))
+    corpus_index.remove_documents(directory, names)
+
+
+# sha1 of a document's input files plus anything else its output depends on (metadata from a
+# csv file, language, etc.), which is passed as a json-serializable list
+def fingerprint(paths, extra):
+    sha = hashlib.sha1()
+    for path in paths:
+        sha.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as in_file:
+            for block in iter(lambda: in_file.read(1 << 20), b''):
+                sha.update(block)
+    sha.update(json.dumps(extra, sort_keys=True).encode('utf-8'))
+    return sha.hexdigest()
+
+
+# reads every entry in the manifest, dropping a last line that was cut short by a crash
+def read_entries(directory):
+    entries = []
+    if not os.path.exists(manifest_path(directory)):
+        return entries
+    complete = 0
+    with open(manifest_path(directory), 'r', encoding='utf-8') as manifest_in:
+        for line in manifest_in:
+            if not line.endswith("\n"):
+                break
+            entries.append(json.loads(line))
+            complete += len(line.encode('utf-8'))
+    # so that the next entry starts on a line of its own
+    with open(manifest_path(directory), 'r+b') as manifest_out:
+        manifest_out.truncate(complete)
+    return entries
+
+
+# returns input path -> latest manifest entry for every document parser has written to directory
+def load(directory, parser):
+    done = {}
+    for entry in read_entries(directory):
+        if entry["parser"] == parser:
+            if entry["output"] is None:
+                done.pop(entry["input"], None)
+            else:
+                done[entry["input"]] = entry
+    return done
+
+
+# whether a manifest entry (or None) is for output, built from the same inputs by the same version
+def is_current(directory, entry, output, sha, version):
+    if entry is None:
+        return False
+    return entry["output"] == output and entry["hash"] == sha and entry["version"] == version \
+        and output_exists(directory, output)
+
+
+def append(directory, entry):
+    with open(manifest_path(directory), 'a', encoding='utf-8') as manifest_out:
+        manifest_out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+# records a newly written document, call once its output file is in place. the output it
+# replaces (a binary copy of an earlier build, or a file under another name) is deleted.
+def add(directory, parser, path, output, sha=None, version=None, entry=None):
+    stale = [name for name in output_names(output) if name != output]
+    if entry is not None and entry["output"] != output:
+        stale.extend(output_names(entry["output"]))
+    remove_output(directory, stale)
+    append(directory, {"parser": parser, "input": path, "output": output, "hash": sha, "version": version})
+
+
+# deletes the output of a document whose input is gone (or no longer produces any), and
+# records that in the manifest
+def remove(directory, parser, path, entry):
+    remove_output(directory, output_names(entry["output"]))
+    append(directory, {"parser": parser, "input": path, "output": None})
+
+
+# rewrites the manifest with only the latest entry for each document
+def compact(directory):
+    latest = {}
+    for entry in read_entries(directory):
+        key = (entry["parser"], entry["input"])
+        if entry["output"] is None:
+            latest.pop(key, None)
+        else:
+            latest[key] = entry
+    write_atomic(manifest_path(directory),
+                 "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in latest.values()))
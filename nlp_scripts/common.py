@@ -1,4 +1,4 @@
-import os, tqdm, math, shutil
+import os, tqdm, math, shutil, bisect, numpy
 
 
 # generic fail method
@@ -7,18 +7,25 @@ def fail(msg):
     os._exit(1)
 
 
-def build_out(out_dir):
+# creates the directory where results will be stored, clearing it out first
+# unless keep is set (for incremental / resumed builds)
+def build_out(out_dir, keep=False):
     if out_dir is not None:
-        # create / overwrite directory where results will be stored
         if not os.path.exists(out_dir):
             os.mkdir(out_dir)
-        else:
+        elif not keep:
             shutil.rmtree(out_dir)
             os.mkdir(out_dir)
     else:
         fail("Please specify output directory.")
 
 
+# number of documents to hand a pool worker at a time: enough to keep per-task overhead down,
+# while still spreading the documents evenly over the workers. raise cap for tiny documents.
+def chunk_size(documents, workers, cap=16):
+    return max(1, min(cap, documents // (workers * 4)))
+
+
 # build subdirectories within output directory, each containing
 # documents where a single keyword / bigram occurs
 def build_subdirs(out_dir, keywords, bigrams):
@@ -161,6 +168,181 @@ def build_dict_of_dicts(year_list, key_list):
     return results
 
 
+# period x keyword results store, a numpy backed replacement for the nested dicts above. cells
+# are indexed by (year, keyword), or by (year, keyword, sub-keyword) when built with sub_keys,
+# which gives each keyword a "TOTAL" cell plus one cell per word in it, like
+# build_nested_dict_of_nums. without keywords, the table holds a single value per period, like
+# build_simple_dict_of_nums. whole tables can be accumulated, merged and filled at once.
+class PeriodTable:
+    def __init__(self, year_list, keywords=None, sub_keys=False, dtype=float):
+        self.year_list = list(year_list)
+        self.keywords = list(keywords) if keywords is not None else [None]
+        self.rows = {}
+        for i, year in enumerate(self.year_list):
+            self.rows[year] = i
+        self.cols = {}
+        for keyword in self.keywords:
+            if sub_keys and isinstance(keyword, str):
+                self.cols[(keyword, "TOTAL")] = len(self.cols)
+                for k in keyword.split("/"):
+                    if (keyword, k) not in self.cols:
+                        self.cols[(keyword, k)] = len(self.cols)
+            else:
+                self.cols[(keyword, None)] = len(self.cols)
+        self.values = numpy.zeros((len(self.year_list), len(self.cols)), dtype=dtype)
+        # cells that hold a python int rather than a float. empty cells start out as int 0,
+        # as in the nested dicts, so values come back out with the same type (and the same
+        # json / csv formatting) they always had.
+        self.ints = numpy.ones(self.values.shape, dtype=bool)
+
+    def index(self, year, keyword=None, sub=None):
+        return self.rows[year], self.cols[(keyword, sub)]
+
+    def get(self, year, keyword=None, sub=None):
+        i, j = self.index(year, keyword, sub)
+        if self.ints[i, j]:
+            return int(self.values[i, j])
+        return self.values[i, j].item()
+
+    def set(self, year, keyword, value, sub=None):
+        i, j = self.index(year, keyword, sub)
+        self.values[i, j] = value
+        self.ints[i, j] = isinstance(value, int)
+
+    def add(self, year, keyword, value, sub=None):
+        i, j = self.index(year, keyword, sub)
+        self.values[i, j] += value
+        if not isinstance(value, int):
+            self.ints[i, j] = False
+
+    # rounds every float cell. python's round is used rather than numpy.round, which can
+    # differ in the last digit.
+    def round(self, digits):
+        rounded = [[round(v, digits) for v in row] for row in self.values.tolist()]
+        self.values = numpy.array(rounded, dtype=self.values.dtype).reshape(self.values.shape)
+        return self
+
+    # adds another table of the same shape, cell by cell
+    def merge(self, other):
+        self.values += other.values
+        self.ints &= other.ints
+        return self
+
+    # periods with no results (True in the empty array) take the value of the period
+    # before them. when the first period is empty, it (and those following it) get 0.
+    def fill_forward(self, empty):
+        rows = numpy.arange(len(self.year_list))[:, None]
+        source = numpy.maximum.accumulate(numpy.where(empty, -1, rows), axis=0)
+        cols = numpy.arange(len(self.cols))[None, :]
+        filled = source >= 0
+        self.values = numpy.where(filled, self.values[numpy.maximum(source, 0), cols], 0)
+        self.ints = numpy.where(filled, self.ints[numpy.maximum(source, 0), cols], True)
+        return self
+
+    # returns a list of values to be plotted, same as build_graph_list
+    def graph_list(self, keyword=None, sub=None):
+        return [self.get(year, keyword, sub) for year in self.year_list]
+
+    # converts the table back to nested dicts, same layout as the build_dict_of_* helpers
+    def to_dict(self):
+        results = {}
+        for year in self.year_list:
+            results[year] = {}
+            for keyword, sub in self.cols:
+                if sub is None:
+                    results[year][keyword] = self.get(year, keyword)
+                else:
+                    try:
+                        results[year][keyword][sub] = self.get(year, keyword, sub)
+                    except KeyError:
+                        results[year][keyword] = {sub: self.get(year, keyword, sub)}
+        return results
+
+
+# flattens a dict of lists (as built by build_dict_of_lists) into arrays of samples and the
+# table cell each one belongs to, so that whole tables can be reduced with a few numpy calls.
+# returns [cells, samples, whether each sample is a python int].
+def flatten_samples(table, samples):
+    cells = []
+    flat = []
+    ints = []
+    width = len(table.cols)
+    for year in table.year_list:
+        for keyword in table.keywords:
+            i, j = table.index(year, keyword)
+            values = samples[year][keyword]
+            cells.extend([i * width + j] * len(values))
+            flat.extend(values)
+            ints.extend([isinstance(v, int) for v in values])
+    return [numpy.array(cells, dtype=numpy.int64), numpy.array(flat, dtype=float), numpy.array(ints, dtype=bool)]
+
+
+# number of samples & their sum for each period / keyword pair of a dict of lists.
+# returns [counts, totals].
+def sample_totals(year_list, keywords, samples):
+    counts = PeriodTable(year_list, keywords)
+    totals = PeriodTable(year_list, keywords)
+    cells, flat, ints = flatten_samples(counts, samples)
+    size = counts.values.size
+    counts.values = numpy.bincount(cells, minlength=size).astype(float).reshape(counts.values.shape)
+    # bincount adds weights in order, so each sum comes out the same as sum() over its list
+    totals.values = numpy.bincount(cells, weights=flat, minlength=size).reshape(totals.values.shape)
+    # a sum stays an int as long as all of its samples are
+    floats = numpy.bincount(cells, weights=~ints, minlength=size)
+    totals.ints = (floats == 0).reshape(totals.ints.shape)
+    return [counts, totals]
+
+
+# average & variance of the samples for each period / keyword pair of a dict of lists.
+# empty pairs get 0. returns [averages, variances, counts].
+def average_and_variance(year_list, keywords, samples):
+    counts, totals = sample_totals(year_list, keywords, samples)
+    averages = PeriodTable(year_list, keywords)
+    variances = PeriodTable(year_list, keywords)
+    present = counts.values > 0
+    averages.values[present] = totals.values[present] / counts.values[present]
+    averages.ints = ~present
+    cells, flat, ints = flatten_samples(counts, samples)
+    squares = numpy.bincount(cells, weights=(flat - averages.values.ravel()[cells]) ** 2,
+                             minlength=counts.values.size).reshape(counts.values.shape)
+    variances.values[present] = squares[present] / counts.values[present]
+    variances.ints = ~present
+    return [averages, variances, counts]
+
+
+# smallest & largest sample for each period / keyword pair of a dict of lists, picked the same
+# way as the first & last entries of each list after sorting it. empty pairs get 0.
+# returns [minimums, maximums, counts].
+def minimum_and_maximum(year_list, keywords, samples):
+    minimums = PeriodTable(year_list, keywords)
+    maximums = PeriodTable(year_list, keywords)
+    counts = PeriodTable(year_list, keywords)
+    cells, flat, ints = flatten_samples(counts, samples)
+    n = numpy.bincount(cells, minlength=counts.values.size)
+    counts.values = n.astype(float).reshape(counts.values.shape)
+    # stable sort by cell, then value. each cell's samples end up in one sorted run.
+    order = numpy.lexsort((flat, cells))
+    present = n > 0
+    starts = numpy.cumsum(n) - n
+    first = order[starts[present]]
+    last = order[starts[present] + n[present] - 1]
+    for table, picked in [(minimums, first), (maximums, last)]:
+        values = table.values.ravel()
+        values[present] = flat[picked]
+        mask = table.ints.ravel()
+        mask[present] = ints[picked]
+    return [minimums, maximums, counts]
+
+
+# pulls the scores out of a dict of lists of (document, score) tuples
+def list_scores(year_list, keywords, results):
+    scores = build_dict_of_lists(year_list, keywords)
+    for year in year_list:
+        for keyword in keywords:
+            scores[year][keyword] = [entry[1] for entry in results[year][keyword]]
+    return scores
+
+
 # returns a list of values to be plotted
 def build_graph_list(keyword, year_list, param):
     a = [0] * len(year_list)
@@ -184,20 +366,20 @@ def list_to_string(list_inpt):
     return return_string
 
 
-# helper method to group docs into periods
+# helper method to group docs into periods. year_list is sorted (see build_year_list), so
+# the period a year falls within is found by binary search. years past the start of the last
+# period belong to it, years before the first period return None.
 def determine_year(year, year_list):
-    # determine which period it falls within
-    for i in range(len(year_list)):
-        if year_list[i] <= year < year_list[i + 1]:
-            # the year / period this document belongs in
-            target = year_list[i]
-            return target
-        if year >= year_list[len(year_list) - 1]:
-            # case when the document belongs in the last year / period of the list
-            target = year_list[len(year_list) - 1]
-            return target
-        else:
-            continue
+    i = bisect.bisect_right(year_list, year) - 1
+    if i < 0:
+        return None
+    return year_list[i]
+
+
+# batch form of determine_year, maps an array of years to the indices of the periods they
+# fall within in one call. years before the first period get -1.
+def determine_periods(years, year_list):
+    return numpy.searchsorted(numpy.asarray(year_list), numpy.asarray(years), side='right') - 1
 
 
 # writes N documents with lowest scores for each period to a text file
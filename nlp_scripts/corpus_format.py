@@ -0,0 +1,182 @@
+import argparse, json, os, struct
+import numpy
+try:
+    import build_manifest
+    import corpus_index
+except ImportError:
+    from nlp_scripts import build_manifest, corpus_index
+
+
+#                           *** corpus_format.py ***
+#
+# Compact binary format for parsed corpora. Rather than eight pretty-printed copies of the
+# text per volume, a corpus directory holds one vocabulary file (.vocab.txt, one token per
+# line, line number = token id) shared by every document, and one .bin file per document:
+#
+#   magic (4 bytes) | version (uint32) | header length (uint32) | header (utf-8 json) | data
+#
+# The header holds the document metadata (title, author, year, etc.) along with the byte
+# offset / length of each text field in the data section. Word fields are stored as an
+# int32 array of token ids. Sentence fields are stored as one int32 array of token ids for
+# all sentences plus an int32 array of sentence boundaries. A single field can then be
+# memory-mapped and decoded without touching the rest of the file.
+#
+# Corpora are written as json by the parsers and converted with pack_corpus (the parsers
+# do this themselves when run with -binary). Analysis scripts read both formats through
+# doc_reader. This script can also be run directly to convert an existing json corpus:
+#
+#   python corpus_format.py -i <CORPUS_DIRECTORY>
+#
+
+
+magic = b'OERB'
+version = 1
+vocab_file = ".vocab.txt"
+prefix = struct.Struct('<4sII')
+
+word_fields = ['Full Text', 'Full Text Stemmed', 'Filtered Text', 'Filtered Text Stemmed']
+sentence_fields = ['Full Sentences', 'Filtered Sentences', 'Stemmed Sentences', 'Filtered Stemmed Sentences']
+
+# corpus directory -> [vocab file mtime, numpy array of tokens]
+vocabularies = {}
+
+
+class Vocabulary:
+    def __init__(self, directory):
+        self.path = os.path.join(directory, vocab_file)
+        self.ids = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as vocab_in:
+                for line in vocab_in:
+                    self.ids[line.rstrip("\n")] = len(self.ids)
+        self.pending = []
+
+    def encode(self, tokens):
+        ids = numpy.empty(len(tokens), dtype='<i4')
+        for i, token in enumerate(tokens):
+            try:
+                ids[i] = self.ids[token]
+            except KeyError:
+                self.ids[token] = len(self.ids)
+                self.pending.append(token)
+                ids[i] = self.ids[token]
+        return ids
+
+    # append tokens added since the last flush. the vocabulary is append-only, so
+    # ids already written to documents never change.
+    def flush(self):
+        if len(self.pending) > 0:
+            with open(self.path, 'a', encoding='utf-8') as vocab_out:
+                vocab_out.write("\n".join(self.pending) + "\n")
+            self.pending = []
+
+
+# build the byte string for a single document from its json dict
+def encode_document(jsondata, vocab):
+    metadata = {}
+    fields = {}
+    arrays = []
+    offset = 0
+    for key, value in jsondata.items():
+        if key in word_fields:
+            ids = vocab.encode(value)
+            fields[key] = {'offset': offset, 'length': len(ids)}
+            arrays.append(ids)
+            offset += ids.nbytes
+        elif key in sentence_fields:
+            bounds = numpy.zeros(len(value) + 1, dtype='<i4')
+            tokens = []
+            for i, sentence in enumerate(value):
+                words = sentence.split(" ") if sentence != "" else []
+                tokens.extend(words)
+                bounds[i + 1] = len(tokens)
+            ids = vocab.encode(tokens)
+            fields[key] = {'offset': offset, 'length': len(ids),
+                           'bounds': offset + ids.nbytes, 'count': len(value)}
+            arrays.extend([ids, bounds])
+            offset += ids.nbytes + bounds.nbytes
+        else:
+            metadata[key] = value
+    header = json.dumps({'metadata': metadata, 'fields': fields}, ensure_ascii=False).encode('utf-8')
+    # pad the header so the data section is aligned for int32 access
+    header += b' ' * (-(prefix.size + len(header)) % 4)
+    return b''.join([prefix.pack(magic, version, len(header)), header] + [a.tobytes() for a in arrays])
+
+
+# writes a document to out_path in binary format, via a temp dotfile (see build_manifest.write_atomic)
+def write_document(jsondata, out_path, vocab):
+    data = encode_document(jsondata, vocab)
+    # vocab goes to disk first, so a document never references ids that aren't saved
+    vocab.flush()
+    build_manifest.write_atomic(out_path, data)
+
+
+# converts every json document in a corpus directory to binary, removing the json files
+def pack_corpus(directory):
+    vocab = Vocabulary(directory)
+    for jsondoc in sorted(os.listdir(directory)):
+        if jsondoc[0] != "." and jsondoc.endswith(".json"):
+            with open(os.path.join(directory, jsondoc), 'r', encoding='utf-8') as in_file:
+                jsondata = json.load(in_file)
+            write_document(jsondata, os.path.join(directory, jsondoc[:-5] + ".bin"), vocab)
+            os.remove(os.path.join(directory, jsondoc))
+    # keep the corpus index pointing at the converted documents
+    corpus_index.rename_documents(directory, ".json", ".bin")
+
+
+# returns the token array for the corpus a document belongs to, reloaded if the file changed
+def load_vocabulary(directory):
+    path = os.path.join(directory, vocab_file)
+    mtime = os.path.getmtime(path)
+    try:
+        cached = vocabularies[directory]
+        if cached[0] == mtime:
+            return cached[1]
+    except KeyError:
+        pass
+    with open(path, 'r', encoding='utf-8') as vocab_in:
+        tokens = numpy.array([line.rstrip("\n") for line in vocab_in], dtype=object)
+    vocabularies[directory] = [mtime, tokens]
+    return tokens
+
+
+# returns [header dict, offset of the data section] for a binary document
+def read_header(path):
+    with open(path, 'rb') as in_file:
+        mark, ver, length = prefix.unpack(in_file.read(prefix.size))
+        if mark != magic or ver != version:
+            raise ValueError("{0} is not a binary corpus document.".format(path))
+        header = json.loads(in_file.read(length).decode('utf-8'))
+    return [header, prefix.size + length]
+
+
+# memory-maps a single text field and decodes it back into a list of words or sentences
+def read_field(path, field, header=None):
+    if header is None:
+        header = read_header(path)
+    info, start = header[0]['fields'][field], header[1]
+    if info['length'] > 0:
+        ids = numpy.memmap(path, dtype='<i4', mode='r', offset=start + info['offset'], shape=(info['length'],))
+        words = load_vocabulary(os.path.dirname(path) or ".")[ids].tolist()
+    else:
+        words = []
+    if field not in sentence_fields:
+        return words
+    bounds = numpy.memmap(path, dtype='<i4', mode='r', offset=start + info['bounds'], shape=(info['count'] + 1,))
+    return [" ".join(words[bounds[i]:bounds[i + 1]]) for i in range(info['count'])]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", metavar='in-directory', action="store", help="json corpus directory to convert")
+
+    try:
+        args = parser.parse_args()
+    except IOError:
+        pass
+
+    pack_corpus(args.i)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import argparse, json, os, sqlite3
+import numpy
+try:
+    import common
+except ImportError:
+    from nlp_scripts import common
+
+
+#                           *** corpus_index.py ***
+#
+# Corpus-level metadata index. Each corpus directory written by the parsers (or by SentBuilder)
+# gets a small SQLite database (.index.db, skipped by the scripts like any other dotfile) with one
+# row per document: filename, year, title, author, HTID, document type, along with the number of
+# entries & tokens in each of its text fields. The analysis scripts use it to pick out the documents
+# within their year range and to count volumes per period without opening any documents.
+#
+# Corpora built before the index existed can be indexed by running this script directly:
+#
+#   python corpus_index.py -i <CORPUS_DIRECTORY>
+#
+
+
+index_file = ".index.db"
+
+# text fields of a Parsed object, as named in the json written by parsing_help.build_json
+parsed_fields = [('Full Text', 'c'), ('Full Text Stemmed', 'cstem'), ('Filtered Text', 'tx'),
+                 ('Filtered Text Stemmed', 'txstem'), ('Full Sentences', 'c_sent'),
+                 ('Filtered Sentences', 'tx_sent'), ('Stemmed Sentences', 'cstem_sent'),
+                 ('Filtered Stemmed Sentences', 'txstem_sent')]
+
+schema = [
+    "CREATE TABLE IF NOT EXISTS documents (filename TEXT PRIMARY KEY, year INTEGER, title TEXT, "
+    "author TEXT, htid TEXT, doc_type TEXT)",
+    "CREATE TABLE IF NOT EXISTS field_counts (filename TEXT, field TEXT, entries INTEGER, tokens INTEGER, "
+    "PRIMARY KEY (filename, field))",
+    "CREATE INDEX IF NOT EXISTS documents_year ON documents (year)"
+]
+
+
+def index_path(directory):
+    return os.path.join(directory, index_file)
+
+
+def connect(directory):
+    conn = sqlite3.connect(index_path(directory))
+    for statement in schema:
+        conn.execute(statement)
+    return conn
+
+
+# years are stored as integers, anything that isn't one (missing / malformed dates) as NULL
+def to_year(year):
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return None
+
+
+# [entries, tokens] for a text field. word fields hold one token per entry,
+# sentence / snippet fields hold space separated tokens.
+def count_field(value):
+    if isinstance(value, str):
+        return [1, len(value.split())]
+    tokens = 0
+    for entry in value:
+        if isinstance(entry, str) and " " in entry:
+            tokens += len(entry.split())
+        else:
+            tokens += 1
+    return [len(value), tokens]
+
+
+# builds an index row from a Parsed object. call after parsing_help.build_json,
+# which cleans up the title / author / etc. fields.
+def parsed_row(filename, file):
+    counts = {}
+    for field, attr in parsed_fields:
+        counts[field] = count_field(getattr(file, attr))
+    return [(filename, to_year(file.y), file.t, file.a, file.h, file.d), counts]
+
+
+# builds an index row from a document's json dict. any list-valued field (and the
+# 'Text' field of SentBuilder snippets) is counted as a text field, other than page offsets.
+def json_row(filename, jsondata):
+    try:
+        year = jsondata["Year Published"]
+    except KeyError:
+        year = jsondata.get("Date")
+    counts = {}
+    for key, value in jsondata.items():
+        if (isinstance(value, list) and key != "Page Offsets") or key == "Text":
+            counts[key] = count_field(value)
+    return [(filename, to_year(year), jsondata.get("Title"), jsondata.get("Author"), jsondata.get("HTID"),
+             jsondata.get("Document Type")), counts]
+
+
+# adds / replaces rows in a corpus directory's index
+def write_rows(directory, rows):
+    conn = connect(directory)
+    with conn:
+        for row, counts in rows:
+            conn.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)", row)
+            conn.execute("DELETE FROM field_counts WHERE filename = ?", (row[0],))
+            conn.executemany("INSERT INTO field_counts VALUES (?, ?, ?, ?)",
+                             [(row[0], field, c[0], c[1]) for field, c in counts.items()])
+    conn.close()
+
+
+# drops the rows of documents that were deleted from a corpus directory
+def remove_documents(directory, filenames):
+    if not os.path.exists(index_path(directory)) or len(filenames) == 0:
+        return
+    conn = connect(directory)
+    with conn:
+        for table in ["documents", "field_counts"]:
+            conn.executemany("DELETE FROM {0} WHERE filename = ?".format(table), [(f,) for f in filenames])
+    conn.close()
+
+
+# rewrites document filenames after their extension changes (e.g. corpus_format.pack_corpus)
+def rename_documents(directory, old_ext, new_ext):
+    if not os.path.exists(index_path(directory)):
+        return
+    conn = connect(directory)
+    with conn:
+        for table in ["documents", "field_counts"]:
+            conn.execute("UPDATE {0} SET filename = substr(filename, 1, length(filename) - ?) || ? "
+                         "WHERE filename LIKE ?".format(table), (len(old_ext), new_ext, "%" + old_ext))
+    conn.close()
+
+
+# returns filename -> year for every indexed document, or None if the directory has no index
+def load_years(directory):
+    if not os.path.exists(index_path(directory)):
+        return None
+    conn = connect(directory)
+    years = dict(conn.execute("SELECT filename, year FROM documents"))
+    conn.close()
+    return years
+
+
+# drop-in replacement for os.walk over a flat corpus directory. documents the index places
+# outside [year_min, year_max) are left out of the file lists; documents that aren't indexed
+# (or have no usable year) are kept, and are checked as they're read.
+def walk(directory, year_min=None, year_max=None):
+    years = load_years(directory)
+    for subdir, dirs, files in os.walk(directory):
+        if years is not None and subdir == directory:
+            kept = []
+            for f in files:
+                year = years.get(f)
+                if year is not None:
+                    if year_min is not None and year < year_min:
+                        continue
+                    if year_max is not None and year >= year_max:
+                        continue
+                kept.append(f)
+            files = kept
+        yield subdir, dirs, files
+
+
+# returns the number of volumes per period within [year_min, year_max), straight from the
+# index. returns None if the directory has no index, or holds documents the index can't place.
+def period_counts(directory, year_list, year_min, year_max):
+    years = load_years(directory)
+    if years is None:
+        return None
+    doc_years = []
+    for f in os.listdir(directory):
+        if f[0] != ".":
+            year = years.get(f)
+            if year is None:
+                return None
+            if year_min <= year < year_max:
+                doc_years.append(year)
+    # bucket every year in one call, then count volumes per period
+    periods = common.determine_periods(doc_years, year_list)
+    counts = numpy.bincount(periods[periods >= 0], minlength=len(year_list))
+    tally = {}
+    for i, y in enumerate(year_list):
+        tally[y] = int(counts[i])
+    return tally
+
+
+# indexes an existing corpus directory of json documents
+def build_index(directory):
+    rows = []
+    for jsondoc in sorted(os.listdir(directory)):
+        if jsondoc[0] != "." and jsondoc.endswith(".json"):
+            with open(os.path.join(directory, jsondoc), 'r', encoding='utf-8') as in_file:
+                rows.append(json_row(jsondoc, json.load(in_file)))
+    if os.path.exists(index_path(directory)):
+        os.remove(index_path(directory))
+    write_rows(directory, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", metavar='in-directory', action="store", help="json corpus directory to index")
+
+    try:
+        args = parser.parse_args()
+    except IOError:
+        pass
+
+    build_index(args.i)
+
+
+if __name__ == '__main__':
+    main()
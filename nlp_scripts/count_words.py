@@ -1,7 +1,7 @@
 import argparse
 import tqdm
 import os
-import json
+import doc_reader
 
 
 if __name__ == '__main__':
@@ -17,8 +17,7 @@ if __name__ == '__main__':
     for subdir, dirs, files in os.walk(input_dir):
         for jsondoc in tqdm.tqdm(files):
             if jsondoc[0] != ".":
-                with open(f"{input_dir}/{jsondoc}", 'r', encoding='utf8') as inpt:
-                    jsondata = json.load(inpt)
-                    c += len(jsondata[text_field])
+                jsondata = doc_reader.read_document(f"{input_dir}/{jsondoc}", [text_field])
+                c += len(jsondata[text_field])
 
     print(f"Number of words in corpus: {c}")
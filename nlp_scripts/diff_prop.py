@@ -6,8 +6,8 @@ import common
 
 def build_samples(csv_inpt, year_list, yrange_min, yrange_max):
     # set up observation and sample size dicts
-    p = common.build_simple_dict_of_nums(year_list)
-    n = common.build_simple_dict_of_nums(year_list)
+    p = common.PeriodTable(year_list)
+    n = common.PeriodTable(year_list)
     with open(csv_inpt, 'r') as csv_file:
         read_csv = csv.reader(csv_file, delimiter=',')
         row1 = next(read_csv)
@@ -27,10 +27,10 @@ def build_samples(csv_inpt, year_list, yrange_min, yrange_max):
                     try:
                         if binary:
                             # one more volume to sample size w/r/t year period
-                            n[target] += 1
+                            n.add(target, None, 1)
                         else:
                             # add total words to sample size w/r/t year period
-                            n[target] += int(row[-1])
+                            n.add(target, None, int(row[-1]))
                     except KeyError:
                         pass
                     for cell in row[2:-1]:
@@ -38,14 +38,14 @@ def build_samples(csv_inpt, year_list, yrange_min, yrange_max):
                             if cell == "1":
                                 try:
                                     # add one to observation dict and break
-                                    p[target] += 1
+                                    p.add(target, None, 1)
                                     break
                                 except KeyError:
                                     pass
                         else:
                             try:
                                 # add frequency in this cell to observation dict
-                                p[target] += int(cell)
+                                p.add(target, None, int(cell))
                             except KeyError:
                                 pass
     return [p, n]
@@ -104,7 +104,7 @@ def main():
 
     # calculate chi-squared and p values
     for year in tqdm.tqdm(year_list):
-        vals = diff_props_test(x1[year], n1[year], x2[year], n2[year])
+        vals = diff_props_test(x1.get(year), n1.get(year), x2.get(year), n2.get(year))
         z = vals[0]
         p_val = vals[1]
         significance = scipy.stats.norm.cdf(z)
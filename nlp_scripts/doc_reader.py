@@ -0,0 +1,147 @@
+import json, re
+try:
+    import corpus_format
+except ImportError:
+    from nlp_scripts import corpus_format
+
+
+#                           *** doc_reader.py ***
+#
+# Field-selective reader for corpus documents, shared by the analysis scripts. Rather than
+# json.load-ing a whole volume to use one text field, read_document scans the file once
+# without decoding it, decodes the metadata (every top-level value that isn't a list or
+# dict), checks the publication year, and only then decodes the requested text fields.
+# Documents outside the requested year range never have their text decoded at all.
+#
+# Json files are scanned at the byte level: multi-byte UTF-8 sequences never contain '"'
+# or '\' bytes, so strings can be skipped without decoding them. Binary documents (see
+# corpus_format.py) are read from their header and memory-mapped fields.
+#
+
+
+string = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+string_re = re.compile(string)
+scalar_re = re.compile(rb'[^\s,\]}]+')
+nested_re = re.compile(string + rb'|[\[\]{}]')
+space_re = re.compile(rb'\s*')
+
+
+# fast path for flat lists of strings, by far the most common (and largest) value in corpus
+# documents. finds the first ']' outside of a string using only C-level find / count calls.
+# returns None if the list holds anything that needs the slow path (escapes or brackets).
+def skip_flat_list(data, i):
+    end = i
+    quotes = 0
+    while True:
+        start = end
+        end = data.find(b']', end + 1)
+        if end == -1:
+            return None
+        # an even number of quotes before it means the bracket isn't inside a string
+        quotes += data.count(b'"', start, end)
+        if quotes % 2 == 0:
+            break
+    if data.find(b'\\', i, end) != -1 or data.find(b'[', i + 1, end) != -1 or data.find(b'{', i + 1, end) != -1:
+        return None
+    return end + 1
+
+
+# returns the position just past the json value starting at i
+def skip_value(data, i):
+    c = data[i:i + 1]
+    if c == b'"':
+        return string_re.match(data, i).end()
+    if c == b'[':
+        end = skip_flat_list(data, i)
+        if end is not None:
+            return end
+    if c == b'[' or c == b'{':
+        # nested lists / dicts, walk brackets and skip over strings
+        depth = 0
+        for m in nested_re.finditer(data, i):
+            t = m.group()
+            if t == b'[' or t == b'{':
+                depth += 1
+            elif t == b']' or t == b'}':
+                depth -= 1
+                if depth == 0:
+                    return m.end()
+        raise ValueError("Unterminated json value at byte {0}.".format(str(i)))
+    return scalar_re.match(data, i).end()
+
+
+# returns a dict of key -> (start, end) byte spans for the top-level values of a json object
+def scan_spans(data):
+    spans = {}
+    i = space_re.match(data, 0).end()
+    if data[i:i + 1] != b'{':
+        raise ValueError("Expected a json object.")
+    i = space_re.match(data, i + 1).end()
+    while data[i:i + 1] != b'}':
+        key_end = string_re.match(data, i).end()
+        key = json.loads(data[i:key_end].decode('utf-8'))
+        # skip whitespace & colon
+        i = space_re.match(data, key_end).end() + 1
+        i = space_re.match(data, i).end()
+        end = skip_value(data, i)
+        spans[key] = (i, end)
+        i = space_re.match(data, end).end()
+        if data[i:i + 1] == b',':
+            i = space_re.match(data, i + 1).end()
+    return spans
+
+
+# publication year of a document, from whichever field the corpus uses
+def doc_year(jsondata):
+    try:
+        return int(jsondata["Year Published"])
+    except KeyError:
+        return int(jsondata["Date"])
+
+
+def in_range(jsondata, year_min, year_max):
+    if year_min is None and year_max is None:
+        return True
+    year = doc_year(jsondata)
+    if year_min is not None and year < year_min:
+        return False
+    if year_max is not None and year >= year_max:
+        return False
+    return True
+
+
+def read_json(path, fields, year_min, year_max):
+    with open(path, 'rb') as in_file:
+        data = in_file.read()
+    spans = scan_spans(data)
+    jsondata = {}
+    for key, span in spans.items():
+        if data[span[0]:span[0] + 1] not in (b'[', b'{'):
+            jsondata[key] = json.loads(data[span[0]:span[1]].decode('utf-8'))
+    if not in_range(jsondata, year_min, year_max):
+        return None
+    for field in fields:
+        if field in spans and field not in jsondata:
+            span = spans[field]
+            jsondata[field] = json.loads(data[span[0]:span[1]].decode('utf-8'))
+    return jsondata
+
+
+def read_binary(path, fields, year_min, year_max):
+    header = corpus_format.read_header(path)
+    jsondata = dict(header[0]['metadata'])
+    if not in_range(jsondata, year_min, year_max):
+        return None
+    for field in fields:
+        if field in header[0]['fields']:
+            jsondata[field] = corpus_format.read_field(path, field, header)
+    return jsondata
+
+
+# returns a dict holding the document's metadata plus the requested fields, or None if the
+# document's year falls outside [year_min, year_max). fields missing from the document are
+# simply left out, so callers get the same KeyError they would with json.load.
+def read_document(path, fields, year_min=None, year_max=None):
+    if path.endswith(".bin"):
+        return read_binary(path, fields, year_min, year_max)
+    return read_json(path, fields, year_min, year_max)
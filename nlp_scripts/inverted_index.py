@@ -0,0 +1,206 @@
+import argparse, os, sqlite3
+import numpy
+try:
+    import common, corpus_index, doc_reader
+except ImportError:
+    from nlp_scripts import common, corpus_index, doc_reader
+
+
+#                           *** inverted_index.py ***
+#
+# Persistent inverted index over one text field of a corpus: term -> postings of (document,
+# count, positions). It lives in the corpus directory (.inverted.db) next to the documents
+# and can hold any number of fields. Keyword counts, document frequencies and keyword
+# positions then come from a few index lookups rather than a rescan of every token list.
+#
+# Build (or bring up to date) the index for a field with:
+#
+#   python inverted_index.py -i <CORPUS_DIRECTORY> -type "Filtered Text"
+#
+# Updates are incremental: only documents that are new or modified since the last run are
+# read, and documents that no longer exist are dropped. The analysis scripts only use an
+# index that is current with the documents on disk, and scan the corpus as before otherwise.
+#
+
+
+index_file = ".inverted.db"
+
+schema = [
+    "CREATE TABLE IF NOT EXISTS fields (id INTEGER PRIMARY KEY, name TEXT UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, field_id INTEGER, filename TEXT, "
+    "mtime REAL, year INTEGER, length INTEGER, max_count INTEGER, UNIQUE (field_id, filename))",
+    "CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS postings (term_id INTEGER, doc_id INTEGER, count INTEGER, positions BLOB, "
+    "PRIMARY KEY (term_id, doc_id)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)"
+]
+
+
+def index_path(directory):
+    return os.path.join(directory, index_file)
+
+
+def connect(directory):
+    conn = sqlite3.connect(index_path(directory))
+    for statement in schema:
+        conn.execute(statement)
+    return conn
+
+
+def field_id(conn, field):
+    conn.execute("INSERT OR IGNORE INTO fields (name) VALUES (?)", (field,))
+    return conn.execute("SELECT id FROM fields WHERE name = ?", (field,)).fetchone()[0]
+
+
+# filename -> modification time for every document in a corpus directory
+def list_documents(directory):
+    docs = {}
+    for f in os.listdir(directory):
+        if f[0] != "." and os.path.isfile(os.path.join(directory, f)):
+            docs[f] = os.path.getmtime(os.path.join(directory, f))
+    return docs
+
+
+# returns term -> list of positions for a token list
+def term_positions(text):
+    positions = {}
+    for i, term in enumerate(text):
+        try:
+            positions[term].append(i)
+        except KeyError:
+            positions[term] = [i]
+    return positions
+
+
+# adds a single document's postings to the index
+def add_document(conn, fid, terms, directory, filename, mtime, field):
+    jsondata = doc_reader.read_document(os.path.join(directory, filename), [field])
+    text = jsondata[field]
+    positions = term_positions(text)
+    max_count = 0
+    rows = []
+    for term, pos in positions.items():
+        try:
+            tid = terms[term]
+        except KeyError:
+            tid = conn.execute("INSERT INTO terms (term) VALUES (?)", (term,)).lastrowid
+            terms[term] = tid
+        max_count = max(max_count, len(pos))
+        rows.append((tid, len(pos), numpy.array(pos, dtype='<i4').tobytes()))
+    # years that aren't numbers (e.g. "18uu") or are missing are stored as NULL
+    year = corpus_index.to_year(jsondata.get("Year Published", jsondata.get("Date")))
+    doc_id = conn.execute("INSERT INTO documents (field_id, filename, mtime, year, length, max_count) "
+                          "VALUES (?, ?, ?, ?, ?, ?)", (fid, filename, mtime, year, len(text), max_count)).lastrowid
+    conn.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)", [(r[0], doc_id, r[1], r[2]) for r in rows])
+
+
+def remove_document(conn, doc_id):
+    conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+    conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+
+# brings the index for a field up to date with the documents on disk. returns
+# [number of documents (re)indexed, number of documents dropped].
+def update(directory, field):
+    conn = connect(directory)
+    with conn:
+        fid = field_id(conn, field)
+    on_disk = list_documents(directory)
+    indexed = {}
+    for doc_id, filename, mtime in conn.execute("SELECT id, filename, mtime FROM documents WHERE field_id = ?",
+                                                (fid,)):
+        indexed[filename] = [doc_id, mtime]
+    terms = dict(conn.execute("SELECT term, id FROM terms"))
+    added, removed = 0, 0
+    for filename, entry in indexed.items():
+        # modified documents are dropped here too, and re-indexed below
+        if on_disk.get(filename) != entry[1]:
+            with conn:
+                remove_document(conn, entry[0])
+            if filename not in on_disk:
+                removed += 1
+    for filename in sorted(on_disk):
+        entry = indexed.get(filename)
+        if entry is None or entry[1] != on_disk[filename]:
+            # one transaction per document, an interrupted update never leaves half a document behind
+            with conn:
+                add_document(conn, fid, terms, directory, filename, on_disk[filename], field)
+            added += 1
+    conn.close()
+    return [added, removed]
+
+
+class InvertedIndex:
+    def __init__(self, directory, field):
+        self.conn = connect(directory)
+        row = self.conn.execute("SELECT id FROM fields WHERE name = ?", (field,)).fetchone()
+        self.field_id = row[0] if row is not None else None
+        # filename -> [year, length, max count], and doc id -> filename
+        self.docs = {}
+        self.names = {}
+        for doc_id, filename, year, length, max_count in self.conn.execute(
+                "SELECT id, filename, year, length, max_count FROM documents WHERE field_id = ?", (self.field_id,)):
+            self.docs[filename] = [year, length, max_count]
+            self.names[doc_id] = filename
+
+    def lookup(self, term, columns):
+        return self.conn.execute("SELECT p.doc_id, {0} FROM postings p JOIN terms t ON p.term_id = t.id "
+                                 "JOIN documents d ON p.doc_id = d.id WHERE t.term = ? AND d.field_id = ?"
+                                 .format(columns), (term, self.field_id))
+
+    # filename -> number of occurrences, for every document containing term
+    def counts(self, term):
+        return dict((self.names[doc_id], count) for doc_id, count in self.lookup(term, "p.count"))
+
+    # filename -> sorted list of token positions, for every document containing term
+    def positions(self, term):
+        return dict((self.names[doc_id], numpy.frombuffer(pos, dtype='<i4').tolist())
+                    for doc_id, pos in self.lookup(term, "p.positions"))
+
+    # number of documents containing term
+    def doc_frequency(self, term):
+        return len(self.counts(term))
+
+    def close(self):
+        self.conn.close()
+
+
+# returns the index for a field if it exists and matches the documents on disk, otherwise None
+def open_index(directory, field):
+    if not os.path.exists(index_path(directory)):
+        return None
+    index = InvertedIndex(directory, field)
+    if index.field_id is None:
+        index.close()
+        return None
+    on_disk = list_documents(directory)
+    mtimes = dict(index.conn.execute("SELECT filename, mtime FROM documents WHERE field_id = ?", (index.field_id,)))
+    if mtimes != on_disk:
+        print("Inverted index for \"{0}\" is out of date, scanning documents instead. Run inverted_index.py "
+              "to update it.".format(field))
+        index.close()
+        return None
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", metavar='in-directory', action="store", help="corpus directory to index")
+    parser.add_argument("-type", help="text field to index", action="store")
+
+    try:
+        args = parser.parse_args()
+    except IOError:
+        pass
+
+    if args.i is None:
+        common.fail("Please specify input (-i) directory.")
+    if args.type is None:
+        common.fail("Please specify the text field (-type) to index.")
+
+    result = update(args.i, args.type)
+    print("Indexed {0} documents, dropped {1}.".format(str(result[0]), str(result[1])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import csv, re
+try:
+    import common
+except ImportError:
+    from nlp_scripts import common
+
+
+#                           *** metadata_join.py ***
+#
+# Joins parsed documents to their metadata (author, title, year) from a parser's csv file,
+# laid out as: source, author, title, year. The csv file is read once into a dict keyed on a
+# normalized form of the source column, and each document is then looked up by the same key
+# in constant time, rather than by scanning every row of the csv file:
+#
+#   german_xml_parser:      the volume's url, with normalize_url
+#   gutenberg_txt_parser:   the Project Gutenberg ebook number, with normalize_idno
+#
+
+
+# urls are matched without their scheme, trailing slashes or surrounding whitespace,
+# and with the host name in lower case
+def normalize_url(url):
+    url = url.strip()
+    url = re.sub("^[a-zA-Z]+://", "", url).rstrip("/")
+    parts = url.split("/", 1)
+    parts[0] = parts[0].lower()
+    return "/".join(parts)
+
+
+# ebook numbers are matched on their digits, without leading zeros
+def normalize_idno(idno):
+    digits = re.sub("[^0-9]", "", idno).lstrip("0")
+    return digits if digits != "" else None
+
+
+class MetadataTable:
+    # key turns the source column of a row into the string that is normalized & looked up
+    def __init__(self, csv_in, normalize, key=None):
+        self.normalize = normalize
+        self.rows = {}
+        with open(csv_in, 'r', encoding='utf-8') as csv_file:
+            read_csv = csv.reader(csv_file, delimiter=',')
+            for row in read_csv:
+                if len(row) < 4 or row[0] == 'source':
+                    continue
+                source = normalize(key(row[0]) if key is not None else row[0])
+                # the first row for a source wins, as it did when the csv was scanned in order
+                if source is not None and source not in self.rows:
+                    self.rows[source] = [row[1], row[2], row[3]]
+
+    # returns [author, title, year] for a document, or None if it isn't in the csv file
+    def lookup(self, source):
+        if source is None:
+            return None
+        return self.rows.get(self.normalize(source))
+
+    def __len__(self):
+        return len(self.rows)
+
+
+# same as lookup, but stops the run if the document isn't in the csv file
+def require(table, source):
+    found = table.lookup(source)
+    if found is None:
+        common.fail("Could not find {0} in the csv file.".format(str(source)))
+    return found
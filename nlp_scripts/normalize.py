@@ -0,0 +1,205 @@
+import bisect, re
+from nltk.stem.snowball import SnowballStemmer
+from nltk.corpus import stopwords
+from nlp_scripts import stem_cache
+
+
+# Single-pass normalization engine used by parsing_help. A document is split into
+# sentences and tokens once, and every field of a Parsed object (full, filtered,
+# stemmed & filtered stemmed, both as word lists and as sentences) is derived
+# from that one token stream. Stemmers and stopword sets are built once per
+# language and kept for the lifetime of the process.
+
+
+# same patterns used by parsing_help.add_content / parsing_help.clean_text
+sentence_split = re.compile('(?<=[.!?]) +')
+token_split = re.compile('\W[0-9]*')
+
+stemmers = {}
+stopword_sets = {}
+
+
+# returns the (shared) snowball stemmer for a language
+def get_stemmer(language):
+    try:
+        return stemmers[language]
+    except KeyError:
+        stemmers[language] = SnowballStemmer(language)
+        return stemmers[language]
+
+
+# returns the (shared) stopword set for a language
+def get_stopwords(language):
+    try:
+        return stopword_sets[language]
+    except KeyError:
+        stopword_sets[language] = frozenset(stopwords.words(language))
+        return stopword_sets[language]
+
+
+# helper for tokenize, adds the piece of text between two token delimiters
+# to the full token list and to the token list of the sentence it sits in.
+def add_piece(text, start, end, starts, b, tokens, sentences, positions):
+    piece = text[start:end]
+    if piece != "" and piece != "None":
+        tokens.append(piece.lower())
+        if positions is not None:
+            positions.append(start)
+    sentence_piece = piece
+    while b < len(starts) and start >= starts[b]:
+        # first piece of a new sentence. when the sentence is tokenized on its own,
+        # any digits at its start are kept as part of the first token, whereas in
+        # the full text they are swallowed by the delimiter before them.
+        sentences.append([])
+        sentence_piece = text[starts[b]:end]
+        b += 1
+    if sentence_piece != "" and sentence_piece != "None":
+        sentences[-1].append(sentence_piece.lower())
+    return b
+
+
+# splits text into sentences & tokens in a single regex pass. returns the token list
+# for the full text along with the token list of each sentence, identical to running
+# clean_text on the whole text and on each sentence separately. sentence starts can be
+# passed in if they're already known, and the position of each token in text is added
+# to positions if it's given a list.
+def tokenize(text, starts=None, positions=None):
+    if starts is None:
+        starts = [m.end() for m in sentence_split.finditer(text)]
+    tokens = []
+    sentences = [[]]
+    b = 0
+    prev = 0
+    for m in token_split.finditer(text):
+        b = add_piece(text, prev, m.start(), starts, b, tokens, sentences, positions)
+        prev = m.end()
+    add_piece(text, prev, len(text), starts, b, tokens, sentences, positions)
+    return [tokens, sentences]
+
+
+# stems a list of words. each distinct word is looked up once per document, first
+# in the document's own dict and then in the process-wide stem cache.
+def stem_words(words, language, stems):
+    stemmer = get_stemmer(language)
+    cache = stem_cache.cache
+    stemmed = []
+    for word in words:
+        try:
+            stemmed.append(stems[word])
+        except KeyError:
+            stem = cache.stem(language, word, stemmer)
+            stems[word] = stem
+            stemmed.append(stem)
+    return stemmed
+
+
+# derives all eight Parsed fields from a single token stream and adds them to file
+def add_tokens(tokens, sentences, file, language):
+    filtered_words = get_stopwords(language)
+    stems = {}
+    for sentence in sentences:
+        if len(sentence) > 1:
+            sentence_stemmed = stem_words(sentence, language, stems)
+            file.add_content_sent(" ".join(sentence))
+            file.add_stemmed_sent(" ".join(sentence_stemmed))
+            keep = [word not in filtered_words for word in sentence]
+            if sum(keep) > 1:
+                file.add_filtered_sent(" ".join([w for w, k in zip(sentence, keep) if k]))
+                file.add_filtered_stemmed_sent(" ".join([s for s, k in zip(sentence_stemmed, keep) if k]))
+    stemmed = stem_words(tokens, language, stems)
+    keep = [word not in filtered_words for word in tokens]
+    file.add_content(tokens)
+    file.add_stemmed(stemmed)
+    file.add_filtered([w for w, k in zip(tokens, keep) if k])
+    file.add_filtered_stemmed([s for s, k in zip(stemmed, keep) if k])
+
+
+# tokenizes text once and adds every normalized field to file
+def add_text(text, file, language):
+    tokens, sentences = tokenize(text)
+    add_tokens(tokens, sentences, file, language)
+
+
+# add_text for a document made up of blocks of text (paragraphs, lines of verse, etc.), which are
+# joined by separator and normalized in one pass. each block starts a new sentence, so sentences
+# never run from one block into the next.
+def add_blocks(blocks, file, language, separator=" "):
+    text = separator.join(blocks)
+    starts = set(m.end() for m in sentence_split.finditer(text))
+    offset = 0
+    for block in blocks[:-1]:
+        offset += len(block) + len(separator)
+        starts.add(offset)
+    tokens, sentences = tokenize(text, sorted(starts))
+    add_tokens(tokens, sentences, file, language)
+
+
+# Incremental version of add_text for documents that are read in pieces, e.g. the pages of a
+# HathiTrust volume. Pieces are joined by separator, and only complete sentences are tokenized
+# as they come in; the unfinished sentence at the end of a piece is held back until the next
+# one. The fields added to file are the same as calling add_text once on the joined text,
+# without ever building that text. finish() returns the offset of each piece in the document's
+# full token list (file.c).
+class TextStream:
+    def __init__(self, file, language, separator="\n"):
+        self.file = file
+        self.language = language
+        self.separator = separator
+        # text held back & its position in the joined text. once a sentence has been cut off,
+        # pending starts with the delimiter before the next sentence, which starts at index 1.
+        self.pending = None
+        self.position = 0
+        self.first = None
+        # tokens added so far, and the joined text positions of pieces not yet placed in them
+        self.tokens = len(file.c)
+        self.marks = []
+        self.offsets = []
+
+    # sentence starts in text, searching from index start on (earlier ones are already known)
+    def sentence_starts(self, text, start):
+        starts = [m.end() for m in sentence_split.finditer(text, start)]
+        if self.first is not None:
+            starts.insert(0, self.first)
+        return starts
+
+    def add(self, text):
+        if self.pending is None:
+            start = 0
+        else:
+            start = len(self.pending)
+            text = self.pending + self.separator + text
+        self.marks.append(self.position + start + (len(self.separator) if self.pending is not None else 0))
+        starts = self.sentence_starts(text, start)
+        if len(starts) == 0 or starts[-1] == self.first:
+            # no new sentence starts yet, keep the whole thing for the next piece
+            self.pending = text
+            return
+        cut = starts[-1]
+        self.add_tokens(text[:cut], starts)
+        # keep the delimiter before the last sentence, so its first token is split off
+        # exactly as it would be in the joined text
+        self.pending = text[cut - 1:]
+        self.position += cut - 1
+        self.first = 1
+
+    # tokenizes a finished stretch of the joined text, and works out the token offsets of
+    # any pieces starting within it
+    def add_tokens(self, text, starts):
+        positions = []
+        tokens, sentences = tokenize(text, starts, positions)
+        end = self.position + len(text)
+        while len(self.marks) > 0 and self.marks[0] < end:
+            self.offsets.append(self.tokens + bisect.bisect_left(positions, self.marks[0] - self.position))
+            self.marks.pop(0)
+        self.tokens += len(tokens)
+        add_tokens(tokens, sentences, self.file, self.language)
+
+    def finish(self):
+        if self.pending is not None:
+            self.add_tokens(self.pending, self.sentence_starts(self.pending, len(self.pending)))
+            self.pending = None
+        # pieces that start after the last token
+        for mark in self.marks:
+            self.offsets.append(self.tokens)
+        self.marks = []
+        return self.offsets
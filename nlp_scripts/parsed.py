@@ -19,6 +19,8 @@ class Parsed:
         self.tx_sent = []
         self.cstem_sent = []
         self.txstem_sent = []
+        # offset of each page in c, for documents read page by page
+        self.pg = []
 
     def add_content_sent(self, text):
         self.c_sent.append(text)
@@ -1,6 +1,5 @@
 import json, re
-from nltk.stem.snowball import SnowballStemmer
-from nltk.corpus import stopwords
+from nlp_scripts import normalize
 
 
 # gathers all info from parsing functions and builds
@@ -24,13 +23,15 @@ def build_json(file):
     file.p = file.p.replace("\n", " ")
     file.d = file.d.replace("\n", " ")
     file.ch = filter_chapters(file.ch)
-    jfile = json.dumps({'Title': file.t, 'Author': file.a, 'Publisher': file.p, 'Year Published': file.y,
-                        'ISBN': file.i, 'Document Type': file.d, 'List of chapters': file.ch, 'HTID': file.h,
-                        'Full Text': file.c, 'Full Text Stemmed': file.cstem, 'Filtered Text': file.tx,
-                        'Filtered Text Stemmed': file.txstem, 'Full Sentences': file.c_sent,
-                        'Filtered Sentences': file.tx_sent, 'Stemmed Sentences': file.cstem_sent,
-                        'Filtered Stemmed Sentences': file.txstem_sent, 'URL': file.url},
-                       sort_keys=True, indent=4, separators=(',', ': '), ensure_ascii=False)
+    fields = {'Title': file.t, 'Author': file.a, 'Publisher': file.p, 'Year Published': file.y,
+              'ISBN': file.i, 'Document Type': file.d, 'List of chapters': file.ch, 'HTID': file.h,
+              'Full Text': file.c, 'Full Text Stemmed': file.cstem, 'Filtered Text': file.tx,
+              'Filtered Text Stemmed': file.txstem, 'Full Sentences': file.c_sent,
+              'Filtered Sentences': file.tx_sent, 'Stemmed Sentences': file.cstem_sent,
+              'Filtered Stemmed Sentences': file.txstem_sent, 'URL': file.url}
+    if len(file.pg) > 0:
+        fields['Page Offsets'] = file.pg
+    jfile = json.dumps(fields, sort_keys=True, indent=4, separators=(',', ': '), ensure_ascii=False)
     return jfile
 
 
@@ -47,32 +48,10 @@ def filter_chapters(chapters):
 # helper function to write to a file object. if you want to add more fields
 # (lemmatization, etc.) to a Parsed object, you just need to define it in the
 # class definition above, write the method(s) for building it, and add it to
-# this method along with the build_json method above.
+# normalize.add_tokens along with the build_json method above. the text is
+# tokenized once and all fields are derived from that single token stream.
 def add_content(text, file, language):
-    sentences = re.split('(?<=[.!?]) +', text)
-    for sentence in sentences:
-        sentence = clean_text(sentence)
-        if len(sentence) > 1:
-            file.add_content_sent(" ".join(sentence))
-            sentence_stemmed = stem_text(sentence, language)
-            file.add_stemmed_sent(" ".join(sentence_stemmed))
-            sentence_filtered = filter_text(sentence, language)
-            if len(sentence_filtered) > 1:
-                file.add_filtered_sent(" ".join(sentence_filtered))
-                sentence_filtered_stemmed = stem_text(sentence_filtered, language)
-                file.add_filtered_stemmed_sent(" ".join(sentence_filtered_stemmed))
-    text_list = clean_text(text)
-    # full text
-    file.add_content(text_list)
-    # stem the full text
-    stemmed = stem_text(text_list, language)
-    file.add_stemmed(stemmed)
-    # filter the unstemmed full text
-    filtered = filter_text(text_list, language)
-    file.add_filtered(filtered)
-    # stem the filtered text
-    filtered_stemmed = stem_text(filtered, language)
-    file.add_filtered_stemmed(filtered_stemmed)
+    normalize.add_text(text, file, language)
 
 
 # helper function to write to a file object, same as above but for xml parsing
@@ -83,30 +62,7 @@ def add_xml_content(root, file, language):
     if str(root.tail) != 'None':
         text += ' ' + root.tail
     if text != '':
-        sentences = re.split('(?<=[.!?]) +', text)
-        for sentence in sentences:
-            sentence = clean_text(sentence)
-            if len(sentence) > 1:
-                file.add_content_sent(" ".join(sentence))
-                sentence_stemmed = stem_text(sentence, language)
-                file.add_stemmed_sent(" ".join(sentence_stemmed))
-                sentence_filtered = filter_text(sentence, language)
-                if len(sentence_filtered) > 1:
-                    file.add_filtered_sent(" ".join(sentence_filtered))
-                    sentence_filtered_stemmed = stem_text(sentence_filtered, language)
-                    file.add_filtered_stemmed_sent(" ".join(sentence_filtered_stemmed))
-        text_list = clean_text(text)
-        # full text
-        file.add_content(text_list)
-        # stem the full text
-        stemmed = stem_text(text_list, language)
-        file.add_stemmed(stemmed)
-        # filter the unstemmed full text
-        filtered = filter_text(text_list, language)
-        file.add_filtered(filtered)
-        # stem the filtered text
-        filtered_stemmed = stem_text(filtered, language)
-        file.add_filtered_stemmed(filtered_stemmed)
+        normalize.add_text(text, file, language)
 
 
 # converts all letters to lowercase, removes non-alphabetic characters, removes empty strings
@@ -125,7 +81,7 @@ def clean_text(text):
 
 # removes stop words from a text
 def filter_text(text_list, language):
-    filtered_words = set(stopwords.words(language))
+    filtered_words = normalize.get_stopwords(language)
     # Loop backwards because delete changes index
     for i in range(len(text_list) - 1, -1, -1):
         # Delete empty strings or stopwords
@@ -137,7 +93,7 @@ def filter_text(text_list, language):
 # soop through filtered text and stem all the words
 def stem_text(text_list, language):
     # init stemmer & array to store stemmed words
-    stemmer = SnowballStemmer(language)
+    stemmer = normalize.get_stemmer(language)
     stemmed = []
     for word in text_list:
         stemmed.append(stemmer.stem(word))
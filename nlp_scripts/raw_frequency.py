@@ -1,10 +1,15 @@
-import json, csv, argparse, os, tqdm, nltk, operator
-import common
+import csv, argparse, os, tqdm, nltk, operator
+import common, doc_reader, inverted_index
 
 
 # take either 0/1 occurrence values on snippets or word frequencies
 # on fulltext files, method depends on value of text_type
 def take_frequencies(corpus, keywords, text_type, binary):
+    index = inverted_index.open_index(corpus, text_type)
+    if index is not None:
+        frequencies = index_frequencies(corpus, index, keywords, binary)
+        index.close()
+        return frequencies
     for subdir, dirs, files in os.walk(corpus):
         frequencies = []
         if text_type == 'Words':
@@ -13,41 +18,71 @@ def take_frequencies(corpus, keywords, text_type, binary):
             print("Building Frequency Tables\n")
         for jsondoc in tqdm.tqdm(files):
             if jsondoc[0] != ".":
-                with open(corpus + "/" + jsondoc, 'r', encoding='utf8') as in_file:
-                    jsondata = json.load(in_file)
-                    name = jsondoc
+                jsondata = doc_reader.read_document(corpus + "/" + jsondoc, [text_type])
+                name = jsondoc
 
-                    try:
-                        year = jsondata["Year Published"]
-                    except KeyError:
-                        year = jsondata["Date"]
+                try:
+                    year = jsondata["Year Published"]
+                except KeyError:
+                    year = jsondata["Date"]
 
-                    row = [name, year]
-                    # take 0/1 occurrences on snippet files
-                    if binary:
-                        text = set(jsondata[text_type])
-                        for keyword in keywords:
-                            if keyword in text:
-                                row.append("1")
-                            else:
-                                row.append("0")
-                        frequencies.append(row)
-                    # take keyword frequencies on fulltext files
-                    else:
-                        text = set(jsondata[text_type])
-                        length = len(jsondata[text_type])
-                        fulltext = jsondata[text_type]
-                        fdist = nltk.FreqDist(fulltext)
-                        for keyword in keywords:
-                            if keyword in text:
-                                row.append(str(fdist[keyword]))
-                            else:
-                                row.append("0")
-                        row.append(length)
-                        frequencies.append(row)
+                row = [name, year]
+                # take 0/1 occurrences on snippet files
+                if binary:
+                    text = set(jsondata[text_type])
+                    for keyword in keywords:
+                        if keyword in text:
+                            row.append("1")
+                        else:
+                            row.append("0")
+                    frequencies.append(row)
+                # take keyword frequencies on fulltext files
+                else:
+                    text = set(jsondata[text_type])
+                    length = len(jsondata[text_type])
+                    fulltext = jsondata[text_type]
+                    fdist = nltk.FreqDist(fulltext)
+                    for keyword in keywords:
+                        if keyword in text:
+                            row.append(str(fdist[keyword]))
+                        else:
+                            row.append("0")
+                    row.append(length)
+                    frequencies.append(row)
         return frequencies
 
 
+# same as above, but keyword counts & text lengths come from the corpus' inverted index
+def index_frequencies(corpus, index, keywords, binary):
+    print("Building Tables from the inverted index\n")
+    postings = {}
+    for keyword in keywords:
+        postings[keyword] = index.counts(keyword)
+    frequencies = []
+    # same document order as os.walk above, so rows with equal years sort the same way
+    for jsondoc in os.listdir(corpus):
+        if jsondoc[0] != ".":
+            year, length = index.docs[jsondoc][0], index.docs[jsondoc][1]
+            # years are written as text, so that every row sorts the same way. a year the index holds
+            # as NULL (not a number, e.g. "18uu", or missing) is taken from the document's own field.
+            if year is not None:
+                year = str(year)
+            else:
+                jsondata = doc_reader.read_document(corpus + "/" + jsondoc, [])
+                year = str(jsondata.get("Year Published", jsondata.get("Date", "")))
+            row = [jsondoc, year]
+            for keyword in keywords:
+                count = postings[keyword].get(jsondoc, 0)
+                if binary:
+                    row.append("1" if count > 0 else "0")
+                else:
+                    row.append(str(count))
+            if not binary:
+                row.append(length)
+            frequencies.append(row)
+    return frequencies
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", metavar='in-directory', action="store", help="input directory argument")
@@ -0,0 +1,110 @@
+import os, pickle
+from collections import OrderedDict
+try:
+    import build_manifest
+except ImportError:
+    from nlp_scripts import build_manifest
+
+
+# Bounded stem cache shared by the parsing pipeline. Stems are keyed by
+# (language, word), evicted least-recently-used first, and can be saved to /
+# loaded from disk so that later parser runs start warm. When parsing with a
+# multiprocessing Pool, the parent loads the table once and hands it to every
+# worker through init_worker; each task then returns the stems it had to compute
+# (see drain) so the parent can merge them back in and persist them.
+
+
+default_size = 1000000
+
+
+class StemCache:
+    def __init__(self, max_size=default_size, track_new=False):
+        self.max_size = max_size
+        self.track_new = track_new
+        self.table = OrderedDict()
+        self.new = {}
+        self.hits = 0
+        self.misses = 0
+
+    def stem(self, language, word, stemmer):
+        key = (language, word)
+        try:
+            stem = self.table[key]
+            self.table.move_to_end(key)
+            self.hits += 1
+        except KeyError:
+            stem = stemmer.stem(word)
+            self.misses += 1
+            self.add(key, stem)
+            if self.track_new:
+                self.new[key] = stem
+        return stem
+
+    def add(self, key, stem):
+        self.table[key] = stem
+        self.table.move_to_end(key)
+        if len(self.table) > self.max_size:
+            self.table.popitem(last=False)
+
+    # add a batch of (language, word) -> stem entries, e.g. ones returned by a worker
+    def update(self, entries):
+        for key, stem in entries.items():
+            self.add(key, stem)
+
+    # returns entries in least -> most recently used order
+    def snapshot(self):
+        return list(self.table.items())
+
+    def stats(self):
+        return "Stem cache: {0} hits, {1} misses, {2} entries" \
+            .format(str(self.hits), str(self.misses), str(len(self.table)))
+
+
+# process-wide cache used by normalize.stem_words
+cache = StemCache()
+
+
+# load a cache file saved by save(). a missing file just means a cold start.
+def load(path, max_size=default_size):
+    global cache
+    cache = StemCache(max_size)
+    if path is not None and os.path.exists(path):
+        with open(path, 'rb') as cache_in:
+            for key, stem in pickle.load(cache_in):
+                cache.add(key, stem)
+    return cache
+
+
+# write the cache to disk, via a temp file so a crash never leaves half a cache behind (and two runs
+# saving to the same path never share a temp file)
+def save(path):
+    if path is None:
+        return
+    build_manifest.write_atomic(path, pickle.dumps(cache.snapshot(), protocol=pickle.HIGHEST_PROTOCOL))
+
+
+# Pool initializer, seeds each worker with the table prebuilt by the parent
+def init_worker(table, max_size=default_size):
+    global cache
+    cache = StemCache(max_size, track_new=True)
+    for key, stem in table:
+        cache.add(key, stem)
+
+
+# returns what this process learned since the last call (new stems plus hit / miss
+# counts) and resets it. pool tasks return this so the parent can merge it.
+def drain():
+    result = [cache.new, cache.hits, cache.misses]
+    cache.new = {}
+    cache.hits = 0
+    cache.misses = 0
+    return result
+
+
+# merge the output of drain() from a worker into this process's cache
+def merge(result):
+    if result is None:
+        return
+    cache.update(result[0])
+    cache.hits += result[1]
+    cache.misses += result[2]
@@ -1,4 +1,4 @@
-import common, json, argparse, os
+import common, doc_reader, argparse, os
 from gensim import corpora, models
 from shutil import copyfile
 
@@ -9,47 +9,46 @@ def filter_by_threshold(thresh, score):
     return False
 
 
-def filter_tfidf(keywords, dictionary, in_dir, out_dir, tfidf_model, text_type, thresh):
-    for subdir, dirs, files in os.walk(in_dir):
-        for jf in files:
-            if jf[0] != ".":
-                text = extract_text(in_dir + jf, text_type)
-                docbow = dictionary.doc2bow(text)
-                for keyword in keywords:
-                    words = keyword.split("/")
-                    # abstract all this into another method, doing too much
-                    for w in words:
-                        if w in set(text):
-                            w_id = dictionary.token2id[w]
-                            tfidf = tfidf_model[docbow]
-                            copied = False
-                            if not copied:
-                                for score in tfidf:
-                                    if score[0] == w_id:
-                                        # check against threshold, copy if above
-                                        if filter_by_threshold(thresh, score[1]):
-                                            copied = True
-                                            copyfile(in_dir + jf, out_dir + keyword + '/' + jf)
-                                            # only want one copy, break to next keyword
+# copies each document whose tf-idf score for one of a keyword's words clears the threshold.
+# works from the bag-of-words built for the model, so no document is read a second time.
+def filter_tfidf(keywords, dictionary, corpus, names, in_dir, out_dir, tfidf_model, thresh):
+    for jf, docbow in zip(names, corpus):
+        doc_ids = set(w_id for w_id, count in docbow)
+        tfidf = None
+        for keyword in keywords:
+            words = keyword.split("/")
+            for w in words:
+                w_id = dictionary.token2id.get(w)
+                # check if word occurs in document
+                if w_id in doc_ids:
+                    if tfidf is None:
+                        # only score documents that contain a keyword, and only once
+                        tfidf = tfidf_model[docbow]
+                    for score in tfidf:
+                        if score[0] == w_id:
+                            # check against threshold, copy if above
+                            if filter_by_threshold(thresh, score[1]):
+                                copyfile(in_dir + jf, out_dir + keyword + '/' + jf)
 
 
 def extract_text(jf, text_type):
-    with open(jf, 'r', encoding='utf-8') as in_j:
-        jsondata = json.load(in_j)
-        text = jsondata[text_type]
+    jsondata = doc_reader.read_document(jf, [text_type])
+    text = jsondata[text_type]
     return text
 
 
 def construct_dictionary_and_corpus(in_dir, text_type):
     dictionary = corpora.Dictionary()
     corpus = []
+    names = []
     for subdir, dirs, files in os.walk(in_dir):
         for jf in files:
             if jf[0] != ".":
                 text = extract_text(in_dir + jf, text_type)
                 dictionary.add_documents([text])
                 corpus.append(dictionary.doc2bow(text))
-    return [dictionary, corpus]
+                names.append(jf)
+    return [dictionary, corpus, names]
 
 
 def determine_text_type(text_type):
@@ -107,7 +106,7 @@ def main():
     key_list, text_type, thresh = in_args[0], in_args[1], in_args[2]
 
     model_params = construct_dictionary_and_corpus(args.i, text_type)
-    dictionary, corpus = model_params[0], model_params[1]
+    dictionary, corpus, names = model_params[0], model_params[1], model_params[2]
     # TODO: make this configurable
     '''
     dictionary.save('/tmp/dictionary.dict')
@@ -116,7 +115,7 @@ def main():
 
     tfidf = models.TfidfModel(corpus)
 
-    filter_tfidf(key_list, dictionary, args.i, args.o, tfidf, text_type, thresh)
+    filter_tfidf(key_list, dictionary, corpus, names, args.i, args.o, tfidf, thresh)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,79 @@
+import xml.etree.ElementTree as ET
+
+
+#                           *** xml_stream.py ***
+#
+# Streaming XML reader shared by the parsers. Rather than building the whole tree with
+# ET.parse and walking it once per field (text, title, author, ISBN, etc.), a parser passes
+# select() a function that looks at the tags of each element as it opens (along with those
+# of its ancestors) and picks out the elements it wants. Each picked element is handed back once its subtree (and
+# its tail text) is complete, in document order, and everything that isn't needed any more
+# is dropped from the tree as the file is read. Memory use then depends on the size of the
+# largest picked element rather than on the size of the document.
+#
+
+
+# returns the index of the first tag in tags[start:] that contains any of the given words, or -1
+def first_match(tags, words, start=0):
+    for i in range(start, len(tags)):
+        for word in words:
+            if word in tags[i]:
+                return i
+    return -1
+
+
+# detaches a finished element from the tree, so that it can be freed
+def release(elem, parent):
+    elem.clear()
+    if parent is not None:
+        parent.remove(elem)
+
+
+# yields (element, match result) for every element for which match(tags) returns something
+# truthy, where tags is the tuple of tags of the open elements, from the root down to the
+# element. match only sees tags, so its results are cached for each distinct path. the
+# element is yielded after its end tag, once its tail text has been read, with its whole
+# subtree in place. elements nested in a picked element are yielded before it. everything
+# outside of picked elements is cleared as soon as it closes, picked elements once they've
+# been yielded.
+def select(path, match):
+    stack = []
+    # tag paths & match results for the open elements, and the number of those that were picked
+    paths = [()]
+    found = []
+    picked = 0
+    results = {}
+    # closed, picked elements waiting for their tail: [element, match result, parent, keep]
+    pending = []
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        # any new event means the tail of the last closed element has been read
+        for entry in pending:
+            yield entry[0], entry[1]
+            if not entry[3]:
+                release(entry[0], entry[2])
+        pending = []
+        if event == "start":
+            tags = paths[-1] + (elem.tag,)
+            try:
+                result = results[tags]
+            except KeyError:
+                result = match(tags)
+                results[tags] = result
+            stack.append(elem)
+            paths.append(tags)
+            found.append(result)
+            if result:
+                picked += 1
+        else:
+            stack.pop()
+            paths.pop()
+            result = found.pop()
+            parent = stack[-1] if len(stack) > 0 else None
+            if result:
+                picked -= 1
+                # elements inside a picked element stay in place until that one is done
+                pending.append([elem, result, parent, picked > 0])
+            elif picked == 0:
+                release(elem, parent)
+    for entry in pending:
+        yield entry[0], entry[1]
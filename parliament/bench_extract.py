@@ -0,0 +1,89 @@
+'''
+    bench_extract.py
+
+    Checks extract.sitting against parliament.extract_sitting (BeautifulSoup) on recorded sitting
+    pages, and times the two. The sittings to use and their titles are read from a save directory's
+    progress.db, and their pages from a directory of pages recorded with parliament.py --record_dir.
+
+        $ python parliament.py --record_dir recorded/ --save_dir test/ --start_year 1803 --end_year 1803
+        $ python bench_extract.py --save_dir test/ --record_dir recorded/
+'''
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+try:
+    import extract
+    import fetch
+    import parliament
+except ImportError:
+    from parliament import extract, fetch, parliament
+
+
+# (url, title, page) of every sitting in the save directory that was recorded
+def load_pages(save_dir, record_dir):
+    db = sqlite3.connect('file:{0}?mode=ro'.format(os.path.join(save_dir, 'chkpt', 'progress.db')), uri=True)
+    pages = []
+    for url, title in db.execute("SELECT url, title FROM pages WHERE kind = 'sitting' ORDER BY date, rowid"):
+        try:
+            with open(fetch.recorded_path(record_dir, urlsplit(url).path), 'rb') as page:
+                pages.append((url, title, page.read()))
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            continue
+    db.close()
+    return pages
+
+
+def with_tree(url, title, body):
+    return parliament.tree_sitting(title, url, body)
+
+
+def single_pass(url, title, body):
+    return extract.sitting(title, url, body)
+
+
+# Best time over repeat runs of func on every page, and what it returned on the last run
+def timed(func, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [func(*page) for page in pages]
+        elapsed = time.perf_counter() - start
+        if best == None or elapsed < best:
+            best = elapsed
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--save_dir', type=str, default='save/', help='Save directory with the progress.db to read.')
+    parser.add_argument('--record_dir', type=str, default='recorded/', help='Directory of recorded pages.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times to time each extractor.')
+    args = parser.parse_args()
+
+    pages = load_pages(args.save_dir, args.record_dir)
+    if len(pages) == 0:
+        raise Exception('main(): no recorded sitting pages found')
+    size = sum(len(page[2]) for page in pages)
+    print('{0} sitting pages, {1:.1f} MB'.format(len(pages), size / 1e6))
+
+    tree_time, expected = timed(with_tree, pages, args.repeat)
+    pass_time, results = timed(single_pass, pages, args.repeat)
+
+    mismatches = [page[0] for page, a, b in zip(pages, expected, results)
+                  if json.dumps(a, sort_keys=True) != json.dumps(b, sort_keys=True)]
+    for url in mismatches:
+        print('Mismatch:', url)
+
+    for name, elapsed in (('BeautifulSoup tree', tree_time), ('single pass', pass_time)):
+        print('{0:>18}: {1:.3f}s, {2:.1f} pages/s, {3:.1f} MB/s'.format(
+            name, elapsed, len(pages) / elapsed, size / 1e6 / elapsed))
+    print('Speedup: {0:.2f}x, {1} mismatches'.format(tree_time / pass_time, len(mismatches)))
+
+
+if __name__ == "__main__":
+    main()
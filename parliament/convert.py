@@ -1,8 +1,15 @@
-from nlp_scripts import parsing_help, parsed, common
-import argparse, os, json
+from nlp_scripts import build_manifest, parsing_help, parsed, common, corpus_format, corpus_index, stem_cache
+import argparse, os, json, time, tqdm
 from multiprocessing import Pool
 
 
+# Title index of an input directory (.title_index.json, skipped when listing sittings like any other
+# dotfile): sitting filename -> [size, mtime, title], where the title is the first line of the sitting's
+# header. With -k, sittings are matched against the index, so only the matching ones are opened to be
+# parsed, and only sittings that are new or changed since the last run are read to update it.
+title_index_file = ".title_index.json"
+
+
 # assumes yyyy-mm-dd type input
 def parse_date(year_string):
     date = year_string.split('-')[0]
@@ -24,29 +31,91 @@ def parse_title(title, keywords):
     return False
 
 
-def parse_threaded(in_doc, in_dir, out_dir, keywords):
-    with open(in_dir + in_doc, 'r', encoding='utf-8') as jf:
-        jsondata = json.load(jf)
-        if not parse_all:
-            header = jsondata['content']['header'][0]
-            if parse_title(header, keywords):
-                obj = parsed.Parsed()
-                obj.y = parse_date(jsondata['date'])
-                obj.url = jsondata['url']
-                obj.a = jsondata['author']
-                parse_content(jsondata['content']['text'], obj)
-                with open(out_dir + in_doc[:-2] + 'json', 'w', encoding='utf-8') as out:
-                    out.write(parsing_help.build_json(obj))
-                    out.close()
+# Pool initializer (called directly for a serial run, without a stem table), hands each worker the
+# directories & language, and seeds its stem cache with the table prebuilt by the parent
+def init_worker(in_dir, out_dir, lang, stems=None):
+    global input_dir, output_dir, language
+    input_dir, output_dir, language = in_dir, out_dir, lang
+    if stems is not None:
+        stem_cache.init_worker(stems)
+
+
+def load_sitting(in_doc):
+    with open(os.path.join(input_dir, in_doc), 'r', encoding='utf-8') as jf:
+        return json.load(jf)
+
+
+# first line of a sitting's header, or '' if it has none
+def sitting_title(jsondata):
+    header = jsondata['content']['header']
+    return header[0] if len(header) > 0 else ''
+
+
+def parse_sitting(in_doc):
+    jsondata = load_sitting(in_doc)
+    obj = parsed.Parsed()
+    obj.y = parse_date(jsondata['date'])
+    obj.url = jsondata['url']
+    obj.a = jsondata['author']
+    parse_content(jsondata['content']['text'], obj)
+    with open(os.path.join(output_dir, in_doc[:-2] + 'json'), 'w', encoding='utf-8') as out:
+        out.write(parsing_help.build_json(obj))
+    return corpus_index.parsed_row(in_doc[:-2] + 'json', obj)
+
+
+# parses a batch of sittings in one task, so that the cost of handing work to a worker is shared by
+# many small files. hands the index rows & newly computed stems back to the parent process.
+def parse_batch(in_docs):
+    rows = [parse_sitting(in_doc) for in_doc in in_docs]
+    return [rows, stem_cache.drain()]
+
+
+def read_titles(in_docs):
+    return [[in_doc, sitting_title(load_sitting(in_doc))] for in_doc in in_docs]
+
+
+def batches(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# filename -> [size, mtime] of every sitting in the input directory
+def list_sittings(in_dir):
+    sittings = {}
+    for entry in os.scandir(in_dir):
+        if entry.name[0] != "." and entry.is_file():
+            stat = entry.stat()
+            sittings[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return sittings
+
+
+def load_title_index(in_dir):
+    try:
+        with open(os.path.join(in_dir, title_index_file), 'r', encoding='utf-8') as index_in:
+            return json.load(index_in)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+# brings the title index of in_dir up to date with the sittings in it, reading the titles of new or
+# changed sittings with run_batches, and returns it
+def update_title_index(in_dir, sittings, run_batches, size):
+    old = load_title_index(in_dir)
+    index = {}
+    stale = []
+    for in_doc, stat in sittings.items():
+        entry = old.get(in_doc)
+        if entry is not None and entry[:2] == stat:
+            index[in_doc] = entry
         else:
-            obj = parsed.Parsed()
-            obj.y = parse_date(jsondata['date'])
-            obj.url = jsondata['url']
-            obj.a = jsondata['author']
-            parse_content(jsondata['content']['text'], obj)
-            with open(out_dir + in_doc[:-2] + 'json', 'w', encoding='utf-8') as out:
-                out.write(parsing_help.build_json(obj))
-                out.close()
+            stale.append(in_doc)
+    for result in run_batches(read_titles, batches(sorted(stale), size)):
+        for in_doc, title in result:
+            index[in_doc] = sittings[in_doc] + [title]
+    if len(stale) > 0 or len(index) != len(old):
+        build_manifest.write_atomic(os.path.join(in_dir, title_index_file), json.dumps(index, ensure_ascii=False))
+    print("Title index: {0} sittings, {1} read.".format(str(len(index)), str(len(stale))))
+    return index
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -54,16 +123,18 @@ def main():
     parser.add_argument("-o", help="output directory", action="store")
     parser.add_argument("-lang", help="language", action="store")
     parser.add_argument("-k", help="keywords in title", action="store")
+    parser.add_argument("-binary", help="convert the output to the compact binary corpus format", action="store_true")
+    parser.add_argument("-stem_cache", help="path to stem cache file, loaded if present and saved after the run",
+                        action="store")
+    parser.add_argument("-workers", help="number of processes to parse sittings with, defaults to the number of "
+                                         "cores", action="store")
+    parser.add_argument("-batch", help="number of sittings handed to a worker at a time", action="store")
 
     try:
         args = parser.parse_args()
     except IOError:
         pass
 
-    global language, parse_all
-
-    parse_all = False
-
     if args.i is None:
         common.fail("Please specify input (-i) directory.")
     if args.lang is None:
@@ -75,21 +146,51 @@ def main():
         keywords = set(args.k.split("/"))
     else:
         keywords = None
-        parse_all = True
 
     common.build_out(args.o)
 
-    thread_files = []
-
-    for subdir, dirs, files in os.walk(args.i):
-        for jf in files:
-            if jf[0] != ".":
-                thread_files.append((jf, args.i, args.o, keywords))
-
-    pool = Pool()
-    pool.starmap(parse_threaded, thread_files)
-    pool.close()
-    pool.join()
+    sittings = list_sittings(args.i)
+    workers = int(args.workers) if args.workers is not None else os.cpu_count()
+    # sittings are tiny files, so they go out in larger batches than documents do in the other parsers
+    size = int(args.batch) if args.batch is not None else common.chunk_size(len(sittings), workers, 256)
+
+    # workers share the stem table loaded here rather than each building their own
+    stem_cache.load(args.stem_cache)
+    start = time.time()
+    pool = None
+    if workers <= 1:
+        init_worker(args.i, args.o, language)
+        run_batches = map
+    else:
+        pool = Pool(workers, initializer=init_worker,
+                    initargs=(args.i, args.o, language, stem_cache.cache.snapshot()))
+        run_batches = pool.imap
+
+    if keywords is not None:
+        # only the sittings whose title matches are ever opened to be parsed
+        index = update_title_index(args.i, sittings, run_batches, size)
+        in_docs = sorted(in_doc for in_doc, entry in index.items() if parse_title(entry[2], keywords))
+    else:
+        in_docs = sorted(sittings)
+
+    # results come back in order, and each batch's index rows are written as soon as it is done
+    parsed_docs = 0
+    for rows, stems in tqdm.tqdm(run_batches(parse_batch, batches(in_docs, size)),
+                                 total=(len(in_docs) + size - 1) // size):
+        stem_cache.merge(stems)
+        corpus_index.write_rows(args.o, rows)
+        parsed_docs += len(rows)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start
+    print("Parsed {0} of {1} sittings in {2:.2f}s ({3:.1f} sittings/s)."
+          .format(str(parsed_docs), str(len(sittings)), elapsed, parsed_docs / elapsed if elapsed > 0 else 0))
+    if args.binary:
+        corpus_format.pack_corpus(args.o)
+
+    stem_cache.save(args.stem_cache)
+    print(stem_cache.cache.stats())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
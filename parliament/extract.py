@@ -0,0 +1,206 @@
+'''
+    extract.py
+
+    Pulls the header & text of a sitting out of a Hansard sitting page in one pass over the page,
+    without building a parse tree. The page is read by the same parser BeautifulSoup's html.parser
+    backend uses, and PageStrings stands in for the BeautifulSoup object that would be building the
+    tree: it keeps the strings of the page as BeautifulSoup would have made them (whitespace-only
+    strings collapsed, etc.) and the text of the column anchors as they go by. The result is the
+    same as parliament.extract_sitting on a BeautifulSoup tree of the page, which bench_extract.py
+    checks (and times) on recorded pages.
+
+    PageStrings relies on the internals of bs4's html.parser backend, which can change between bs4
+    versions. It has been checked against the bs4 version given in README.md, and the scraper runs
+    check() on a sample page at startup, falling back to extract_sitting if the results differ.
+'''
+
+import logging
+from types import SimpleNamespace
+
+from bs4 import BeautifulSoup
+from bs4.builder import HTMLParserTreeBuilder
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+from bs4.dammit import UnicodeDammit
+from bs4.element import CData
+
+# the settings BeautifulSoup(page, 'html.parser') builds its tree with
+tree_builder = HTMLParserTreeBuilder()
+
+# what the parser needs to know about a tag it has just started
+empty_element = SimpleNamespace(is_empty_element=True)
+element = SimpleNamespace(is_empty_element=False)
+
+
+class PageStrings:
+    # the tree builder settings the parser looks up
+    builder = SimpleNamespace(store_line_numbers=False, attribute_dict_class=dict)
+
+    def __init__(self):
+        # every string on the page, as soup.findAll(text=True) would give them
+        self.strings = []
+        # the strings of each column anchor (<a name="column_..." href>), as their tag.text would give them
+        self.columns = []
+        self.current_data = []
+        self.open_tags = []
+        # depths of the open tags that keep whitespace (pre, textarea), whose strings have their own
+        # class (script, style, ...), and of the open column anchors along with their index in columns
+        self.preserve_whitespace = []
+        self.containers = []
+        self.anchors = []
+        self.contains_replacement_characters = False
+
+    def handle_starttag(self, name, namespace, nsprefix, attrs, **kwargs):
+        self.endData()
+        depth = len(self.open_tags)
+        self.open_tags.append(name)
+        if name in tree_builder.preserve_whitespace_tags:
+            self.preserve_whitespace.append(depth)
+        if name in tree_builder.string_containers:
+            self.containers.append(depth)
+        if name == 'a' and 'href' in attrs and 'name' in attrs and 'column_' in attrs['name']:
+            self.anchors.append((depth, len(self.columns)))
+            self.columns.append([])
+        return empty_element if tree_builder.can_be_empty_element(name) else element
+
+    # closes the most recent open tag called name and every tag opened after it
+    def handle_endtag(self, name, nsprefix=None):
+        self.endData()
+        if name not in self.open_tags:
+            return
+        while True:
+            popped = self.open_tags.pop()
+            depth = len(self.open_tags)
+            for stack in (self.preserve_whitespace, self.containers):
+                if len(stack) > 0 and stack[-1] == depth:
+                    stack.pop()
+            if len(self.anchors) > 0 and self.anchors[-1][0] == depth:
+                self.anchors.pop()
+            if popped == name:
+                return
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    # ends the string being read, container_class is None for text, or Comment, CData, etc.
+    def endData(self, container_class=None):
+        if len(self.current_data) == 0:
+            return
+        data = ''.join(self.current_data)
+        self.current_data = []
+
+        if len(self.preserve_whitespace) == 0 and all(c in BeautifulSoup.ASCII_SPACES for c in data):
+            data = '\n' if '\n' in data else ' '
+
+        self.strings.append(data)
+        # tag.text only has text (not in a script, style, etc.) and CDATA
+        if (container_class is None and len(self.containers) == 0) or container_class is CData:
+            for depth, column in self.anchors:
+                self.columns[column].append(data)
+
+
+def page_strings(body):
+    page = PageStrings()
+    markup = body
+    if isinstance(body, bytes):
+        markup = UnicodeDammit(body, is_html=True).unicode_markup
+    parser = BeautifulSoupHTMLParser(page, convert_charrefs=False)
+    parser.feed(markup)
+    parser.close()
+    page.endData()
+    return page
+
+
+# Input: the sitting's title, URL and page. Returns (sitting URL, {'header': ..., 'text': ...}), or None if
+# there is no text on the page
+def sitting(title, sitting_url, body):
+    page = page_strings(body)
+    visible_text = ''.join(page.strings)
+
+    # Find second occurrence of title and discard all text before it
+    # Assuming that the title occurs only twice on each sitting page, once at the top
+    #   and again before the actual sitting text
+    discard_from = visible_text.find(title) + len(title)
+    visible_text = visible_text[discard_from:]
+    start_pos = visible_text.find(title)
+    sitting_text = visible_text[start_pos:]
+
+    text_split = []
+    for line in ''.join([x for x in sitting_text.split('§') if len(x.strip()) > 0]).split('\n'):
+        line = line.strip()
+        if len(line) > 0:
+            text_split.append(line)
+
+    if len(text_split) == 0:
+        return None
+
+    # Find end of sitting text (the last line with each marker) and ignore misc. text from page
+    ends = {}
+    for i, x in enumerate(text_split):
+        for marker in ('Back to', 'Forward to', 'Noticed a typo?'):
+            if marker in x:
+                ends[marker] = i
+    if len(ends) > 0:
+        text_split = text_split[:min(ends.values())]
+
+    cols = [''.join(column).strip() for column in page.columns]
+
+    if len(cols) > 0:
+        try:
+            delim_header = text_split.index(cols[0])
+            header = text_split[:delim_header]
+            later_cols = set(cols[1:])
+            text_split = [x for x in text_split[delim_header+1:] if x not in later_cols]
+        except ValueError:
+            logging.info(text_split)
+            header = text_split[:2]
+            text_split = text_split[2:]
+
+        return sitting_url, {'header': header, 'text': text_split}
+    else:
+        return sitting_url, {'header': text_split[:2], 'text': text_split[2:]}
+
+
+# A made-up sitting page with the things sitting() has to get right the same way BeautifulSoup does:
+# whitespace-only strings, a script, a comment, entities, preformatted text, unclosed tags and stray end
+# tags, nested column anchors, the § marks and the end markers
+sample_title = 'BOSTON ELECTION PETITION.'
+sample_page = """<!DOCTYPE html>
+<html><head><title>BOSTON ELECTION PETITION. (Hansard, 23 November 1803)</title>
+<script type="text/javascript">var title = "BOSTON ELECTION PETITION.";</script>
+<style>p { margin: 0 }</style></head>
+<body>
+  <h1 class="title">BOSTON ELECTION PETITION.</h1>
+  <div id="content">
+    <h2>BOSTON ELECTION PETITION.</h2>
+    <p>HC Deb 23 November 1803 vol 1 cc32-3</p>
+    <a name="column_32" href="#column_32" class="permalink column-permalink">32</a>
+    <div class="hentry member_contribution"><a name="S1V0001P0-00059"></a>
+      <cite class="member">Mr.</cite> 	 <cite class="member">Ellison</cite>
+      <p>§ adverted to the petition of John Ogle, Esq. complaining of an undue election &amp; return
+      for the borough of Boston &#8212; in the county of Lincoln<br>against Mr. Fydell.</p>
+      <!-- a comment, BOSTON ELECTION PETITION. -->
+      <p>   </p>
+      <pre>  a   preformatted
+        line  </pre>
+      <a name="column_33" href="#column_33"><span>33</span><script>var column = 33;</script> <![CDATA[x]]></a>
+      <p>The Speaker<p>entered into a full explanation of the case.</span></div>
+    <a name="column_34" href="#column_34"><![CDATA[34]]></a>
+    <p>Ayes<pre>  </pre>Noes</p>
+    <textarea> </textarea>
+  </div>
+  <p class="nav">&#171; Back to Commons sitting</p>
+  <p>Forward to &#187;</p>
+  <p>Noticed a typo? | Report other issues</p>
+</body></html>"""
+
+
+# Whether sitting() gives the same result as reference(title, sitting_url, body), which extracts the
+# sitting from a BeautifulSoup tree, on the sample page with the installed bs4
+def check(reference):
+    url = 'http://hansard.millbanksystems.com/commons/1803/nov/23/boston-election-petition'
+    try:
+        return sitting(sample_title, url, sample_page.encode('utf-8')) == \
+            reference(sample_title, url, sample_page.encode('utf-8'))
+    except Exception:
+        logging.exception('extract.check(): single pass extraction failed on the sample page')
+        return False
@@ -0,0 +1,148 @@
+'''
+    fetch.py
+
+    Asynchronous fetch engine for the Hansard scraper. All requests go through one pooled
+    aiohttp session (keep-alive connections are reused across requests), with:
+
+        - a limit on the number of requests in flight at once (--concurrency)
+        - per-host rate limiting, requests to a host are spaced out to at most --rate per second
+        - retries with exponential backoff and jitter for connection errors, timeouts and
+          responses that are worth retrying (429, 5xx), honouring Retry-After
+        - optional recording of every page fetched (--record_dir), which replay.py serves back
+          as a local stand-in for the Hansard website
+'''
+
+import asyncio
+import logging
+import os
+import random
+from collections import deque
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# responses that are worth trying again, anything else that isn't a 200 means the page doesn't exist
+retry_statuses = {408, 429, 500, 502, 503, 504}
+
+
+# Where a recorded page is kept under directory. Every path gets its own folder, since Hansard
+# pages can be both a page and the parent of other pages (e.g. /commons/1803/nov/23 and
+# /commons/1803/nov/23/boston-election-fetitiom).
+def recorded_path(directory, path):
+    parts = [p for p in path.split('/') if p not in ('', '.', '..')]
+    return os.path.join(directory, *(parts + ['_page']))
+
+
+# Spaces out requests to each host so that none gets more than rate requests per second
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = {}
+
+    async def wait(self, host):
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    # hold off all requests to a host, e.g. after it answered 429 Too Many Requests
+    def pause(self, host, seconds):
+        now = asyncio.get_running_loop().time()
+        self.next_slot[host] = max(self.next_slot.get(host, now), now + seconds)
+
+
+class Fetcher:
+    def __init__(self, concurrency=8, rate=4.0, retries=5, backoff=1.0, timeout=60, record_dir=None):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.record_dir = record_dir
+        self.limiter = RateLimiter(rate)
+        self.session = None
+        self.semaphore = None
+        self.requests = self.retried = self.missing = self.failed = 0
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    # Returns the body of url as bytes, or None if the page does not exist or still could not
+    # be fetched after all retries
+    async def get(self, url):
+        return (await self.request(url))[1]
+
+    # Returns [status, body]: the body is None unless the status is 200, and the status is None
+    # if the request was given up on (so the page may well exist)
+    async def request(self, url):
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            wait = None
+            async with self.semaphore:
+                await self.limiter.wait(host)
+                self.requests += 1
+                try:
+                    async with self.session.get(url) as response:
+                        if response.status == 200:
+                            body = await response.read()
+                            self.record(url, body)
+                            return [response.status, body]
+                        if response.status not in retry_statuses:
+                            self.missing += 1
+                            return [response.status, None]
+                        logging.info('%s returned %d (attempt %d)', url, response.status, attempt + 1)
+                        wait = retry_after(response.headers.get('Retry-After'))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.info('%s failed: %r (attempt %d)', url, e, attempt + 1)
+            if attempt < self.retries:
+                self.retried += 1
+                if wait is None:
+                    wait = self.backoff * 2 ** attempt * (0.5 + random.random())
+                else:
+                    # the host asked for a break, so every request to it waits
+                    self.limiter.pause(host, wait)
+                await asyncio.sleep(wait)
+        logging.warning('Giving up on %s after %d attempts', url, self.retries + 1)
+        self.failed += 1
+        return [None, None]
+
+    def record(self, url, body):
+        if self.record_dir is None:
+            return
+        path = recorded_path(self.record_dir, urlsplit(url).path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as page:
+            page.write(body)
+
+    def stats(self):
+        return 'Fetched with {0} requests: {1} retried, {2} missing, {3} given up on'.format(
+            self.requests, self.retried, self.missing, self.failed)
+
+
+# seconds to wait from a Retry-After header, if it gives a number of seconds
+def retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+# Runs func(*args) for each tuple of args in items, with at most limit calls pending at a time so
+# that long lists of work are never all turned into tasks at once. Returns the results in order.
+async def map_bounded(func, items, limit):
+    results = []
+    in_flight = deque()
+    for args in items:
+        if len(in_flight) >= limit:
+            results.append(await in_flight.popleft())
+        in_flight.append(asyncio.ensure_future(func(*args)))
+    while len(in_flight) > 0:
+        results.append(await in_flight.popleft())
+    return results
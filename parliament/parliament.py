@@ -12,27 +12,35 @@
 '''
 
 # -*- coding: utf-8 -*-
+from collections import Counter
 from datetime import datetime, timedelta
 from bs4 import BeautifulSoup as bs
-from urllib.request import urlopen
-from urllib.error import HTTPError, URLError
-from multiprocessing import Pool, Process
 import argparse
+import asyncio
 import json
 import os
-import time
-import random
-import codecs
 import pickle
 import re
 import logging
+from urllib.parse import urlsplit
 
-reader = codecs.getreader("utf-8")
+try:
+    import extract
+    import fetch
+    import progress
+    import timeline
+except ImportError:
+    from parliament import extract, fetch, progress, timeline
 
+# set with --base_url, e.g. to scrape a local replay.py server instead
 base_url = 'http://hansard.millbanksystems.com'
 
+# set in main(), whether sittings are pulled out with extract.sitting (single pass) or tree_sitting
+single_pass = False
+
 num2month = {1: 'jan', 2: 'feb', 3: 'mar', 4: 'apr', 5: 'may', 6: 'jun', 7: 'jul', 8: 'aug', 9: 'sep', 10: 'oct',
              11: 'nov', 12: 'dec'}
+month2num = {v: k for k, v in num2month.items()}
 
 # main paths which containg sitting data
 sitemap = [{'sittings': {'sitting_path': 'commons', 'content_class': 'house-of-commons-sitting'}},
@@ -45,6 +53,7 @@ sitemap = [{'sittings': {'sitting_path': 'commons', 'content_class': 'house-of-c
            {'lords_reports': {'sitting_path': 'lords_reports', 'content_class': 'house-of-lords-report'}},
            {'grand_committee_report': {'sitting_path': 'grand_committee_report',
                                        'content_class': 'grand-committee-report-sitting'}}]
+sections = [k for site_path in sitemap for k in site_path]
 
 
 def daterange(start_date, end_date):
@@ -56,75 +65,180 @@ def daterange(start_date, end_date):
         curr += timedelta(days=1)
 
 
-def get_sittings(save_dir, start_date, end_date, parallel):
-    timeline=[]
-    chkpt_dir = os.path.join(save_dir, 'chkpt/timeline_urls.p')
-   
-    if not os.path.exists(chkpt_dir):
-        # brute force generate all possible URLs in the date range. Some may not exists.
-        for date_args in daterange(start_date, end_date):
-            for site_path in sitemap:
-                date_url, doc_date = format_url(site_path, date_str=date_args)
-                if scrape(date_url) != None:
-                    timeline.append((save_dir, date_url, doc_date))
-        save(chkpt_dir, timeline)
-        return
-    else: 
-        timeline = find_range(start_date, end_date, load_pickle(chkpt_dir))
-
-    if parallel:
-        pool = Pool()
-        pool.starmap(scrape_thread, timeline)
-        pool.close()
-        pool.join()
-    else:
-        for url in timeline:
-            scrape_thread(url[0], url[1], url[2])
-
-
-def json2str_date(s):
-    return '-'.join([str(s['year']), '%02d'%s['month'], '%02d'%s['day']])
-
-
-def find_range(start, end, timeline):
-    if type(start) != type(end):
-        raise Exception('find_range(start, end, timeline): Both inputs start and end must be of the same type (dict, str).')
+# Requests are made concurrently through fetcher, which bounds them by its concurrency and rate
+# limits. Pages are claimed from the progress store (progress.py) a batch at a time, so the work
+# handed to fetcher at once is bounded too (fetcher.concurrency * 4 pages), and a run that is
+# stopped carries on from the pages that are not done yet when started again.
+# With shard = [k, n], only the dates in shard k of n are scraped, see shard_range().
+async def get_sittings(fetcher, store, save_dir, start_date, end_date, discovery='index', shard=None):
+    limit = fetcher.concurrency * 4
 
-    if not isinstance(start, str) and not isinstance(start, dict):
-        raise Exception('find_range(): Unsupported type. ', str(type(start)),' Must be type str or dict.')
-
-    if isinstance(start, dict):
-        start = json2str_date(start)
-        end = json2str_date(end)
+    if discovery == 'probe':
+        await probe(fetcher, store, start_date, end_date)
+    else:
+        await discover(fetcher, store, start_date, end_date)
+
+    start = json2str_date(start_date)
+    end = json2str_date(end_date)
+
+    if shard != None:
+        bounds = await shard_range(store, shard, start_date, end_date)
+        if bounds == None:
+            return
+        start, end = bounds
+
+    # date pages add the sittings listed on them to the store
+    for batch in claimed(store, 'date', limit, start, end):
+        await fetch.map_bounded(scrape_thread, [(fetcher, store, save_dir, date_url, date + '.js')
+                                                for date_url, date, title in batch], limit)
+
+    # sittings are saved in order once their batch has been fetched
+    for batch in claimed(store, 'sitting', limit, start, end):
+        found = await fetch.map_bounded(scrape_sitting, [(fetcher, store, page) for page in batch], limit)
+        for (sitting_url, date, title), scraped in zip(batch, found):
+            if scraped != None:
+                sitting_url, content = scraped
+                save_doc(save_dir, date + '.js', sitting_url, content)
+                store.finish(sitting_url)
 
-    start = ''.join([start, '.js'])
-    end = ''.join([end, '.js'])
 
-    if start == '1802-07-02.js' and end == '2006-04-24.js':
-        return timeline
+# Narrows the date range to shard k of n (counting from 1), shard = [k, n]. The shards are cut so that each
+# has about the same number of date pages, which needs the complete timeline of the range: this waits for
+# other processes that are still reading index pages. Returns [start, end] dates of the shard, or None.
+async def shard_range(store, shard, start_date, end_date):
+    start = json2str_date(start_date)
+    end = json2str_date(end_date)
 
-    s = e = 0
+    while True:
+        pending, claimed = store.pending('index', '%d-01-01' % start_date['year'], '%d-12-31' % end_date['year'])
+        if pending == 0:
+            break
+        if claimed == 0:
+            print('Discovery incomplete, run again to carry on. Shards are cut once all index pages are read.')
+            return None
+        await asyncio.sleep(5)
+
+    k, n = shard
+    bounds = timeline.Timeline(store.entries('date', start, end)).shard(k - 1, n, start, end)
+    if bounds == None:
+        print('Shard {0} of {1} has no dates with sittings.'.format(k, n))
+        return None
+    print('Shard {0} of {1}: {2} to {3}'.format(k, n, bounds[0], bounds[1]))
+    return bounds
+
+
+# Batches of up to limit pending pages of a kind in the date range, claimed from store until there are none left
+def claimed(store, kind, limit, start, end):
+    store.rewind(kind)
+    while True:
+        batch = store.claim(kind, limit, start, end)
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+# Finds the dates that have sittings by reading the index pages of each section of the sitemap, rather
+# than probing every date: a section's year page (e.g. /commons/1803) links to the months with sittings,
+# and their month pages (/commons/1803/nov) to the days. That is ~13 requests per section & year instead
+# of ~365. The year pages are index pages in the store, and each one's dates are added to the store as
+# soon as all its month pages are read. If some could not be fetched, the year page is left for the next
+# run. Index pages list every date of a year, the date range is applied when the date pages are claimed.
+async def discover(fetcher, store, start_date, end_date):
+    first = '%d-01-01' % start_date['year']
+    last = '%d-12-31' % end_date['year']
+    store.add('index', [('/'.join([base_url, section, str(year)]), '%d-01-01' % year, section)
+                        for year in range(start_date['year'], end_date['year'] + 1) for section in sections])
+
+    async def discover_one(index_url, date, section):
+        complete, dates = await discover_year(fetcher, section, int(date[:4]))
+        if not complete:
+            logging.warning('Could not read all index pages of %s, it will be retried on the next run', index_url)
+            store.release(index_url)
+            return False
+        site_path = sitemap[sections.index(section)]
+        store.add('date', [(format_url(site_path, date_str=d)[0], d, None) for d in dates],
+                  parent=index_url, parent_state='saved')
+        return True
+
+    incomplete = 0
+    for batch in claimed(store, 'index', fetcher.concurrency, first, last):
+        incomplete += (await fetch.map_bounded(discover_one, batch, fetcher.concurrency)).count(False)
+
+    if incomplete > 0:
+        print('Discovery incomplete for {0} sections & years, run again to carry on.'.format(incomplete))
+
+
+# Finds the dates that have sittings by requesting every date in the range for each section. Only done
+# while the store has no date pages.
+async def probe(fetcher, store, start_date, end_date):
+    if 'date' in store.counts():
+        return
 
-    for i, t in enumerate(timeline):
-        # find the start date
-        if t[2] == start:
-            s = i
+    # brute force generate all possible URLs in the date range. Some may not exists.
+    candidates = [format_url(site_path, date_str=date_args)
+                  for date_args in daterange(start_date, end_date) for site_path in sitemap]
+    found = await fetch.map_bounded(scrape, [(fetcher, date_url) for date_url, doc_date in candidates],
+                                    fetcher.concurrency * 4)
+    store.add('date', [(date_url, doc_date[:-3], None)
+                       for (date_url, doc_date), page in zip(candidates, found) if page != None])
+
+
+# Reads the year & month index pages of one section. Returns [complete, dates], where complete is False
+# if any of the pages was given up on.
+async def discover_year(fetcher, section, year):
+    year_url = '/'.join([base_url, section, str(year)])
+    status, page = await scrape_status(fetcher, year_url)
+    complete = status != None
+    if page == None:
+        return [complete, []]
+
+    months, days = index_links(page, section, year)
+    month_pages = await asyncio.gather(*[scrape_status(fetcher, '/'.join([year_url, num2month[m]]))
+                                         for m in sorted(months)])
+    for status, month_page in month_pages:
+        complete = complete and status != None
+        if month_page != None:
+            days.update(index_links(month_page, section, year)[1])
+
+    dates = []
+    for m, d in sorted(days):
+        try:
+            dates.append(datetime(year, m, d).strftime('%Y-%m-%d'))
+        except ValueError:
+            continue
+    return [complete, dates]
+
+
+# Links on an index page to months (/commons/1803/nov) and days (/commons/1803/nov/23) of the same
+# section & year. Returns [months, (month, day) pairs]
+def index_links(page, section, year):
+    pattern = re.compile('^/{0}/{1}/([a-z]{{3}})(?:/([0-9]{{1,2}}))?/?$'.format(re.escape(section), year))
+    months = set()
+    days = set()
+    for tag in page.findAll('a', href=True):
+        match = pattern.match(urlsplit(tag['href']).path)
+        if match == None or match.group(1) not in month2num:
+            continue
+        if match.group(2) == None:
+            months.add(month2num[match.group(1)])
+        else:
+            days.add((month2num[match.group(1)], int(match.group(2))))
+    return [months, days]
 
-        # find the end date
-        if t[2] == end:
-            e = i
-            break
 
-    return timeline[s:e]
+def json2str_date(s):
+    return '-'.join([str(s['year']), '%02d'%s['month'], '%02d'%s['day']])
 
 
-def scrape_thread(save_dir, date_url, doc_date):
+async def scrape_thread(fetcher, store, save_dir, date_url, doc_date):
 
     # Need to correctly pair the URLs and titles from the titles in the API
-    bs_page = scrape(date_url[:-3])
+    status, bs_page = await scrape_status(fetcher, date_url[:-3])
 
     if bs_page == None:
+        skip(store, date_url, status)
         return
+    store.mark(date_url, 'fetched')
 
     # Get a-tag text and href
     try:
@@ -132,6 +246,7 @@ def scrape_thread(save_dir, date_url, doc_date):
     except AttributeError:
         # Occurs when the page does not exist. Page may not exist because URLs were generated brute force.
         # so just skip
+        store.finish(date_url, 'missing')
         return
 
     page_text = scrape_text(bs_page)
@@ -139,14 +254,24 @@ def scrape_thread(save_dir, date_url, doc_date):
     # Items listed on this page are either links to sittings or titles to pages with sittings
     # Items directly to sittings are listed as e.g. "Preamble 8 words", so need to separate these 2 types of items
     # Potential problem is "words" appears in the section title and is not a sitting title
-    line_indices = [page_text.index(c) - 1 for c in page_text if 'words' in c]
-    titles = [page_text[t].strip() for t in line_indices]
-
-    sittings = [tag for tag in atags for t in titles if t in tag]
+    # Each title is the line before the first occurrence of its "words" line
+    first_index = {}
+    for i, c in enumerate(page_text):
+        first_index.setdefault(c, i)
+    line_indices = [first_index[c] - 1 for c in page_text if 'words' in c]
+    titles = Counter(page_text[t].strip() for t in line_indices)
+
+    # A link is listed once for every title matching its text or its href
+    sittings = []
+    for tag in atags:
+        matches = titles[tag[0]] + (titles[tag[1]] if tag[1] != tag[0] else 0)
+        sittings.extend([tag] * matches)
+    store.add('sitting', [(''.join([base_url, sit[1]]), doc_date[:-3], sit[0]) for sit in sittings],
+              parent=date_url)
 
     if date_url.split('/')[3] == 'sittings':
         # Save API JSON
-        api = scrape(date_url)
+        api = await scrape(fetcher, date_url)
         save(os.path.join(save_dir, 'api', ''.join([doc_date[:-3], '.js'])), api)
 
         # Save all valid sitting titles on this date
@@ -157,22 +282,50 @@ def scrape_thread(save_dir, date_url, doc_date):
 
         save(os.path.join(save_dir, 'chkpt', 'sittings', ''.join([title, '.js'])), sit_dict)
 
-    for sit in sittings:
-        scraped = scrape_sitting(sit)
-        if scraped != None:
-            sitting_url, content = scraped
-            save_doc(save_dir, doc_date, sitting_url, content)
+    store.finish(date_url)
 
 
-# Input: (title, partial sitting URL)
-def scrape_sitting(sit):
-    sitting_url = ''.join([base_url, sit[1]])
+# Input: (sitting URL, date, title) as claimed from the store
+async def scrape_sitting(fetcher, store, page):
+    sitting_url, date, title = page
     # sitting_url = 'http://hansard.millbanksystems.com/lords/1803/dec/14/minutes'
-    sitting_soup = scrape(sitting_url)
-    
-    if sitting_soup == None:
+    status, body = await fetcher.request(sitting_url)
+
+    if body == None:
+        skip(store, sitting_url, status)
         return
-    
+    store.mark(sitting_url, 'fetched')
+
+    # Single pass over the page, same result as extract_sitting on a BeautifulSoup tree of it
+    if single_pass:
+        scraped = extract.sitting(title, sitting_url, body)
+    else:
+        scraped = tree_sitting(title, sitting_url, body)
+    if scraped == None:
+        store.finish(sitting_url, 'missing')
+        return
+    store.mark(sitting_url, 'parsed')
+    return scraped
+
+
+# A page that could not be scraped is missing if the site said so (e.g. 404), otherwise it was given up
+# on and is left for the next run
+def skip(store, url, status):
+    if status == None:
+        store.release(url)
+    else:
+        store.finish(url, 'missing')
+
+
+# extract_sitting on a BeautifulSoup tree of a sitting page, in the form extract.sitting takes
+def tree_sitting(title, sitting_url, body):
+    return extract_sitting((title, sitting_url), sitting_url, bs(body, 'html.parser'))
+
+
+# Pulls the header & text of a sitting out of its page. The scraper uses extract.sitting, which does the
+# same without building the tree; this is kept as the reference it is checked against (bench_extract.py),
+# and used instead if the two don't agree with the installed bs4
+def extract_sitting(sit, sitting_url, sitting_soup):
     visible_text = ''.join(sitting_soup.findAll(text=True))
 
     # Find second occurrence of title and discard all text before it
@@ -224,17 +377,24 @@ def scrape_sitting(sit):
         return sitting_url, {'header': text_split[:2], 'text': text_split[2:]}
 
 # Handles scraping API calls and raw HTML
-def scrape(url):
+async def scrape(fetcher, url):
+    # If page does not exist (or could not be fetched), skip over it
+    return (await scrape_status(fetcher, url))[1]
+
+
+# Like scrape, but also returns the response status: [status, page]. The status is None if the page
+# could not be fetched at all.
+async def scrape_status(fetcher, url):
+    status, body = await fetcher.request(url)
+    if body == None:
+        return [status, None]
     try:
         if url.endswith('.js'):
-            return json.load(reader(urlopen(url)))
+            return [status, json.loads(body.decode('utf-8'))]
         else:
-            return bs(urlopen(url).read(), 'html.parser')
-    except HTTPError:
-        # If page does not exist, skip over it
-        return None
-    except (TimeoutError, URLError) as e:
-        return None
+            return [status, bs(body, 'html.parser')]
+    except ValueError:
+        return [status, None]
 
 
 # Get all visible text on the page
@@ -314,59 +474,42 @@ def check_finished():
     pass
     
 
-def resume(save_dir, chk_sit_dir, sit_dir):
-    # Check all sitting titles in the date range it should have gotten, which will be in chk_sit_dir
-    #  against the sittings that were actually obtained in sit_dir
-    titles_dict = {}
-    sittings = {}
-    chk_sit_files = []
+# Imports the checkpoints of a save directory from before the progress store: the dates found by the brute
+# force search in chkpt/timeline_urls.p, and the sittings listed in chkpt/sittings, which are saved if their
+# file is in the sittings directory. Date pages before the most recent date in chkpt/sittings are done.
+def resume(store, save_dir, chk_sit_dir, sit_dir):
+    timeline_file = os.path.join(save_dir, 'chkpt', 'timeline_urls.p')
+    if os.path.exists(timeline_file):
+        store.add('date', [(date_url, doc_date[:-3], None) for _, date_url, doc_date in load_pickle(timeline_file)])
+
+    sit_dir_files = set(os.listdir(sit_dir))
     most_recent = '0001-01-01'
 
-    # finds the most recent file by date in the title of the file not time of download
-    for i, doc_date in enumerate(os.listdir(chk_sit_dir)):
+    for doc_date in sorted(os.listdir(chk_sit_dir)):
         with open(os.path.join(chk_sit_dir, doc_date)) as datefile:
-            
             # JSON key: sitting title, value: partial URL
             date_sitting = json.load(datefile)
-            sittings.update(date_sitting)
-
-            # title of each file is <date>.js
-            date = doc_date.split('.')[0]
 
-            most_recent = recent(date, most_recent)
+        # title of each file is <date>.js
+        date = doc_date.split('.')[0]
+        most_recent = recent(date, most_recent)
 
-            # iterate through the sittings on this date
-            for t in date_sitting:
-                filtered_title = filter_title(t)
+        pages = []
+        saved = []
+        for t in date_sitting:
+            sitting_url = ''.join([base_url, date_sitting[t]])
+            pages.append((sitting_url, date, t))
 
-                # format all sitting titles as the sitting filenames in the sitting directory so can compare
-                # to see what should have been scraped
-                chk_sit_files.append(''.join([date, '-', date_sitting[t].split('/')[1], '-', filtered_title, '.js']))
+            # format all sitting titles as the sitting filenames in the sitting directory so can compare
+            # to see what has already been scraped
+            if ''.join([date, '-', date_sitting[t].split('/')[1], '-', filter_title(t), '.js']) in sit_dir_files:
+                saved.append(sitting_url)
 
-                # collect the titles
-                titles_dict[filtered_title] = t
+        store.add('sitting', pages)
+        store.finish_all(saved)
 
-    # Retrieve any missing sittings
-    sit_dir_files = os.listdir(sit_dir)
-    diff = list(set(chk_sit_files) - set(sit_dir_files))
+    store.finish_before('date', most_recent)
 
-    if len(diff) > 0:
-        for sit in diff:
-            # each sit file is named using the same convention 
-            # e.g. 1803-11-23-commons-boston_election_fetitiom.js
-            sit = sit[:-3].split('-')
-            doc_date = '-'.join([sit[0], sit[1], sit[2]])+'.js'
-            original = remove_unicode(titles_dict[sit[-1]])
-            title_url_pair = (original, sittings[original])
-
-            scraped = scrape_sitting(title_url_pair)
-            if scraped != None:
-                sitting_url, content = scraped
-                save_doc(save_dir, doc_date, sitting_url, content)
-
-    last = most_recent.split('-')
-    return {'year': int(last[0]), 'month': int(last[1]), 'day': int(last[2])}
-        
 
 def check_date(start_date, end_date):
     if recent(start_date, end_date) == start_date and end_date != start_date:
@@ -374,6 +517,7 @@ def check_date(start_date, end_date):
 
 
 def main():
+    global base_url, single_pass
     parser = argparse.ArgumentParser()
     parser.add_argument('--save_dir', type=str, default='save/',
                         help='Specify name of save directory. If it does not exist, it will be created.')
@@ -384,8 +528,22 @@ def main():
     parser.add_argument('--end_month', type=int, default=4, help='Month to stop searching inclusive.')
     parser.add_argument('--end_day', type=int, default=24, help='Day to stop searching.')
     parser.add_argument('--resume', type=bool, default=False,
-                        help='Resume searching from last date. Do not set the start and end date range if using this option.')
-    parser.add_argument('--parallel', type=bool, default=False, help='Parallelize scraping.')
+                        help='Import the checkpoints of a save directory from before progress.db. Runs always carry '
+                             'on from progress.db otherwise.')
+    parser.add_argument('--discovery', type=str, default='index', choices=['index', 'probe'],
+                        help='How the first run finds the dates with sittings: read the year & month index pages '
+                             'of each section, or probe every date in the range.')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='Only scrape shard k of n of the date range, given as k/n (e.g. 2/4). The shards have '
+                             'about the same number of dates with sittings each.')
+    parser.add_argument('--base_url', type=str, default=base_url,
+                        help='Site to scrape, e.g. a local replay.py server for testing.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum number of requests in flight at once.')
+    parser.add_argument('--rate', type=float, default=4.0, help='Maximum number of requests per second to a host.')
+    parser.add_argument('--retries', type=int, default=5,
+                        help='Number of times a failed request is retried, with exponential backoff.')
+    parser.add_argument('--record_dir', type=str, default=None,
+                        help='Save every page fetched under this directory, for replay.py to serve.')
     args = parser.parse_args()
 
     if not os.path.exists(args.save_dir):
@@ -420,15 +578,39 @@ def main():
     start_date = {'year': args.start_year, 'month': args.start_month, 'day': args.start_day}
     end_date = {'year': args.end_year, 'month': args.end_month, 'day': args.end_day}
 
-    if args.resume:
-        resume_start_date = resume(args.save_dir, chk_sit_dir, sit_dir)
+    base_url = args.base_url.rstrip('/')
 
-        # Takes the most recent start date in the odd case that the user would like to resume, but would like to start
-        # at a more recent date, so this should skip over those dates in between and start with the new start date.
-        start_date = recent(resume_start_date, start_date)
+    single_pass = extract.check(tree_sitting)
+    if not single_pass:
+        logging.warning('extract.sitting does not match extract_sitting with this version of bs4, '
+                        'sittings are extracted from BeautifulSoup trees instead')
+        print('Warning: extracting sittings from BeautifulSoup trees, see the log.')
 
     check_date(start_date, end_date)
-    get_sittings(args.save_dir, start_date, end_date, args.parallel)
+
+    shard = None
+    if args.shard != None:
+        shard = [int(x) for x in args.shard.split('/')]
+        if len(shard) != 2 or not 1 <= shard[0] <= shard[1]:
+            raise Exception('main(): --shard must be given as k/n, with k from 1 to n')
+
+    store = progress.Progress(os.path.join(chk_dir, 'progress.db'))
+    if args.resume:
+        resume(store, args.save_dir, chk_sit_dir, sit_dir)
+
+    try:
+        asyncio.run(run(args, store, start_date, end_date, shard))
+    finally:
+        logging.info(store.summary())
+        print(store.summary())
+        store.close()
+
+
+async def run(args, store, start_date, end_date, shard):
+    async with fetch.Fetcher(args.concurrency, args.rate, args.retries, record_dir=args.record_dir) as fetcher:
+        await get_sittings(fetcher, store, args.save_dir, start_date, end_date, args.discovery, shard)
+        logging.info(fetcher.stats())
+        print(fetcher.stats())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+'''
+    progress.py
+
+    Progress store for the Hansard scraper, kept in save/chkpt/progress.db. Every page the scraper
+    needs is a row, along with its state:
+
+        discovered  found by discovery (index & date pages) or on a date page (sittings)
+        fetched     downloaded
+        parsed      the links (date pages) or text (sittings) on it have been extracted
+        saved       its output is on disk, nothing left to do
+        missing     the page does not exist or has no text, nothing left to do
+
+    Each change of state is a transaction of its own, so stopping the scraper loses at most the
+    pages in flight, and pending pages are found through an index that only holds pending pages.
+    The database is in WAL mode so that several scraper processes can share it: pages are claimed
+    by a worker (host:pid) before they are worked on, so no two processes work on the same page.
+    Claims of a worker that has died are released when another worker on its host starts up, or
+    otherwise once they are older than the lease.
+'''
+
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# states with nothing left to do
+done_states = ('saved', 'missing')
+
+schema = '''
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    date TEXT NOT NULL,
+    title TEXT,
+    state TEXT NOT NULL DEFAULT 'discovered',
+    worker TEXT,
+    claimed REAL
+);
+CREATE INDEX IF NOT EXISTS pending ON pages (kind, date) WHERE state NOT IN ('saved', 'missing');
+CREATE INDEX IF NOT EXISTS dates ON pages (kind, date);
+CREATE INDEX IF NOT EXISTS claims ON pages (worker) WHERE worker IS NOT NULL;
+'''
+
+
+class Progress:
+    def __init__(self, path, lease=3600):
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(schema)
+        self.worker = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        self.lease = lease
+        # (date, rowid) of the last page claimed of each kind, see claim()
+        self.cursors = {}
+        self.release_dead()
+
+    def close(self):
+        self.db.close()
+
+    @contextmanager
+    def transaction(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    # Adds pages of a kind as (url, date, title), skipping those already in the store. If parent is
+    # given, it is set to parent_state in the same transaction, e.g. a date page is parsed once the
+    # sittings on it are in the store.
+    def add(self, kind, pages, parent=None, parent_state='parsed'):
+        with self.transaction() as db:
+            db.executemany('INSERT OR IGNORE INTO pages (url, kind, date, title) VALUES (?, ?, ?, ?)',
+                           [(url, kind, date, title) for url, date, title in pages])
+            if parent is not None:
+                self.set_state(db, parent, parent_state)
+
+    # Claims up to limit pending pages of a kind dated from start to end (inclusive), that no other
+    # live worker has claimed. Returns them as (url, date, title), in date order and then in the order
+    # they were added. Each call carries on from the last page claimed, so a page that is released
+    # without being done is left for the next run rather than tried again straight away.
+    def claim(self, kind, limit, start, end):
+        date, rowid = self.cursors.get(kind, ('', 0))
+        now = time.time()
+        with self.transaction() as db:
+            rows = db.execute('''SELECT rowid, url, date, title FROM pages
+                                 WHERE kind = ? AND state NOT IN ('saved', 'missing') AND date BETWEEN ? AND ?
+                                 AND (date > ? OR (date = ? AND rowid > ?))
+                                 AND (worker IS NULL OR claimed < ?)
+                                 ORDER BY date, rowid LIMIT ?''',
+                              (kind, start, end, date, date, rowid, now - self.lease, limit)).fetchall()
+            db.executemany('UPDATE pages SET worker = ?, claimed = ? WHERE rowid = ?',
+                           [(self.worker, now, row[0]) for row in rows])
+        if len(rows) > 0:
+            self.cursors[kind] = (rows[-1][2], rows[-1][0])
+        return [(url, date, title) for rowid, url, date, title in rows]
+
+    # go back to claiming from the earliest pending page of a kind
+    def rewind(self, kind):
+        self.cursors.pop(kind, None)
+
+    # records a step of a claimed page that is still being worked on (fetched, parsed)
+    def mark(self, url, state):
+        with self.transaction() as db:
+            self.set_state(db, url, state)
+
+    # records that a claimed page is done (saved, missing) and lets go of it
+    def finish(self, url, state='saved'):
+        with self.transaction() as db:
+            self.set_state(db, url, state)
+
+    # records that pages are done, whether or not they were claimed
+    def finish_all(self, urls, state='saved'):
+        with self.transaction() as db:
+            for url in urls:
+                self.set_state(db, url, state)
+
+    # records that every page of a kind dated before date is done
+    def finish_before(self, kind, date, state='saved'):
+        with self.transaction() as db:
+            db.execute('''UPDATE pages SET state = ?, worker = NULL, claimed = NULL
+                          WHERE kind = ? AND date < ? AND state NOT IN ('saved', 'missing')''', (state, kind, date))
+
+    # lets go of a claimed page that is not done, e.g. it could not be fetched
+    def release(self, url):
+        with self.transaction() as db:
+            db.execute('UPDATE pages SET worker = NULL, claimed = NULL WHERE url = ?', (url,))
+
+    # a page that is done is let go of
+    def set_state(self, db, url, state):
+        if state in done_states:
+            db.execute('UPDATE pages SET state = ?, worker = NULL, claimed = NULL WHERE url = ?', (state, url))
+        else:
+            db.execute('UPDATE pages SET state = ? WHERE url = ?', (state, url))
+
+    # Releases the claims of workers on this host that are no longer running. A worker with this
+    # process's id is an earlier run whose pid has been reused.
+    def release_dead(self):
+        host = socket.gethostname()
+        with self.transaction() as db:
+            workers = [row[0] for row in db.execute('SELECT DISTINCT worker FROM pages WHERE worker IS NOT NULL')]
+            for worker in workers:
+                name, _, pid = worker.rpartition(':')
+                if name == host and (worker == self.worker or not alive(int(pid))):
+                    db.execute('UPDATE pages SET worker = NULL, claimed = NULL WHERE worker = ?', (worker,))
+
+    # (date, url) of every page of a kind dated from start to end
+    def entries(self, kind, start, end):
+        return self.db.execute('SELECT date, url FROM pages WHERE kind = ? AND date BETWEEN ? AND ?',
+                               (kind, start, end)).fetchall()
+
+    # [pending, claimed]: the number of pages of a kind dated from start to end that are not done, and
+    # how many of those a live worker has claimed
+    def pending(self, kind, start, end):
+        return list(self.db.execute('''SELECT COUNT(*), COUNT(CASE WHEN worker IS NOT NULL AND claimed >= ? THEN 1 END)
+                                       FROM pages WHERE kind = ? AND state NOT IN ('saved', 'missing')
+                                       AND date BETWEEN ? AND ?''',
+                                    (time.time() - self.lease, kind, start, end)).fetchone())
+
+    # kind -> state -> number of pages
+    def counts(self):
+        counts = {}
+        for kind, state, n in self.db.execute('SELECT kind, state, COUNT(*) FROM pages GROUP BY kind, state'):
+            counts.setdefault(kind, {})[state] = n
+        return counts
+
+    def summary(self):
+        lines = []
+        for kind, states in sorted(self.counts().items()):
+            done = sum(n for state, n in states.items() if state in done_states)
+            lines.append('{0} pages: {1} of {2} done ({3})'.format(
+                kind, done, sum(states.values()),
+                ', '.join('{0} {1}'.format(n, state) for state, n in sorted(states.items()))))
+        return '\n'.join(lines)
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,57 @@
+'''
+    replay.py
+
+    Local stand-in for the Hansard website, for testing the scraper. Serves the pages recorded by
+    parliament.py --record_dir (laid out by fetch.recorded_path) and answers 404 for anything else.
+    It can also slow down or fail some requests, to exercise the fetcher's rate limiting & retries.
+
+        $ python replay.py --dir recorded/ --port 8080
+        $ python parliament.py --base_url http://localhost:8080 --save_dir test/
+'''
+
+import argparse
+import asyncio
+import random
+
+from aiohttp import web
+
+try:
+    import fetch
+except ImportError:
+    from parliament import fetch
+
+
+def build_app(directory, delay=0.0, fail_rate=0.0):
+    async def serve(request):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if fail_rate > 0 and random.random() < fail_rate:
+            return web.Response(status=503)
+        try:
+            with open(fetch.recorded_path(directory, request.path), 'rb') as page:
+                body = page.read()
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return web.Response(status=404)
+        if request.path.endswith('.js'):
+            return web.Response(body=body, content_type='application/json')
+        return web.Response(body=body, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_route('GET', '/{path:.*}', serve)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dir', type=str, default='recorded/', help='Directory of recorded pages.')
+    parser.add_argument('--port', type=int, default=8080, help='Port to serve on.')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before answering each request.')
+    parser.add_argument('--fail_rate', type=float, default=0.0,
+                        help='Fraction of requests to answer with 503 Service Unavailable.')
+    args = parser.parse_args()
+
+    web.run_app(build_app(args.dir, args.delay, args.fail_rate), port=args.port)
+
+
+if __name__ == "__main__":
+    main()
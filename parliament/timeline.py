@@ -0,0 +1,65 @@
+'''
+    timeline.py
+
+    Date-sorted index of the date pages with sittings, for picking out date ranges and cutting them
+    into shards. Dates are 'YYYY-MM-DD' strings, which sort the same way as the dates they stand for,
+    and ranges are found by binary search, so a start or end date without any sittings just falls
+    between the dates that have them.
+'''
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+
+class Timeline:
+    # entries are (date, url) pairs, in any order unless presorted
+    def __init__(self, entries, presorted=False):
+        if not presorted:
+            entries = sorted(entries)
+        self.dates = [date for date, url in entries]
+        self.urls = [url for date, url in entries]
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Timeline(list(zip(self.dates[i], self.urls[i])), presorted=True)
+        return (self.dates[i], self.urls[i])
+
+    # positions [i, j) of the entries dated from start to end, inclusive
+    def span(self, start, end):
+        return [bisect_left(self.dates, start), bisect_right(self.dates, end)]
+
+    # the entries dated from start to end, inclusive
+    def range(self, start, end):
+        i, j = self.span(start, end)
+        return self[i:j]
+
+    # Cuts the timeline into n shards of consecutive dates with about the same number of entries each,
+    # without splitting a date between shards. Returns the first date of each shard after the first,
+    # which is fewer than n - 1 dates if there are too few dates to go round.
+    def cuts(self, n):
+        cuts = []
+        for k in range(1, n):
+            i = len(self.dates) * k // n
+            if i >= len(self.dates):
+                continue
+            if self.dates[i] > (cuts[-1] if len(cuts) > 0 else self.dates[0]):
+                cuts.append(self.dates[i])
+        return cuts
+
+    # [first, last] dates of shard k of n (counting from 0) of the dates from start to end. The shards
+    # cover every date from start to end between them, including dates without sittings, so pages found
+    # later still belong to exactly one shard. Returns None if the shard is empty.
+    def shard(self, k, n, start, end):
+        cuts = self.range(start, end).cuts(n)
+        if k > len(cuts):
+            return None
+        firsts = [start] + cuts
+        lasts = [day_before(cut) for cut in cuts] + [end]
+        return [firsts[k], lasts[k]]
+
+
+def day_before(date):
+    return (datetime.strptime(date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
@@ -1,52 +1,63 @@
-import argparse, os, re, csv
-import xml.etree.ElementTree as ET
+import argparse, os, re, csv, time, tqdm
 from multiprocessing import Pool
-from nlp_scripts import common, parsing_help, parsed
+from nlp_scripts import build_manifest, common, corpus_format, corpus_index, normalize, parsing_help, parsed, \
+    stem_cache, xml_stream
 
 
 # This script navigates through a directory of XML files (organized according to
 # a specific template) and builds JSON files out of them. The outputted JSON files include
 # separate fields for: Title, Author, Publication Info, Publication Date, ISBN Number, Chapter
 # List, Full Text, Filtered Text, and Stemmed Text.
-
-
+#
+# Each file is read in a single streaming pass (see xml_stream.py). find_elements picks out
+# the elements each field comes from as the file is read, and read_element passes each of
+# them to the methods below once it is complete.
+
+
+# recorded in the build manifest along with each document, bump the version whenever a change here
+# (or in the normalization) changes the output so that incremental builds parse everything again
+parser_name = "Danish_XML_Parser"
+parser_version = 2
+
+tei = "{http://www.tei-c.org/ns/1.0}"
+
+# How the text of the elements picked out by find_elements is read, as a table of rules. Each
+# rule gives how an element's own text (and tail) is read, and the rule for each of its children
+# by tag ("*" for any other tag); children with no rule are skipped. Text is read as:
+#
+#   block:      starts a new block of text (a paragraph, line of verse, speech, etc.)
+#   inline:     adds to the current block (page & line breaks, highlighted text)
+#   search:     isn't read, only the element's children are
+#
+inline = {tei + "pb": "inline", tei + "hi": "inline", tei + "lb": "inline"}
+text_rules = {
+    "inline": ["inline", {}],
+    "paragraph": ["block", inline],
+    "poetry": ["search", {tei + "l": "paragraph", "*": "poetry"}],
+    "stage": ["block", dict(inline, **{tei + "p": "paragraph"})],
+    "speech": ["block", dict(inline, **{tei + "speaker": "paragraph", tei + "stage": "paragraph",
+                                        tei + "p": "speech paragraph"})],
+    "speech paragraph": ["block", dict(inline, **{tei + "stage": "paragraph"})]
+}
+
+
+# Outputs title and author, from a titleStmt element
 def get_title_and_author(root, file):
-    if "titleStmt" in root.tag:
-        for child in root:
-            if "title" in child.tag:
-                file.t = child.text
-            if "author" in child.tag:
-                file.a = child.text
-        return
-    else:
-        for child in root:
-            get_title_and_author(child, file)
+    for child in root:
+        if "title" in child.tag:
+            file.t = child.text
+        if "author" in child.tag:
+            file.a = child.text
 
 
-# Outputs Publisher
+# Outputs Publisher, from a publicationStmt element
 def get_publication_info(root, file):
-    if "publicationStmt" in root.tag:
-        for child in root:
-            if "publisher" in child.tag:
-                try:
-                    file.p = child.text
-                except:
-                    file.p = "No publisher listed"
-        return
-    else:
-        for child in root:
-            get_publication_info(child, file)
-
-
-# Helper function to search for most common subtags
-# and write their contents to a file object.
-def scan_for_subtags(root, file):
-    if root.tag == "{http://www.tei-c.org/ns/1.0}pb":
-        parsing_help.add_xml_content(root, file, "danish")
-    if root.tag == "{http://www.tei-c.org/ns/1.0}hi":
-        parsing_help.add_xml_content(root, file, "danish")
-    if root.tag == "{http://www.tei-c.org/ns/1.0}lb":
-        parsing_help.add_xml_content(root, file, "danish")
+    for child in root:
+        if "publisher" in child.tag:
+            try:
+                file.p = child.text
+            except:
+                file.p = "No publisher listed"
 
 
 # Helper method for ISBN method
@@ -78,160 +89,145 @@ def check_for_isbn(root, file):
             pass
 
 
-# Gets ISBN
+# Gets ISBN, from an element within a div of the front matter
 def get_isbn(root, file):
-    if "front" in root.tag:
-        for child in root:
-            if "div" in child.tag:
-                for children in child:
-                    if "p" or "bibl" in children.tag:
-                        check_for_isbn(children, file)
-                        for morechildren in children:
-                            if morechildren.tag == "{http://www.tei-c.org/ns/1.0}pb":
-                                check_for_isbn(morechildren, file)
-                            if morechildren.tag == "{http://www.tei-c.org/ns/1.0}hi":
-                                check_for_isbn(morechildren, file)
-                            if morechildren.tag == "{http://www.tei-c.org/ns/1.0}lb":
-                                check_for_isbn(morechildren, file)
-    else:
-        for child in root:
-            get_isbn(child, file)
-
-
-# Determines whether the file is a Novel/Essay, Poetry, or Drama
+    check_for_isbn(root, file)
+    for children in root:
+        if children.tag == "{http://www.tei-c.org/ns/1.0}pb":
+            check_for_isbn(children, file)
+        if children.tag == "{http://www.tei-c.org/ns/1.0}hi":
+            check_for_isbn(children, file)
+        if children.tag == "{http://www.tei-c.org/ns/1.0}lb":
+            check_for_isbn(children, file)
+
+
+# Determines whether the file is a Novel/Essay, Poetry, or Drama,
+# from a p, lg or stage element within a div of the body
 def doc_type(root, file):
-    if "body" in root.tag:
-        for child in root:
-            if "div" in child.tag:
-                for children in child:
-                    if children.tag == "{http://www.tei-c.org/ns/1.0}p":
-                        file.d = "Novel or Essay"
-                    if children.tag == "{http://www.tei-c.org/ns/1.0}lg":
-                        file.d = "Poetry"
-                    if children.tag == "{http://www.tei-c.org/ns/1.0}stage":
-                        file.d = "Drama"
-                    if "div" in children.tag:
-                        for morechildren in children:
-                            if morechildren.tag == "{http://www.tei-c.org/ns/1.0}p":
-                                file.d = "Novel or Essay"
-                            if morechildren.tag == "{http://www.tei-c.org/ns/1.0}lg":
-                                file.d = "Poetry"
-                            if morechildren.tag == "{http://www.tei-c.org/ns/1.0}stage":
-                                file.d = "Drama"
-    else:
-        for child in root:
-            doc_type(child, file)
-
-
-# Scans a file for its chapter titles
-def get_chapters(root, file):
-    if "body" in root.tag:
-        for child in root:
-            if "div" in child.tag:
-                for children in child:
-                    if "head" in children.tag:
-                        add_chapter(children, file)
-                    if "div" in children.tag:
-                        for morechildren in children:
-                            if "head" in morechildren.tag:
-                                add_chapter(morechildren, file)
-                                for evenmorechildren in morechildren:
-                                    if "emph" in evenmorechildren.tag:
-                                        add_chapter(evenmorechildren, file)
-                                    if "hi" in evenmorechildren.tag:
-                                        add_chapter(evenmorechildren, file)
-    else:
-        for child in root:
-            get_chapters(child, file)
-
-
-# Method for grabbing text from the XML files. It branches off
-# some way through if the file contains Poetry or Theater tags.
-def get_text(root, file):
-    for kid in root:
-        if "body" in kid.tag or "back" in kid.tag or "front" in kid.tag:
-            for child in kid:
-                if child.tag == "{http://www.tei-c.org/ns/1.0}lg":
-                    get_poetry(child, file)
-                if "div" in child.tag:
-                    for children in child:
-                        if children.tag == "{http://www.tei-c.org/ns/1.0}stage":
-                            get_theater(children, file)
-                        if children.tag == "{http://www.tei-c.org/ns/1.0}sp":
-                            get_theater(children, file)
-                        if children.tag == "{http://www.tei-c.org/ns/1.0}lg":
-                            get_poetry(children, file)
-                        if children.tag == "{http://www.tei-c.org/ns/1.0}p":
-                            parsing_help.add_xml_content(children, file, "danish")
-                            for morechildren in children:
-                                scan_for_subtags(morechildren, file)
-                        if "div" in children.tag:
-                            for morechildren in children:
-                                if morechildren.tag == "{http://www.tei-c.org/ns/1.0}stage":
-                                    get_theater(morechildren, file)
-                                if morechildren.tag == "{http://www.tei-c.org/ns/1.0}sp":
-                                    get_theater(morechildren, file)
-                                if morechildren.tag == "{http://www.tei-c.org/ns/1.0}lg":
-                                    get_poetry(morechildren, file)
-                                if morechildren.tag == "{http://www.tei-c.org/ns/1.0}p":
-                                    parsing_help.add_xml_content(morechildren, file, "danish")
-                                    for evenmorechildren in morechildren:
-                                        scan_for_subtags(evenmorechildren, file)
-                                if "div" in morechildren.tag:
-                                    for evenmorechildren in morechildren:
-                                        if evenmorechildren.tag == "{http://www.tei-c.org/ns/1.0}p":
-                                            parsing_help.add_xml_content(evenmorechildren, file, "danish")
-                                            for wowmorechildren in evenmorechildren:
-                                                scan_for_subtags(wowmorechildren, file)
-                                        if evenmorechildren.tag == "{http://www.tei-c.org/ns/1.0}stage":
-                                            get_theater(evenmorechildren, file)
-                                        if evenmorechildren.tag == "{http://www.tei-c.org/ns/1.0}sp":
-                                            get_theater(evenmorechildren, file)
-        else:
-            get_text(kid, file)
-
-
-# Method for grabbing individual poems
-def get_poetry(root, file):
-    for child in root:
-        if child.tag == "{http://www.tei-c.org/ns/1.0}l":
-            parsing_help.add_xml_content(child, file, "danish")
-            for children in child:
-                scan_for_subtags(children, file)
-        else:
-            get_poetry(child, file)
-
-
-# Grabs text from a Drama
-def get_theater(child, file):
-    if child.tag == "{http://www.tei-c.org/ns/1.0}stage":
-        parsing_help.add_xml_content(child, file, "danish")
-        for children in child:
-            scan_for_subtags(children, file)
-            if children.tag == "{http://www.tei-c.org/ns/1.0}p":
-                parsing_help.add_xml_content(children, file, "danish")
-                for morechildren in children:
-                    scan_for_subtags(morechildren, file)
-    if child.tag == "{http://www.tei-c.org/ns/1.0}sp":
-        parsing_help.add_xml_content(child, file, "danish")
-        for children in child:
-            scan_for_subtags(children, file)
-            if children.tag == "{http://www.tei-c.org/ns/1.0}speaker":
-                parsing_help.add_xml_content(children, file, "danish")
-                for morechildren in children:
-                    scan_for_subtags(morechildren, file)
-            if children.tag == "{http://www.tei-c.org/ns/1.0}stage":
-                parsing_help.add_xml_content(children, file, "danish")
-                for morechildren in children:
-                    scan_for_subtags(morechildren, file)
-            if children.tag == "{http://www.tei-c.org/ns/1.0}p":
-                parsing_help.add_xml_content(children, file, "danish")
-                for morechildren in children:
-                    scan_for_subtags(morechildren, file)
-                    if morechildren.tag == "{http://www.tei-c.org/ns/1.0}stage":
-                        parsing_help.add_xml_content(morechildren, file, "danish")
-                        for evenmorechildren in morechildren:
-                            scan_for_subtags(evenmorechildren, file)
+    if root.tag == "{http://www.tei-c.org/ns/1.0}p":
+        file.d = "Novel or Essay"
+    if root.tag == "{http://www.tei-c.org/ns/1.0}lg":
+        file.d = "Poetry"
+    if root.tag == "{http://www.tei-c.org/ns/1.0}stage":
+        file.d = "Drama"
+
+
+# Adds a chapter title from a head element within a div of the body. heads
+# within nested divs can have their titles split across emph / hi elements.
+def get_chapters(root, file, nested):
+    add_chapter(root, file)
+    if nested:
+        for children in root:
+            if "emph" in children.tag:
+                add_chapter(children, file)
+            if "hi" in children.tag:
+                add_chapter(children, file)
+
+
+# Decides how text elements within a body, back or front section are read, from their tags
+# below the section. Sections hold poems, and divs (nested up to three deep) which hold
+# paragraphs, poems and the parts of a drama. Returns None for anything else.
+def text_kind(tags):
+    last = tags[-1]
+    if len(tags) == 1:
+        if last == "{http://www.tei-c.org/ns/1.0}lg":
+            return "poetry"
+        return None
+    if len(tags) > 4:
+        return None
+    for tag in tags[:-1]:
+        if "div" not in tag:
+            return None
+    if last == "{http://www.tei-c.org/ns/1.0}stage" or last == "{http://www.tei-c.org/ns/1.0}sp":
+        return "theater"
+    if last == "{http://www.tei-c.org/ns/1.0}lg" and len(tags) < 4:
+        return "poetry"
+    if last == "{http://www.tei-c.org/ns/1.0}p":
+        return "paragraph"
+    return None
+
+
+# Picks out the elements that the text & metadata are read from, given the tags of the
+# element that was just opened and of its ancestors (see xml_stream.select). Returns a list
+# of the ways the element is to be read.
+def find_elements(tags):
+    kinds = []
+    depth = len(tags) - 1
+    section = xml_stream.first_match(tags, ["body", "back", "front"], 1)
+    if -1 < section < depth:
+        kind = text_kind(tags[section + 1:])
+        if kind is not None:
+            kinds.append(kind)
+    if xml_stream.first_match(tags, ["titleStmt"]) == depth:
+        kinds.append("title")
+    if xml_stream.first_match(tags, ["publicationStmt"]) == depth:
+        kinds.append("publisher")
+    front = xml_stream.first_match(tags, ["front"])
+    if front == depth - 2 and "div" in tags[front + 1]:
+        kinds.append("isbn")
+    body = xml_stream.first_match(tags, ["body"])
+    if -1 < body < depth:
+        below = tags[body + 1:]
+        if 1 < len(below) < 4 and "div" in below[0] and (len(below) == 2 or "div" in below[1]):
+            if below[-1] in ["{http://www.tei-c.org/ns/1.0}p", "{http://www.tei-c.org/ns/1.0}lg",
+                             "{http://www.tei-c.org/ns/1.0}stage"]:
+                kinds.append("doc type")
+            if "head" in below[-1]:
+                kinds.append("chapter" if len(below) == 2 else "nested chapter")
+    return kinds
+
+
+# adds a piece of an element's text to the document's blocks of text
+def add_piece(blocks, mode, text):
+    if text is None or mode == "search":
+        return
+    if mode == "block" or len(blocks) == 0:
+        blocks.append([])
+    blocks[-1].append(text)
+
+
+# Reads the text of an element & its subtree, following text_rules from the given rule, into
+# blocks (a list of blocks, each a list of pieces of text). Walks the tree with a stack rather
+# than recursion, adding each piece in document order: an element's text, then its children,
+# then its tail.
+def read_text(root, rule, blocks):
+    add_piece(blocks, text_rules[rule][0], root.text)
+    stack = [[root, rule, iter(root)]]
+    while len(stack) > 0:
+        elem, rule, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            # the tail carries on the block the element's text was in
+            add_piece(blocks, "inline" if text_rules[rule][0] == "block" else text_rules[rule][0], elem.tail)
+            continue
+        child_rules = text_rules[rule][1]
+        child_rule = child_rules.get(child.tag, child_rules.get("*"))
+        if child_rule is not None:
+            add_piece(blocks, text_rules[child_rule][0], child.text)
+            stack.append([child, child_rule, iter(child)])
+
+
+# Reads an element picked out by find_elements into the file object, or into blocks for its text
+def read_element(root, kind, file, blocks):
+    if kind == "paragraph":
+        read_text(root, "paragraph", blocks)
+    if kind == "poetry":
+        read_text(root, "poetry", blocks)
+    if kind == "theater":
+        read_text(root, "stage" if root.tag == tei + "stage" else "speech", blocks)
+    if kind == "title":
+        get_title_and_author(root, file)
+    if kind == "publisher":
+        get_publication_info(root, file)
+    if kind == "isbn":
+        get_isbn(root, file)
+    if kind == "doc type":
+        doc_type(root, file)
+    if kind == "chapter":
+        get_chapters(root, file, False)
+    if kind == "nested chapter":
+        get_chapters(root, file, True)
 
 
 # Add a chapter to the chapter list
@@ -257,26 +253,49 @@ def get_pub_dates(csv_in):
     return refs
 
 
-def parse_threaded(xml_doc, input_doc, output_doc, csv_in):
-    refs = get_pub_dates(csv_in)
-    tree = ET.parse(input_doc + xml_doc)
-    root = tree.getroot()
+# Pool initializer, gives each worker process the publication dates (read from the csv file once,
+# by the parent) and directories, and seeds its stem cache with the table prebuilt by the parent.
+# a serial run calls it without a stem table, and keeps using the parent's cache.
+def init_worker(pub_dates, in_dir, out_dir, stems=None):
+    global refs, input_doc, output_doc
+    refs, input_doc, output_doc = pub_dates, in_dir, out_dir
+    if stems is not None:
+        stem_cache.init_worker(stems)
+
+
+def parse_threaded(xml_doc):
     obj = parsed.Parsed()
-    get_text(root, obj)
+    blocks = []
+    # text & metadata all come from a single pass over the document, and the text is
+    # normalized all at once at the end
+    for element, kinds in xml_stream.select(os.path.join(input_doc, xml_doc), find_elements):
+        for kind in kinds:
+            read_element(element, kind, obj, blocks)
+    normalize.add_blocks([text for text in (" ".join(block) for block in blocks) if text.strip() != ""],
+                         obj, "danish")
     text = "".join(obj.c)
+    rows = []
     if text != "":
         try:
-            with open(output_doc + xml_doc[:-4] + '.json', 'w', encoding='utf-8') as out:
-                get_title_and_author(root, obj)
-                get_publication_info(root, obj)
-                get_isbn(root, obj)
-                obj.y = refs[xml_doc]
-                doc_type(root, obj)
-                get_chapters(root, obj)
-                out.write(parsing_help.build_json(obj))
-                out.close()
+            obj.y = refs[xml_doc]
+            build_manifest.write_atomic(os.path.join(output_doc, xml_doc[:-4] + '.json'), parsing_help.build_json(obj))
+            rows.append(corpus_index.parsed_row(xml_doc[:-4] + '.json', obj))
         except IOError:
             pass
+    # hand the document's index row & newly computed stems back to the parent process
+    return [xml_doc, rows, stem_cache.drain()]
+
+
+# adds a parsed document to the corpus index and the build manifest. a document that was
+# built before but has no text any more has its old output deleted.
+def add_document(out_dir, xml_doc, rows, sha, entry):
+    if len(rows) > 0:
+        corpus_index.write_rows(out_dir, rows)
+        build_manifest.add(out_dir, parser_name, xml_doc, rows[0][0][0], sha, parser_version, entry)
+        return 1
+    if entry is not None:
+        build_manifest.remove(out_dir, parser_name, xml_doc, entry)
+    return 0
 
 
 def main():
@@ -284,6 +303,14 @@ def main():
     parser.add_argument("-i", metavar='in-directory', action="store", help="input directory argument")
     parser.add_argument("-o", help="output directory argument", action="store")
     parser.add_argument("-csv", help="csv file with publication dates", action="store")
+    parser.add_argument("-binary", help="convert the output to the compact binary corpus format", action="store_true")
+    parser.add_argument("-stem_cache", help="path to stem cache file, loaded if present and saved after the run",
+                        action="store")
+    parser.add_argument("-incremental", help="only parse documents that are new or changed since the last build, "
+                                             "and delete the output of documents that are gone", action="store_true")
+    parser.add_argument("-workers", help="number of processes to parse documents with, defaults to the number of "
+                                         "cores", action="store")
+    parser.add_argument("-chunksize", help="number of documents handed to a worker at a time", action="store")
 
     try:
         args = parser.parse_args()
@@ -297,7 +324,16 @@ def main():
     if args.csv is None:
         common.fail("Please specify csv (-csv) directory.")
 
+    # the output directory is shared with the HathiTrust half of the corpus, which clears it
+    common.build_out(args.o, keep=True)
+    build_manifest.remove_partial(args.o)
+    entries = build_manifest.load(args.o, parser_name) if args.incremental else {}
+    refs = get_pub_dates(args.csv)
+
     thread_files = []
+    hashes = {}
+    listed = set()
+    unchanged = 0
 
     # Grabs each XML file and does all the methods above to it, and builds up the
     # various fields for the JSON file in the process. At the end, it builds the JSON
@@ -305,12 +341,53 @@ def main():
     for subdir, dirs, files in os.walk(args.i):
         for xmldoc in files:
             if xmldoc[0] != ".":
-                thread_files.append((xmldoc, args.i, args.o, args.csv))
-
-    pool = Pool()
-    pool.starmap(parse_threaded, thread_files)
-    pool.close()
-    pool.join()
+                listed.add(xmldoc)
+                # a document's output depends on its file and its publication date
+                sha = build_manifest.fingerprint([os.path.join(args.i, xmldoc)], [refs.get(xmldoc)])
+                if args.incremental and build_manifest.is_current(args.o, entries.get(xmldoc), xmldoc[:-4] + '.json',
+                                                                  sha, parser_version):
+                    unchanged += 1
+                    continue
+                thread_files.append(xmldoc)
+                hashes[xmldoc] = sha
+
+    for xmldoc in sorted(entries):
+        if xmldoc not in listed:
+            build_manifest.remove(args.o, parser_name, xmldoc, entries[xmldoc])
+            print("Removed {0}, {1} is gone.".format(entries[xmldoc]["output"], xmldoc))
+
+    # workers share the stem table loaded here rather than each building their own
+    stem_cache.load(args.stem_cache)
+    workers = int(args.workers) if args.workers is not None else os.cpu_count()
+    chunksize = int(args.chunksize) if args.chunksize is not None else common.chunk_size(len(thread_files), workers)
+    start = time.time()
+    pool = None
+    if workers <= 1:
+        init_worker(refs, args.i, args.o)
+        results = map(parse_threaded, thread_files)
+    else:
+        pool = Pool(workers, initializer=init_worker,
+                    initargs=(refs, args.i, args.o, stem_cache.cache.snapshot()))
+        # documents are written by the workers, so they can be collected in any order
+        results = pool.imap_unordered(parse_threaded, thread_files, chunksize)
+    parsed_docs = 0
+    for xmldoc, rows, stems in tqdm.tqdm(results, total=len(thread_files)):
+        stem_cache.merge(stems)
+        parsed_docs += add_document(args.o, xmldoc, rows, hashes[xmldoc], entries.get(xmldoc))
+    if pool is not None:
+        pool.close()
+        pool.join()
+    build_manifest.compact(args.o)
+    elapsed = time.time() - start
+    print("Parsed {0} documents in {1:.2f}s ({2:.1f} documents/s)."
+          .format(str(parsed_docs), elapsed, len(thread_files) / elapsed if elapsed > 0 else 0))
+    if args.incremental:
+        print("{0} documents unchanged since the last build.".format(str(unchanged)))
+    if args.binary:
+        corpus_format.pack_corpus(args.o)
+
+    stem_cache.save(args.stem_cache)
+    print(stem_cache.cache.stats())
 
 if __name__ == '__main__':
     main()
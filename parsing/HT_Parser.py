@@ -1,18 +1,51 @@
-import argparse, csv, os, shutil, zipfile
-import xml.etree.ElementTree as ET
+import argparse, csv, os, re, time, zipfile
+from collections import deque
+from multiprocessing import Pool
+import nlp_scripts.build_manifest as build_manifest
 import nlp_scripts.common as common
+import nlp_scripts.corpus_format as corpus_format
+import nlp_scripts.corpus_index as corpus_index
+import nlp_scripts.normalize as normalize
 import nlp_scripts.parsed as parsed
 import nlp_scripts.parsing_help as parsing_help
+import nlp_scripts.stem_cache as stem_cache
+import nlp_scripts.xml_stream as xml_stream
 
-def scan_for_htid(root):
-    if "objectIdentifierValue" in root.tag:
-        htid = root.text
-        return htid
-    else:
-        for child in root:
-            htid = scan_for_htid(child)
-            if htid is not None:
-                return htid
+
+# recorded in the build manifest along with each volume, bump the version whenever a change here
+# (or in the normalization) changes the output so that incremental builds parse everything again
+parser_name = "HT_Parser"
+parser_version = 1
+
+
+# picks out objectIdentifierValue elements (but not ones nested in another)
+def is_htid(tags):
+    return xml_stream.first_match(tags, ["objectIdentifierValue"]) == len(tags) - 1
+
+
+# streams a METS file up to its first objectIdentifierValue with any text, the rest of the
+# file is never parsed
+def scan_for_htid(xml):
+    for elem, found in xml_stream.select(xml, is_htid):
+        if elem.text is not None:
+            return elem.text
+
+
+# sort key for page files, comparing the numbers in their names by value
+def page_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split("([0-9]+)", name)]
+
+
+# reads the pages of a volume's zip file in page order, one at a time, through a single
+# normalize.TextStream so that sentences running over a page break stay whole. returns
+# the offset of each page in the volume's full text.
+def read_pages(zf, obj, language):
+    stream = normalize.TextStream(obj, language)
+    for txt_file in sorted(zf.namelist(), key=page_key):
+        if txt_file[-4:] == ".txt":
+            with zf.open(txt_file) as page:
+                stream.add(page.read().decode('utf-8'))
+    return stream.finish()
 
 
 def build_htids(csvfile):
@@ -34,9 +67,7 @@ def build_htids(csvfile):
 def test_file_htid(htids, folder, xml_file):
     # concatenate folder & file with f slash btwn (filepath to xml)
     xml = folder + "/" + xml_file
-    tree = ET.parse(xml)
-    root = tree.getroot()
-    htid = scan_for_htid(root)
+    htid = scan_for_htid(xml)
     htid = htid.replace("/", "=")
     htid= htid.replace(":", "+")
     if htid in htids:
@@ -45,33 +76,205 @@ def test_file_htid(htids, folder, xml_file):
         return [False, htid]
 
 
-def parse_files(in_dir, out_dir, htids, language):
+# finds [folder, files, xml file] for each xml file in the leaf folders of the pairtree
+def list_volumes(in_dir):
+    volumes = []
     for folder, subfolders, files in os.walk(in_dir):
         if not subfolders:
             for xml_file in files:
                 if xml_file[-4:] == ".xml":
-                    htid_test = test_file_htid(htids, folder, xml_file)
-                    # test if htid in set of htids, store it and build file if true
-                    if htid_test[0]:
-                        htid = htid_test[1]
-                        obj = parsed.Parsed()
-                        # replace periods for file-naming
-                        obj.h = htid.replace(".", "_")
-                        try:
-                            obj.a = htids[htid][0]
-                            obj.t = htids[htid][1]
-                            obj.y = htids[htid][2]
-                        except KeyError:
-                            print("File with HTID {0} not found in CSV reference file.".format(htid))
-                        for zip_file in files:
-                            if zip_file[-4:] == ".zip":
-                                with zipfile.ZipFile(folder + "/" + zip_file, 'r') as zf:
-                                    for txt_file in zf.namelist():
-                                        if txt_file[-4:] == ".txt":
-                                            text = zf.read(txt_file).decode('utf-8')
-                                            parsing_help.add_content(text, obj, language)
-                            with open(out_dir + str(obj.h) + ".json", 'w', encoding='utf-8') as out:
-                                out.write(parsing_help.build_json(obj))
+                    volumes.append([folder, files, xml_file])
+    return volumes
+
+
+# location of a volume in the pairtree (relative to the root of the HathiTrust tree), from its
+# HTID as written in the CSV files, i.e. with ':' and '/' already replaced by '+' and '='. e.g.
+# aeu.ark+=13960=t05x2zb2f -> aeu/pairtree_root/ar/k+/=1/39/60/=t/05/x2/zb/2f/ark+=13960=t05x2zb2f
+def pairtree_path(htid):
+    namespace, volume_id = htid.split(".", 1)
+    volume_id = volume_id.replace("+", ":").replace("=", "/")
+    # pairtree cleaning: hex-encode special / non visible ascii characters, then swap the rest
+    clean = ""
+    for b in volume_id.encode('utf-8'):
+        if chr(b) in '"*+,<=>?\\^|' or b <= 0x20 or b > 0x7e:
+            clean += "^{0:02x}".format(b)
+        else:
+            clean += chr(b)
+    clean = clean.replace("/", "=").replace(":", "+").replace(".", ",")
+    pairs = [clean[i:i + 2] for i in range(0, len(clean), 2)]
+    return "/".join([namespace, "pairtree_root"] + pairs + [clean])
+
+
+# reads a path list (see ht_path_lists), one pairtree path per line. the lists repeat some
+# volumes, only the first line for each path is kept.
+def read_path_list(path_file):
+    with open(path_file, 'r', encoding='utf-8-sig') as paths_in:
+        return unique_paths(line.strip() for line in paths_in if line.strip() != "")
+
+
+# drops repeated paths, keeping the order they're listed in
+def unique_paths(paths):
+    return list(dict.fromkeys(paths))
+
+
+# same as list_volumes, but only looks in the given pairtree paths rather than walking the whole tree.
+# each volume is listed once, however many times its path is given.
+def list_listed_volumes(in_dir, paths):
+    volumes = []
+    for path in unique_paths(paths):
+        folder = in_dir + "/" + path
+        if not os.path.isdir(folder):
+            print("Volume {0} not found in {1}.".format(path, in_dir))
+            continue
+        files = os.listdir(folder)
+        for xml_file in files:
+            if xml_file[-4:] == ".xml":
+                volumes.append([folder, files, xml_file])
+    return volumes
+
+
+# hash of everything a volume's json is built from: its METS & zip files, its row in the CSV and the language
+def volume_hash(folder, files, xml_file, row, language):
+    paths = [folder + "/" + xml_file] + [folder + "/" + f for f in sorted(files) if f[-4:] == ".zip"]
+    return build_manifest.fingerprint(paths, [row, language])
+
+
+# tests a volume's HTID and, if it's in the CSV, parses its text and writes its json file (once, after
+# all of its zip files are read). returns [index rows, timings, hash], timings being [htid, seconds
+# testing, seconds parsing, seconds writing]. the hash is None if the volume isn't in the CSV. with
+# incremental set, a volume whose build manifest entry shows it hasn't changed isn't parsed again,
+# and comes back without index rows.
+def parse_volume(folder, files, xml_file, htids, out_dir, language, entry=None, incremental=False):
+    start = time.time()
+    htid_test = test_file_htid(htids, folder, xml_file)
+    timings = [htid_test[1], 0, 0, 0]
+    rows = []
+    sha = None
+    # test if htid in set of htids, store it and build file if true
+    if htid_test[0]:
+        htid = htid_test[1]
+        sha = volume_hash(folder, files, xml_file, htids[htid], language)
+        timings[1] = time.time() - start
+        if incremental and build_manifest.is_current(out_dir, entry, htid.replace(".", "_") + ".json", sha,
+                                                     parser_version):
+            return [rows, timings, sha]
+        obj = parsed.Parsed()
+        # replace periods for file-naming
+        obj.h = htid.replace(".", "_")
+        try:
+            obj.a = htids[htid][0]
+            obj.t = htids[htid][1]
+            obj.y = htids[htid][2]
+        except KeyError:
+            print("File with HTID {0} not found in CSV reference file.".format(htid))
+        start = time.time()
+        for zip_file in sorted(files):
+            if zip_file[-4:] == ".zip":
+                with zipfile.ZipFile(folder + "/" + zip_file, 'r') as zf:
+                    obj.pg.extend(read_pages(zf, obj, language))
+        timings[2] = time.time() - start
+        start = time.time()
+        build_manifest.write_atomic(os.path.join(out_dir, str(obj.h) + ".json"), parsing_help.build_json(obj))
+        rows.append(corpus_index.parsed_row(str(obj.h) + ".json", obj))
+        timings[3] = time.time() - start
+    else:
+        timings[1] = time.time() - start
+    return [rows, timings, sha]
+
+
+# once a volume's json file is written, adds it to the corpus index and the build manifest and
+# reports its timings. a volume that was built before but isn't in the CSV any more has its old
+# output deleted. counts holds the number of volumes [parsed, unchanged] so far.
+def add_volume(out_dir, path, result, entry, counts):
+    rows, timings, sha = result[0], result[1], result[2]
+    if sha is None:
+        if entry is not None:
+            build_manifest.remove(out_dir, parser_name, path, entry)
+        return
+    if len(rows) == 0:
+        counts[1] += 1
+        return
+    corpus_index.write_rows(out_dir, rows)
+    build_manifest.add(out_dir, parser_name, path, rows[0][0][0], sha, parser_version, entry)
+    print("{0}: {1:.2f}s testing HTID, {2:.2f}s parsing, {3:.2f}s writing"
+          .format(timings[0], timings[1], timings[2], timings[3]))
+    counts[0] += 1
+
+
+# Pool initializer, hands each worker the settings parse_volume needs along with the
+# stem table prebuilt by the parent
+def init_worker(htid_table, out, lang, incremental_build, stems):
+    global htids, out_dir, language, incremental
+    htids, out_dir, language, incremental = htid_table, out, lang, incremental_build
+    stem_cache.init_worker(stems)
+
+
+def parse_task(folder, files, xml_file, entry):
+    result = parse_volume(folder, files, xml_file, htids, out_dir, language, entry, incremental)
+    # hand the newly computed stems back to the parent process as well
+    result.append(stem_cache.drain())
+    return result
+
+
+# path of a volume's folder within the HathiTrust tree, as recorded in the build manifest
+def volume_path(in_dir, volume):
+    return os.path.relpath(volume[0], in_dir).replace(os.sep, "/")
+
+
+# parses every volume (as listed by list_volumes / list_listed_volumes) whose HTID is in the
+# CSV. entries are the build manifest entries of an earlier build into out_dir, if any. when
+# resuming, volumes in the manifest are skipped outright. with incremental set, volumes are
+# only parsed if they changed since they were built, and the output of volumes that are no
+# longer listed is deleted. with more than one worker, volumes are handed to a process pool,
+# at most two per worker at a time. results are collected in the order the volumes are listed,
+# so the output is the same as a serial run.
+def parse_files(volumes, in_dir, out_dir, htids, language, workers=1, entries=None, incremental=False):
+    if entries is None:
+        entries = {}
+    if incremental:
+        listed = set(volume_path(in_dir, v) for v in volumes)
+        for path in sorted(entries):
+            if path not in listed:
+                build_manifest.remove(out_dir, parser_name, path, entries[path])
+                print("Removed {0}, volume {1} is gone.".format(entries[path]["output"], path))
+    elif len(entries) > 0:
+        listed = len(volumes)
+        volumes = [v for v in volumes if volume_path(in_dir, v) not in entries
+                   or not build_manifest.output_exists(out_dir, entries[volume_path(in_dir, v)]["output"])]
+        print("Skipping {0} volumes already built.".format(str(listed - len(volumes))))
+    start = time.time()
+    # volumes [parsed, unchanged]
+    counts = [0, 0]
+    if workers <= 1:
+        for volume in volumes:
+            path = volume_path(in_dir, volume)
+            result = parse_volume(volume[0], volume[1], volume[2], htids, out_dir, language, entries.get(path),
+                                  incremental)
+            add_volume(out_dir, path, result, entries.get(path), counts)
+    else:
+        pool = Pool(workers, initializer=init_worker,
+                    initargs=(htids, out_dir, language, incremental, stem_cache.cache.snapshot()))
+        in_flight = deque()
+        for volume in volumes:
+            # once the pool is full, wait on the oldest volume before handing out another
+            if len(in_flight) >= workers * 2:
+                path, task = in_flight.popleft()
+                result = task.get()
+                stem_cache.merge(result[3])
+                add_volume(out_dir, path, result, entries.get(path), counts)
+            path = volume_path(in_dir, volume)
+            in_flight.append([path, pool.apply_async(parse_task, volume + [entries.get(path)])])
+        while len(in_flight) > 0:
+            path, task = in_flight.popleft()
+            result = task.get()
+            stem_cache.merge(result[3])
+            add_volume(out_dir, path, result, entries.get(path), counts)
+        pool.close()
+        pool.join()
+    build_manifest.compact(out_dir)
+    print("Parsed {0} volumes in {1:.2f}s".format(str(counts[0]), time.time() - start))
+    if incremental:
+        print("{0} volumes unchanged since the last build.".format(str(counts[1])))
 
 
 def main():
@@ -80,22 +283,50 @@ def main():
     parser.add_argument("-o", help='output directory', action="store")
     parser.add_argument("-x", help='in-directory for HT files', action="store")
     parser.add_argument("-lang", help='language corpus is in', action="store")
+    parser.add_argument("-binary", help="convert the output to the compact binary corpus format", action="store_true")
+    parser.add_argument("-stem_cache", help='path to stem cache file, loaded if present and saved after the run',
+                        action="store")
+    parser.add_argument("-workers", help='number of processes to parse volumes with', action="store", default=1)
+    parser.add_argument("-paths", help='path list of the volumes to parse (see ht_path_lists), rather than '
+                                       'searching the whole in-directory', action="store")
+    parser.add_argument("-from_csv", help='only parse the volumes whose HTIDs are in the CSV file, located '
+                                          'from their HTIDs rather than by searching the whole in-directory',
+                        action="store_true")
+    parser.add_argument("-resume", help='keep the output directory and skip the volumes an earlier (stopped) '
+                                        'build already wrote', action="store_true")
+    parser.add_argument("-incremental", help='keep the output directory, only parse volumes that are new or '
+                                             'changed since the last build and delete the output of volumes '
+                                             'that are gone', action="store_true")
 
     try:
         args = parser.parse_args()
     except IOError:
         pass
 
-    if not os.path.exists(args.o):
-        os.mkdir(args.o)
-    else:
-        shutil.rmtree(args.o)
-        os.mkdir(args.o)
+    keep = args.resume or args.incremental
+    common.build_out(args.o, keep)
+    entries = None
+    if keep:
+        build_manifest.remove_partial(args.o)
+        entries = build_manifest.load(args.o, parser_name)
 
     language = args.lang.lower()
     htids = build_htids(args.csv)
+    stem_cache.load(args.stem_cache)
+
+    # with a path list (or the CSV's HTIDs), only the listed volumes are opened
+    if args.paths is not None:
+        volumes = list_listed_volumes(args.x, read_path_list(args.paths))
+    elif args.from_csv:
+        volumes = list_listed_volumes(args.x, [pairtree_path(htid) for htid in htids])
+    else:
+        volumes = list_volumes(args.x)
+    parse_files(volumes, args.x, args.o, htids, language, int(args.workers), entries, args.incremental)
+    if args.binary:
+        corpus_format.pack_corpus(args.o)
 
-    parse_files(args.x, args.o, htids, language)
+    stem_cache.save(args.stem_cache)
+    print(stem_cache.cache.stats())
 
 
 if __name__ == '__main__':
@@ -1,48 +1,18 @@
-import argparse, os, csv, tqdm
-import xml.etree.ElementTree as ET
-from nlp_scripts import parsing_help, parsed, common
+import argparse, os, time, tqdm
+from multiprocessing import Pool
+from nlp_scripts import parsing_help, parsed, common, corpus_format, corpus_index, metadata_join, xml_stream
 
 
-def get_text(root, file):
-    for child in root:
-        if 'body' in child.tag:
-            for children in child:
-                if children.tag == "{http://www.tei-c.org/ns/1.0}p" or \
-                                children.tag == "{http://www.tei-c.org/ns/1.0}lg" or \
-                                children.tag == "{http://www.tei-c.org/ns/1.0}head":
-                    parsing_help.add_xml_content(children, file, 'german')
-                    for more_children in children:
-                        parsing_help.add_xml_content(more_children, file, 'german')
-                        for even_more_children in more_children:
-                            parsing_help.add_xml_content(even_more_children, file, 'german')
-                            for wow_more_children in even_more_children:
-                                parsing_help.add_xml_content(wow_more_children, file, 'german')
-                                for much_more_children in wow_more_children:
-                                    parsing_help.add_xml_content(much_more_children, file, 'german')
-                elif 'div' in children.tag:
-                    for more_children in children:
-                        if more_children.tag == "{http://www.tei-c.org/ns/1.0}p" or \
-                                        more_children.tag == "{http://www.tei-c.org/ns/1.0}lg" or \
-                                        more_children.tag == "{http://www.tei-c.org/ns/1.0}head":
-                            parsing_help.add_xml_content(more_children, file, 'german')
-                            for even_more_children in more_children:
-                                parsing_help.add_xml_content(even_more_children, file, 'german')
-                                for wow_more_children in even_more_children:
-                                    parsing_help.add_xml_content(wow_more_children, file, 'german')
-                                    for much_more_children in wow_more_children:
-                                        parsing_help.add_xml_content(much_more_children, file, 'german')
-                        elif 'div' in more_children.tag:
-                            parsing_help.add_xml_content(more_children, file, 'german')
-                            for even_more_children in more_children:
-                                parsing_help.add_xml_content(even_more_children, file, 'german')
-                                for wow_more_children in even_more_children:
-                                    parsing_help.add_xml_content(wow_more_children, file, 'german')
-                                    for much_more_children in wow_more_children:
-                                        parsing_help.add_xml_content(much_more_children, file, 'german')
-                        else:
-                            pass
-        else:
-            get_text(child, file)
+# Each file is read in a single streaming pass (see xml_stream.py): find_elements picks out
+# the text elements & the volume's url id as the file is read.
+
+
+# adds the text of an element and of its children, down to the given number of levels below it
+def get_text(root, file, levels):
+    parsing_help.add_xml_content(root, file, 'german')
+    if levels > 0:
+        for child in root:
+            get_text(child, file, levels - 1)
 
 
 def parse_url(download_url):
@@ -58,41 +28,69 @@ def parse_url(download_url):
     return "/".join(parsed_url)
 
 
-# finds url id of volume. use id to map volume to pub info in csv file
+# finds url id of volume, from the idno element in teiHeader/fileDesc/publicationStmt.
+# use id to map volume to pub info in csv file
 def get_id(root):
     for child in root:
-        if 'teiHeader' in child.tag:
-            for children in child:
-                if 'fileDesc' in children.tag:
-                    for more_children in children:
-                        if 'publicationStmt' in more_children.tag:
-                            for even_more_children in more_children:
-                                if 'idno' in even_more_children.tag:
-                                    for wow_more_children in even_more_children:
-                                        if wow_more_children.get('type') == 'URLXML':
-                                            download_url = wow_more_children.text
-                                            base_url = parse_url(download_url)
-                                            return base_url
-
-
-def parse_csv(csv_in):
-    ids = []
-    with open(csv_in, 'r', encoding='utf-8') as csv_in:
-        read_csv = csv.reader(csv_in, delimiter=',')
-        for row in read_csv:
-            if row[0] != 'source':
-                ids.append((row[0], row[1], row[2], row[3]))
-    return ids
-
-
-def get_pub_info(ids, base_url):
-    for inf in ids:
-        if base_url.strip() == inf[0].strip():
-            author = inf[1]
-            title = inf[2]
-            year = inf[3]
-            return [author, title, year]
-    print(base_url)
+        if child.get('type') == 'URLXML':
+            download_url = child.text
+            base_url = parse_url(download_url)
+            return base_url
+
+
+# Picks out the elements that the text & url id are read from, given the tags of the element
+# that was just opened and of its ancestors (see xml_stream.select). Text comes from p, lg and
+# head elements in the body or in its divs, and from divs nested in those divs.
+def find_elements(tags):
+    depth = len(tags) - 1
+    body = xml_stream.first_match(tags, ['body'], 1)
+    if -1 < body < depth:
+        below = tags[body + 1:]
+        text_tags = ["{http://www.tei-c.org/ns/1.0}p", "{http://www.tei-c.org/ns/1.0}lg",
+                     "{http://www.tei-c.org/ns/1.0}head"]
+        if len(below) == 1 and below[0] in text_tags:
+            return ["paragraph"]
+        if len(below) == 2 and 'div' in below[0] and (below[1] in text_tags or 'div' in below[1]):
+            return ["division"]
+    if depth == 4:
+        for i, name in enumerate(['teiHeader', 'fileDesc', 'publicationStmt', 'idno']):
+            if name not in tags[i + 1]:
+                return []
+        return ["id"]
+    return []
+
+
+# Pool initializer, gives each worker the metadata table (read from the csv file once, by the
+# parent) and directories
+def init_worker(table, in_dir, out_dir):
+    global pub_info, input_dir, output_dir
+    pub_info, input_dir, output_dir = table, in_dir, out_dir
+
+
+# parses a single TEI file and writes its json file, if it has any text. returns its index rows.
+def parse_document(xmldoc):
+    base_url = None
+    obj = parsed.Parsed()
+    for element, kinds in xml_stream.select(input_dir + xmldoc, find_elements):
+        if kinds[0] == "paragraph":
+            get_text(element, obj, 4)
+        if kinds[0] == "division":
+            get_text(element, obj, 3)
+        # only the first url counts
+        if kinds[0] == "id" and base_url is None:
+            base_url = get_id(element)
+    rows = []
+    if len(obj.c) > 0:
+        info = pub_info.lookup(base_url)
+        if info is None:
+            print("No publication info for {0} ({1}).".format(xmldoc, str(base_url)))
+        else:
+            obj.a, obj.t, obj.y = info[0], info[1], info[2]
+        with open(output_dir + xmldoc[:-4] + '.json', 'w', encoding='utf-8') as out:
+            out.write(parsing_help.build_json(obj))
+            out.close()
+        rows.append(corpus_index.parsed_row(xmldoc[:-4] + '.json', obj))
+    return rows
 
 
 def main():
@@ -100,6 +98,10 @@ def main():
     parser.add_argument("-i", metavar='in-directory', action="store", help="input directory argument")
     parser.add_argument("-o", help="output directory argument", action="store")
     parser.add_argument("-csv", help="csv file with publication dates", action="store")
+    parser.add_argument("-binary", help="convert the output to the compact binary corpus format", action="store_true")
+    parser.add_argument("-workers", help="number of processes to parse documents with, 1 (the default) parses "
+                                         "them in this process", action="store", default=1)
+    parser.add_argument("-chunksize", help="number of documents handed to a worker at a time", action="store")
 
     try:
         args = parser.parse_args()
@@ -109,25 +111,39 @@ def main():
     common.build_out(args.o)
 
     if args.csv is not None:
-        ids = parse_csv(args.csv)
+        table = metadata_join.MetadataTable(args.csv, metadata_join.normalize_url)
     else:
         common.fail("Please specify input csv file path")
 
+    xmldocs = []
     for subdir, dirs, files in os.walk(args.i):
-        for xmldoc in tqdm.tqdm(files):
+        for xmldoc in files:
             if xmldoc[0] != ".":
-                tree = ET.parse(args.i + xmldoc)
-                root = tree.getroot()
-                base_url = get_id(root)
-                obj = parsed.Parsed()
-                get_text(root, obj)
-                if len(obj.c) > 0:
-                    pub_info = get_pub_info(ids, base_url)
-                    obj.a, obj.t, obj.y = pub_info[0], pub_info[1], pub_info[2]
-                    with open(args.o + xmldoc[:-4] + '.json', 'w', encoding='utf-8') as out:
-                        out.write(parsing_help.build_json(obj))
-                        out.close()
+                xmldocs.append(xmldoc)
+
+    workers = int(args.workers)
+    start = time.time()
+    rows = []
+    if workers <= 1:
+        init_worker(table, args.i, args.o)
+        for xmldoc in tqdm.tqdm(xmldocs):
+            rows.extend(parse_document(xmldoc))
+    else:
+        chunksize = int(args.chunksize) if args.chunksize is not None else common.chunk_size(len(xmldocs), workers)
+        pool = Pool(workers, initializer=init_worker, initargs=(table, args.i, args.o))
+        # documents are written by the workers, so they can be collected in any order
+        for result in tqdm.tqdm(pool.imap_unordered(parse_document, xmldocs, chunksize), total=len(xmldocs)):
+            rows.extend(result)
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start
+    print("Parsed {0} documents in {1:.2f}s ({2:.1f} documents/s)."
+          .format(str(len(rows)), elapsed, len(xmldocs) / elapsed if elapsed > 0 else 0))
+
+    corpus_index.write_rows(args.o, rows)
+    if args.binary:
+        corpus_format.pack_corpus(args.o)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
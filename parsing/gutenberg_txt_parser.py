@@ -1,5 +1,5 @@
-import csv, os, argparse, tqdm
-from nlp_scripts import parsing_help, parsed, common
+import os, argparse, tqdm
+from nlp_scripts import parsing_help, parsed, common, corpus_format, corpus_index, metadata_join
 
 
 def parse_link(src):
@@ -8,33 +8,15 @@ def parse_link(src):
     return idno
 
 
-def parse_csv(csv_in):
-    ids = []
-    with open(csv_in, 'r', encoding='utf-8') as csv_in:
-        read_csv = csv.reader(csv_in, delimiter=',')
-        for row in read_csv:
-            if row[0] != 'source':
-                src = row[0]
-                idno = parse_link(src)
-                ids.append((idno, row[1], row[2], row[3]))
-    return ids
-
-
+# ebook number from the posting date line, e.g. "[EBook #1234]", matched on its digits
 def get_idno(line):
     elems = line.split()
     elem = elems[-1]
-    idno = elem[-5:-1]
-    return idno
-
-
-def match_pub_info(idno, ids):
-    for tup in ids:
-        if tup[0] == idno:
-            return tup
-    common.fail("Could not match idno for {0}".format(str(idno)))
+    return elem
 
 
 def parse_txt(in_dir, ids, out_dir):
+    rows = []
     for subdir, dirs, files in os.walk(in_dir):
         for txt_f in tqdm.tqdm(files):
             if txt_f[0] != ".":
@@ -44,8 +26,8 @@ def parse_txt(in_dir, ids, out_dir):
                     for line in txt_in:
                         if 'Posting Date' in line:
                             idno = get_idno(line)
-                            pub_info = match_pub_info(idno, ids)
-                            obj.a, obj.t, obj.y = pub_info[1], pub_info[2], pub_info[3]
+                            pub_info = metadata_join.require(ids, idno)
+                            obj.a, obj.t, obj.y = pub_info[0], pub_info[1], pub_info[2]
                         if 'START OF THIS PROJECT GUTENBERG EBOOK' in line:
                             reading = True
                         if 'END OF THIS PROJECT GUTENBERG EBOOK' in line:
@@ -55,6 +37,8 @@ def parse_txt(in_dir, ids, out_dir):
                 with open(out_dir + txt_f[:-4] + '.json', 'w', encoding='utf-8') as out:
                     out.write(parsing_help.build_json(obj))
                     out.close()
+                rows.append(corpus_index.parsed_row(txt_f[:-4] + '.json', obj))
+    return rows
 
 
 def main():
@@ -62,6 +46,7 @@ def main():
     parser.add_argument("-i", metavar='in-directory', action="store", help="input directory argument")
     parser.add_argument("-o", help="output directory argument", action="store")
     parser.add_argument("-csv", help="csv file with publication dates", action="store")
+    parser.add_argument("-binary", help="convert the output to the compact binary corpus format", action="store_true")
 
     try:
         args = parser.parse_args()
@@ -71,11 +56,14 @@ def main():
     common.build_out(args.o)
 
     if args.csv is not None:
-        ids = parse_csv(args.csv)
+        ids = metadata_join.MetadataTable(args.csv, metadata_join.normalize_idno, parse_link)
     else:
         common.fail("Please specify input csv file path")
 
-    parse_txt(args.i, ids, args.o)
+    rows = parse_txt(args.i, ids, args.o)
+    corpus_index.write_rows(args.o, rows)
+    if args.binary:
+        corpus_format.pack_corpus(args.o)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file